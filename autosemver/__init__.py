@@ -26,35 +26,162 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 import argparse
 import copy
+import datetime
+import os
 import sys
 import warnings
-from distutils.dist import Distribution, DistributionMetadata
-from typing import Any, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
+from . import profiling
 from .api import (
+    get_author_stats,
     get_authors,
     get_changelog,
     get_current_version,
     get_releasenotes,
+    get_releasenotes_section,
+    get_subproject_versions,
+    get_version_commits,
+    get_version_of,
+    get_versions,
+    read_path_map,
+    sync_notes,
     tag_versions,
 )
-from .git import _to_str
+from .git import BACKEND_ENV_VAR, BACKENDS, _to_str
 from .packaging import (
+    build_stamp_lock,
     create_authors,
     create_changelog,
     create_releasenotes,
+    create_version_module,
     get_current_version as pkg_version,
+    load_build_stamp,
+    save_build_stamp,
 )
+from .schemes import SCHEMES, SEMVER
+
+if TYPE_CHECKING:
+    from setuptools.dist import Distribution
+
+#: the distutils module is gone since python 3.12, setuptools keeps the same
+#: metadata object
+DistributionMetadata = Any
 
 PROJECT_NAME = "python-autosemver"
 
 
+def _add_rev_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--rev",
+        default=None,
+        help=(
+            "Branch, tag or commit to use instead of HEAD, does not need to "
+            "be checked out."
+        ),
+    )
+
+
+def _print_versions(
+    repo_path: str,
+    revs: List[str],
+    with_changelog: bool = False,
+    path_map: Optional[str] = None,
+) -> str:
+    if path_map is None:
+        versions = get_versions(
+            repo_path=repo_path, revs=revs or None, with_changelog=with_changelog
+        )
+    elif len(revs) > 1:
+        raise ValueError("Only one revision can be passed with --path-map")
+    else:
+        versions = get_subproject_versions(
+            repo_path=repo_path,
+            path_map=read_path_map(path_map),
+            rev=revs[0] if revs else None,
+            with_changelog=with_changelog,
+        )
+
+    lines = []
+    for name, (version, changelog) in versions.items():
+        lines.append("%s %s" % (name, version))
+        if changelog:
+            lines.append(changelog)
+
+    return "\n".join(lines)
+
+
+def _print_releasenotes(
+    repo_path: str,
+    from_commit: Optional[str] = None,
+    rev: Optional[str] = None,
+    version: Optional[str] = None,
+) -> str:
+    if version is None:
+        return get_releasenotes(repo_path=repo_path, from_commit=from_commit, rev=rev)
+    elif from_commit is not None:
+        raise ValueError("--from-commit can't be passed with --version")
+
+    return get_releasenotes_section(repo_path=repo_path, version=version, rev=rev)
+
+
+def _print_authors(
+    repo_path: str,
+    from_commit: Optional[str] = None,
+    rev: Optional[str] = None,
+    mailmap: bool = True,
+    stats: bool = False,
+) -> str:
+    if not stats:
+        return "\n".join(get_authors(repo_path, from_commit, rev, mailmap))
+
+    lines = []
+    for author, (commits, first_seen, last_seen) in sorted(
+        get_author_stats(repo_path, from_commit, rev, mailmap).items()
+    ):
+        lines.append(
+            "%d %s %s %s"
+            % (
+                commits,
+                datetime.datetime.fromtimestamp(
+                    first_seen, datetime.timezone.utc
+                ).date(),
+                datetime.datetime.fromtimestamp(
+                    last_seen, datetime.timezone.utc
+                ).date(),
+                author,
+            )
+        )
+
+    return "\n".join(lines)
+
+
 def main(args: Optional[List[str]] = None) -> None:
     if args is None:
         args = sys.argv[1:]
 
     parser = argparse.ArgumentParser()
     parser.add_argument("repo_path", help="Git repo to generate the changelog for.")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="If set, will print the time spent on each step to stderr.",
+    )
+    parser.add_argument(
+        "--profile-format",
+        default="table",
+        choices=["table", "json"],
+        help="Format for the --profile output.",
+    )
+    parser.add_argument(
+        "--backend",
+        default=None,
+        choices=sorted(BACKENDS),
+        help=(
+            "Backend to read the git history with, defaults to the "
+            "%s environment variable, or dulwich if not set." % BACKEND_ENV_VAR
+        ),
+    )
     subparsers = parser.add_subparsers()
     changelog_parser = subparsers.add_parser("changelog")
     changelog_parser.add_argument(
@@ -67,33 +194,179 @@ def main(args: Optional[List[str]] = None) -> None:
         action="store_true",
         help="If set, the changelog will be rpm friendly.",
     )
+    _add_rev_argument(changelog_parser)
     changelog_parser.set_defaults(
         func=lambda *args, **kwargs: get_changelog(*args, **kwargs).strip()
     )
     version_parser = subparsers.add_parser("version")
+    version_parser.add_argument(
+        "--dirty",
+        action="store_true",
+        help=(
+            "If set, will append +dirty.<hash> to the version when there are "
+            "uncommitted changes."
+        ),
+    )
+    version_parser.add_argument(
+        "--scheme",
+        choices=SCHEMES,
+        default=SEMVER,
+        help="Versioning scheme to use for the commits that are not tagged.",
+    )
+    version_parser.add_argument(
+        "--path",
+        dest="paths",
+        action="append",
+        default=None,
+        help=(
+            "If passed, will only count the commits that changed something "
+            "under that path of the repo, can be passed more than once."
+        ),
+    )
+    _add_rev_argument(version_parser)
     version_parser.set_defaults(func=get_current_version)
+    version_of_parser = subparsers.add_parser("version-of")
+    version_of_parser.add_argument(
+        "rev", help="Commit, tag or branch to get the version of."
+    )
+    version_of_parser.add_argument(
+        "--no-persist",
+        dest="persist",
+        action="store_false",
+        help="If set, will not reuse nor save the version index in the repo.",
+    )
+    version_of_parser.set_defaults(func=get_version_of)
+    commits_of_parser = subparsers.add_parser("commits-of")
+    commits_of_parser.add_argument(
+        "version",
+        help=(
+            "Version (ex. 4.12.3, or 4.12 for all the 4.12.x) or range of "
+            "versions (ex. 4.12.1..4.13) to get the commits for."
+        ),
+    )
+    commits_of_parser.add_argument(
+        "--no-persist",
+        dest="persist",
+        action="store_false",
+        help="If set, will not reuse nor save the version index in the repo.",
+    )
+    commits_of_parser.set_defaults(
+        func=lambda *args, **kwargs: "\n".join(
+            "%s %s" % (version, commit_sha)
+            + "".join("\n    %s" % child_sha for child_sha in children)
+            for commit_sha, version, children in get_version_commits(*args, **kwargs)
+        )
+    )
+    versions_parser = subparsers.add_parser("versions")
+    versions_parser.add_argument(
+        "revs",
+        nargs="*",
+        help="Branches, tags or commits to get the versions of, all the "
+        "local branches if none passed.",
+    )
+    versions_parser.add_argument(
+        "--with-changelog",
+        action="store_true",
+        help=(
+            "If set, will print after each version the changelog of the "
+            "commits that are not in the history of the other ones, or of "
+            "all the commits of each subproject with --path-map."
+        ),
+    )
+    versions_parser.add_argument(
+        "--path-map",
+        default=None,
+        help=(
+            "Toml file with the paths of each subproject of the repo, to get "
+            "the version of each of them instead, for the given revision "
+            "(HEAD if none passed)."
+        ),
+    )
+    versions_parser.set_defaults(func=_print_versions)
     releasenotes_parser = subparsers.add_parser("releasenotes")
     releasenotes_parser.add_argument(
         "--from-commit",
         default=None,
         help="Commit to start the release notes from.",
     )
-    releasenotes_parser.set_defaults(func=get_releasenotes)
+    releasenotes_parser.add_argument(
+        "--version",
+        default=None,
+        help=(
+            "If passed, will only print the section for that version (ex. 4, "
+            "or 4.12 for all the 4.12.x) or range of versions (ex. "
+            "4.12.1..4.13)."
+        ),
+    )
+    _add_rev_argument(releasenotes_parser)
+    releasenotes_parser.set_defaults(func=_print_releasenotes)
     authors_parser = subparsers.add_parser("authors")
     authors_parser.add_argument(
         "--from-commit", default=None, help="Commit to start the authors from."
     )
-    authors_parser.set_defaults(
-        func=lambda *args, **kwargs: "\n".join(get_authors(*args, **kwargs))
+    authors_parser.add_argument(
+        "--no-mailmap",
+        dest="mailmap",
+        action="store_false",
+        help="If set, will not canonicalize the authors with the .mailmap file.",
+    )
+    authors_parser.add_argument(
+        "--stats",
+        action="store_true",
+        help=(
+            "If set, will print before each author the number of commits and "
+            "the dates of the first and last of them."
+        ),
     )
+    _add_rev_argument(authors_parser)
+    authors_parser.set_defaults(func=_print_authors)
     tag_parser = subparsers.add_parser("tag")
+    _add_rev_argument(tag_parser)
     tag_parser.set_defaults(func=tag_versions)
+    notes_parser = subparsers.add_parser("notes")
+    notes_subparsers = notes_parser.add_subparsers()
+    notes_sync_parser = notes_subparsers.add_parser(
+        "sync",
+        help=(
+            "Writes the missing notes with the classification of the commits "
+            "under refs/notes/autosemver."
+        ),
+    )
+    _add_rev_argument(notes_sync_parser)
+    notes_sync_parser.set_defaults(
+        func=lambda *args, **kwargs: "%d notes written" % sync_notes(*args, **kwargs)
+    )
     parsed_args = parser.parse_args(args)
 
     params = copy.deepcopy(vars(parsed_args))
     params.pop("func")
+    profile_format = params.pop("profile_format")
+    backend = params.pop("backend")
+    previous_backend = os.environ.get(BACKEND_ENV_VAR)
+    if backend is not None:
+        os.environ[BACKEND_ENV_VAR] = backend
 
-    print(_to_str(parsed_args.func(**params)))
+    profile_enabled = params.pop("profile")
+    if profile_enabled:
+        profiling.enable()
+
+    try:
+        with profiling.span("total"):
+            print(_to_str(parsed_args.func(**params)))
+    finally:
+        profile = profiling.disable() if profile_enabled else None
+        # the backend is only for this run, not the rest of the process
+        if backend is not None:
+            if previous_backend is None:
+                del os.environ[BACKEND_ENV_VAR]
+            else:
+                os.environ[BACKEND_ENV_VAR] = previous_backend
+
+    if profile is not None:
+        if profile_format == "json":
+            sys.stderr.write(profile.to_json() + "\n")
+        else:
+            sys.stderr.write(profile.to_table() + "\n")
 
 
 def distutils_default_case(
@@ -111,6 +384,10 @@ def distutils_autosemver_case(
     with_authors: bool = True,
     with_changelog: bool = True,
     bugtracker_url: Optional[str] = None,
+    version_modules: Optional[List[str]] = None,
+    version_scheme: str = SEMVER,
+    incremental_changelog: bool = False,
+    project_dir: str = os.curdir,
 ) -> DistributionMetadata:
     """
     :param metadata: DistributionMetadata object.
@@ -123,22 +400,101 @@ def distutils_autosemver_case(
     :type with_changelog: bool
     :param bugtracker_url: URL for the bugtracker of the project.
     :type bugtracker_url: str
+    :param version_modules: paths of the version modules to create, see
+        :func:`autosemver.packaging.create_version_module`.
+    :type version_modules: list(str)
+    :param version_scheme: versioning scheme for the commits that are not
+        tagged, see :mod:`autosemver.schemes`.
+    :type version_scheme: str
+    :param incremental_changelog: if true, will only add the entries for the
+        new commits to the changelog file generated by a previous build.
+    :type incremental_changelog: bool
+    :param project_dir: path to the git repo of the project, the files are
+        generated there.
+    :type project_dir: str
     :returns metadata: the updated distutils metadata.
+
+    As setuptools calls this for every build step (egg_info, sdist,
+    bdist_wheel...), the results are stashed in the build dir for the
+    current HEAD, tags and uncommitted changes, and reused while the
+    generated files are still there.
+    Concurrent build steps generate them only once.
     """
-    metadata.version = pkg_version()
-    if with_authors:
-        create_authors()
+    options = {
+        "with_release_notes": with_release_notes,
+        "with_authors": with_authors,
+        "with_changelog": with_changelog,
+        "bugtracker_url": bugtracker_url,
+        "version_modules": version_modules,
+        "version_scheme": version_scheme,
+        "incremental_changelog": incremental_changelog,
+    }
+    # parallel build steps wait for the first one and reuse what it generated
+    with build_stamp_lock(project_dir) as use_stamp:
+        stamped_version = (
+            load_build_stamp(options=options, project_dir=project_dir)
+            if use_stamp
+            else None
+        )
+        if stamped_version is not None:
+            metadata.version = stamped_version
+            return metadata
+
+        metadata.version = pkg_version(
+            project_dir=project_dir, version_scheme=version_scheme
+        )
+        outputs = []
+        if with_authors:
+            create_authors(project_dir=project_dir)
+            outputs.append("AUTHORS")
+
+        if with_release_notes:
+            create_releasenotes(project_dir=project_dir)
+            outputs.append("RELEASE_NOTES")
+
+        if with_changelog:
+            create_changelog(project_dir=project_dir, incremental=incremental_changelog)
+            outputs.append("CHANGELOG")
 
-    if with_release_notes:
-        create_releasenotes()
+        for version_module in version_modules or []:
+            create_version_module(
+                os.path.join(project_dir, version_module),
+                project_dir=project_dir,
+                version_scheme=version_scheme,
+            )
+            outputs.append(version_module)
 
-    if with_changelog:
-        create_changelog()
+        if use_stamp:
+            save_build_stamp(
+                version=metadata.version,
+                options=options,
+                outputs=outputs,
+                project_dir=project_dir,
+            )
 
     return metadata
 
 
-def distutils(dist: Distribution, attr: str, value: Any) -> None:
+def get_version_module_paths(dist: "Distribution") -> List[str]:
+    """
+    Returns the paths of the ``_version.py`` modules for the top level
+    packages of the distribution.
+    """
+    package_dirs: Dict[str, str] = getattr(dist, "package_dir", None) or {}
+    paths = []
+    for package in getattr(dist, "packages", None) or []:
+        if "." in package:
+            continue
+
+        package_path = package_dirs.get(
+            package, os.path.join(package_dirs.get("", ""), package)
+        )
+        paths.append(os.path.join(package_path, "_version.py"))
+
+    return paths
+
+
+def distutils(dist: "Distribution", attr: str, value: Any) -> None:
     if attr != "autosemver":
         dist.metadata = distutils_default_case(
             metadata=dist.metadata,
@@ -152,6 +508,10 @@ def distutils(dist: Distribution, attr: str, value: Any) -> None:
                 "bugtracker_url": getattr(dist, "bugtracker_url", ""),
             }
 
+        value = dict(value)
+        if value.pop("with_version_module", False):
+            value["version_modules"] = get_version_module_paths(dist)
+
         dist.metadata = distutils_autosemver_case(metadata=dist.metadata, **value)
 
     return
@@ -30,9 +30,19 @@
 Script to generate the version, changelog and releasenotes from the git
 repository.
 """
+import os
+from bisect import bisect_left, bisect_right
 from collections import OrderedDict
 from functools import wraps
-from typing import Callable, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    try:
+        import tomli as tomllib  # type: ignore
+    except ImportError:
+        tomllib = None  # type: ignore
 
 WITH_GIT: bool = True
 try:
@@ -42,17 +52,52 @@ except ImportError:
     WITH_GIT = False
 
 
+from .bundle import BundleRepo, ReadOnlyBundleError
 from .git import (  # noqa
+    EXCLUDED,
+    TAGS_LOCK_FILE,
+    AuthorStats,
+    Commit,
+    CommitCache,
+    ExcludeRules,
+    PathFilter,
+    PathRouter,
+    ShallowHistoryError,
+    StaleHistoryError,
+    _tag2tuple,
     _to_str,
     fuzzy_matches_refs,
-    get_children_per_first_parent,
+    get_bugs_from_commit_msg,
+    get_children_per_first_parent_since,
     get_commit_type,
+    get_dirty_hash,
+    get_first_parent_histories,
+    get_head_branch,
+    get_own_commit_type,
     get_refs,
     get_repo_object,
+    get_shallow,
     get_tags,
     get_version,
+    get_version_index_path,
+    get_version_inputs_digest,
+    get_version_range,
+    is_dirty,
+    iter_children_per_first_parent,
+    iter_commit_headers,
+    load_version_index,
+    open_repo,
     pretty_commit,
+    read_exclude_rules,
+    read_mailmap,
+    resolve_rev,
+    save_version_index,
+    split_identity,
 )
+from .locking import file_lock
+from .notes import NOTES_LOCK_FILE, NotesStore
+from .pool import REPO_POOL, RepoHandle, RepoPath, bound_repo
+from .schemes import SEMVER, format_version
 
 
 def _needs_git(func: Callable) -> Callable:
@@ -68,17 +113,158 @@ def _needs_git(func: Callable) -> Callable:
                 "Dulwich library not available, can't extract info from the "
                 "git repos."
             )
-        return func(*args, **kwargs)
+
+        # all the steps of the call share the same repo handle
+        with bound_repo(kwargs["repo_path"] if "repo_path" in kwargs else args[0]):
+            return func(*args, **kwargs)
 
     return myfunc
 
 
+def _iter_versions(
+    repo_path: RepoPath,
+    commits: CommitCache,
+    tags: Dict[str, str],
+    head: Optional[str] = None,
+    since: Optional[Tuple[str, str, Optional[Dict[str, str]]]] = None,
+    paths: Optional[List[str]] = None,
+) -> Iterator[Tuple[str, Commit, List[Commit], Tuple[int, int, int]]]:
+    """
+    Replays the first parent history of head (HEAD if None) from the oldest
+    commit, yielding the sha, the commit, the merged commits and the version
+    of each first parent.
+
+    If since is passed, with the sha, version and tags of a first parent
+    processed before, only the newer first parents are replayed.
+
+    If paths are passed, only the commits that changed something under them
+    are taken into account, see :class:`autosemver.git.PathFilter`.
+    """
+    path_filter = PathFilter(commits, paths) if paths is not None else None
+    version = (0, 0, 0)
+    history: Iterator[Tuple[str, List[Commit]]]
+    if since is None:
+        history = iter_children_per_first_parent(repo_path, commits=commits, head=head)
+    else:
+        base, base_version, base_tags = since
+        version = _tag2tuple(base_version)
+        history = reversed(
+            get_children_per_first_parent_since(
+                repo_path,
+                base=base,
+                commits=commits,
+                head=head,
+                tags=tags,
+                base_tags=base_tags,
+            ).items()
+        )
+
+    for commit_sha, children in history:
+        commit = commits.get(commit_sha)
+        if path_filter is not None:
+            if not path_filter.touches(commit):
+                continue
+
+            children = [child for child in children if path_filter.touches(child)]
+
+        version = get_version(
+            commit=commit,
+            tags=tags,
+            maj_version=version[0],
+            feat_version=version[1],
+            fix_version=version[2],
+            children=children,
+            notes=commits.notes,
+            exclude=commits.exclude,
+        )
+        yield commit_sha, commit, children, version
+
+
+def _get_mainline(
+    repo_path: RepoPath, persist: bool = False, head: Optional[str] = None
+) -> List[Tuple[str, str, List[str]]]:
+    """
+    Returns the sha, version and merged commits shas of each first parent of
+    head (HEAD if None), from the oldest, optionally reusing and saving them
+    in the git directory. The saved ones are only reused for the same head
+    and inputs of the versioning (tags, notes, exclude rules...).
+    """
+    repo = open_repo(repo_path)
+    commits = CommitCache(repo, head=head)
+    head = head or _to_str(repo.head())
+    tags = get_tags(repo)
+    # bundles have no git directory to save it in
+    if not persist or isinstance(repo, BundleRepo):
+        return _compute_mainline(repo_path, head, tags, commits)
+
+    digest = get_version_inputs_digest(repo, tags, commits.exclude)
+    persisted_mainline = load_version_index(repo, head, digest)
+    if persisted_mainline is not None:
+        return persisted_mainline
+
+    # only one process generates it, the others wait for it and reuse it
+    with file_lock(get_version_index_path(repo)):
+        persisted_mainline = load_version_index(repo, head, digest)
+        if persisted_mainline is not None:
+            return persisted_mainline
+
+        mainline = _compute_mainline(repo_path, head, tags, commits)
+        save_version_index(repo, head, digest, mainline)
+
+    return mainline
+
+
+def _compute_mainline(
+    repo_path: RepoPath, head: str, tags: Dict[str, str], commits: CommitCache
+) -> List[Tuple[str, str, List[str]]]:
+    mainline = [
+        (
+            commit_sha,
+            "%s.%s.%s" % version,
+            [child.sha().hexdigest() for child in children],
+        )
+        for commit_sha, _, children, version in _iter_versions(
+            repo_path=repo_path, commits=commits, tags=tags, head=head
+        )
+    ]
+
+    return mainline
+
+
+def _get_tags_for_paths(
+    repo: "dulwich.repo.Repo", paths: Optional[List[str]]
+) -> Dict[str, str]:
+    """
+    Returns the tags to version the given paths with, none if any paths are
+    passed as the tags version the whole repo.
+
+    Raises:
+        ShallowHistoryError: if paths are passed on a shallow clone, as there
+            are no tags nor anchors to start from.
+    """
+    if paths is None:
+        return get_tags(repo)
+
+    if get_shallow(repo):
+        raise ShallowHistoryError(
+            "Versioning some paths needs the whole history, fetch it with "
+            "git fetch --unshallow."
+        )
+
+    return {}
+
+
 @_needs_git
 def get_changelog(
-    repo_path: str,
+    repo_path: RepoPath,
     from_commit: Optional[str] = None,
     bugtracker_url: str = "",
     rpm_format: bool = False,
+    rev: Optional[str] = None,
+    since_commit: Optional[str] = None,
+    since_version: Optional[str] = None,
+    since_tags: Optional[Dict[str, str]] = None,
+    paths: Optional[List[str]] = None,
 ) -> str:
     """
     Given a repo path and an option commit/tag/refspec to start from, will
@@ -90,38 +276,47 @@ def get_changelog(
             refspec, partial refspec) to start the changelog from
         rpm_format(bool): if set, the changelog will be suitable to be uses as
             rpm package changelog.
+        rev(str): branch, tag or commit to get the changelog for, HEAD if
+            not passed.
+        since_commit(str): sha of a first parent the changelog was already
+            generated for, to get only the entries of the newer ones.
+        since_version(str): version of since_commit, required with it.
+        since_tags(dict(str, str)): tags (version per sha) when since_commit
+            was processed, to make sure its versions didn't change.
+        paths(list(str)): if passed, only include the commits that changed
+            something under those paths, see :func:`get_current_version`.
 
     Returns:
         str: Rpm compatible changelog
+
+    Raises:
+        StaleHistoryError: if since_commit was passed and the changelog
+            can't be generated incrementally from it, for example if it's no
+            longer a first parent.
+        ShallowHistoryError: if paths are passed on a shallow clone.
     """
-    repo = dulwich.repo.Repo(repo_path)
-    tags = get_tags(repo)
+    repo = open_repo(repo_path)
+    head = resolve_rev(repo, rev) if rev is not None else None
+    commits = CommitCache(repo, head=head)
+    tags = _get_tags_for_paths(repo, paths)
     refs = get_refs(repo)
     changelog: List[str] = []
-    maj_version = 0
-    feat_version = 0
-    fix_version = 0
     start_including = False
 
-    cur_line = ""
-
-    prev_version = (maj_version, feat_version, fix_version)
+    prev_version = (0, 0, 0)
+    since = None
+    if since_commit is not None:
+        prev_version = _tag2tuple(since_version or "0.0.0")
+        since = (since_commit, since_version or "0.0.0", since_tags)
 
-    for commit_sha, children in reversed(
-        get_children_per_first_parent(repo_path).items()
+    for commit_sha, commit, children, version in _iter_versions(
+        repo_path=repo_path,
+        commits=commits,
+        tags=tags,
+        head=head,
+        since=since,
+        paths=paths,
     ):
-        commit = get_repo_object(repo, commit_sha)
-        maj_version, feat_version, fix_version = get_version(
-            commit=commit,
-            tags=tags,
-            maj_version=maj_version,
-            feat_version=feat_version,
-            fix_version=fix_version,
-            children=children,
-        )
-        version = (maj_version, feat_version, fix_version)
-        version_str = "%s.%s.%s" % version
-
         if from_commit is None:
             start_including = True
         else:
@@ -132,40 +327,90 @@ def get_changelog(
             )
 
         if start_including:
-            commit_type = get_commit_type(
+            entry = _get_changelog_entry(
                 commit=commit,
                 children=children,
                 tags=tags,
+                version=version,
                 prev_version=prev_version,
-            )
-            cur_line = pretty_commit(
-                commit=commit,
-                version=version_str,
-                commit_type=commit_type,
                 bugtracker_url=bugtracker_url,
                 rpm_format=rpm_format,
+                notes=commits.notes,
+                exclude=commits.exclude,
             )
-            for child in children:
-                commit_type = get_commit_type(
-                    commit=commit,
-                    tags=tags,
-                    prev_version=prev_version,
-                )
-                cur_line += pretty_commit(
-                    commit=child,
-                    version=None,
-                    commit_type=commit_type,
-                    bugtracker_url=bugtracker_url,
-                )
-            changelog.append(cur_line)
+            if entry:
+                changelog.append(entry)
 
         prev_version = version
 
     return "\n".join(reversed(changelog))
 
 
+def _get_changelog_entry(
+    commit: Commit,
+    children: List[Commit],
+    tags: Dict[str, str],
+    version: Tuple[int, int, int],
+    prev_version: Tuple[int, int, int],
+    bugtracker_url: str = "",
+    rpm_format: bool = False,
+    notes: Optional[NotesStore] = None,
+    exclude: Optional[ExcludeRules] = None,
+    commit_type: Optional[str] = None,
+) -> str:
+    """
+    Returns the changelog lines for a first parent and the commits it merged,
+    leaving out the excluded ones (empty if all of them are). The type of the
+    first parent is only worked out if not passed.
+    """
+    if commit_type is None:
+        commit_type = get_commit_type(
+            commit=commit,
+            children=children,
+            tags=tags,
+            prev_version=prev_version,
+            notes=notes,
+            exclude=exclude,
+        )
+    if commit_type == EXCLUDED:
+        return ""
+
+    if exclude is not None:
+        children = [child for child in children if not exclude.excludes(child)]
+
+    entry = pretty_commit(
+        commit=commit,
+        version="%s.%s.%s" % version,
+        commit_type=commit_type,
+        bugtracker_url=bugtracker_url,
+        rpm_format=rpm_format,
+    )
+    for child in children:
+        commit_type = get_commit_type(
+            commit=commit,
+            tags=tags,
+            prev_version=prev_version,
+            notes=notes,
+        )
+        entry += pretty_commit(
+            commit=child,
+            version=None,
+            commit_type=commit_type,
+            bugtracker_url=bugtracker_url,
+        )
+
+    return entry
+
+
 @_needs_git
-def get_current_version(repo_path: str) -> str:
+def get_current_version(
+    repo_path: RepoPath,
+    persist: bool = False,
+    dirty: bool = False,
+    scheme: str = SEMVER,
+    rev: Optional[str] = None,
+    paths: Optional[List[str]] = None,
+) -> str:
     """
     Given a repo will return the version string, according to semantic
     versioning, counting as non-backwards compatible commit any one with a
@@ -181,115 +426,624 @@ def get_current_version(repo_path: str) -> str:
 
     Args:
         repo_path(str): path to the git repository to get the version for.
+        persist(bool): if set, will use the version index saved inside the
+            git directory if it was generated for the current HEAD, and save
+            it there otherwise (see :func:`get_version_index`).
+        dirty(bool): if set and there are uncommitted changes in the index
+            or the working tree, will append a PEP 440 local version
+            ``+dirty.<hash>`` with a hash of those changes. Ignored if rev is
+            passed.
+        scheme(str): versioning scheme to render the version with, see
+            :mod:`autosemver.schemes`.
+        rev(str): branch, tag or commit to get the version for, HEAD if not
+            passed.
+        paths(list(str)): if passed, get the version of the subproject in
+            those paths (relative to the root of the repo) instead, only
+            counting the commits that changed something under them. As the
+            tags version the whole repo, they are ignored, and the version
+            index is not used.
 
     Returns:
         str: Version string for that repository.
+
+    Raises:
+        ValueError: if the scheme is not known, or any of the paths is
+            outside of the repo.
+        ShallowHistoryError: if paths are passed on a shallow clone.
     """
-    repo = dulwich.repo.Repo(repo_path)
+    repo = open_repo(repo_path)
+    head = resolve_rev(repo, rev) if rev is not None else None
+    tags = _get_tags_for_paths(repo, paths)
+    head_sha = ""
+    # number of first parent commits since the last tagged one
+    distance = 0
+    if persist and paths is None:
+        mainline = _get_mainline(repo_path, persist=True, head=head)
+        version_str = mainline[-1][1] if mainline else "0.0.0"
+        for commit_sha, _, _ in mainline:
+            distance = 0 if commit_sha in tags else distance + 1
+            head_sha = commit_sha
+
+    else:
+        commits = CommitCache(repo, head=head)
+        version = (0, 0, 0)
+
+        for commit_sha, _, _, version in _iter_versions(
+            repo_path=repo_path, commits=commits, tags=tags, head=head, paths=paths
+        ):
+            distance = 0 if commit_sha in tags else distance + 1
+            head_sha = commit_sha
+
+        version_str = "%s.%s.%s" % version
+
+    version_str = format_version(
+        version=version_str,
+        scheme=scheme,
+        distance=distance,
+        sha=head_sha,
+        branch=get_head_branch(repo, rev) if scheme != SEMVER else None,
+    )
+
+    dirty_hash = get_dirty_hash(repo) if dirty and rev is None else None
+    if dirty_hash is not None:
+        # there can only be one local version part
+        separator = "." if "+" in version_str else "+"
+        version_str += "%sdirty.%s" % (separator, dirty_hash)
+
+    return version_str
+
+
+def _get_shared_length(chain: List[str], other_chain: List[str]) -> int:
+    """
+    Returns the number of first parents (oldest first) two histories share,
+    those are always at the start of both.
+    """
+    low, high = 0, min(len(chain), len(other_chain))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if chain[middle - 1] == other_chain[middle - 1]:
+            low = middle
+        else:
+            high = middle - 1
+
+    return low
+
+
+@_needs_git
+def get_versions(
+    repo_path: RepoPath,
+    revs: Optional[List[str]] = None,
+    with_changelog: bool = False,
+    bugtracker_url: str = "",
+) -> "OrderedDict[str, Tuple[str, Optional[str]]]":
+    """
+    Given a repo and several branches, tags or commits, will return the
+    version of each of them. The history they share is only processed once,
+    and the versions replayed from where each of them diverges.
+
+    Args:
+        repo_path(str): path to the git repository.
+        revs(list(str)): branches, tags or commits to get the versions of,
+            all the local branches if not passed.
+        with_changelog(bool): if set, will also return the changelog of the
+            first parents of each revision that are not in the history of any
+            of the other ones.
+        bugtracker_url(str): URL to be prepended to any bug ids found in the
+            commits of the changelogs.
+
+    Returns:
+        OrderedDict(str, tuple(str, str)): version and changelog (None if
+            with_changelog is not set) of each revision.
+    """
+    repo = open_repo(repo_path)
+    commits = CommitCache(repo)
     tags = get_tags(repo)
-    maj_version = 0
-    feat_version = 0
-    fix_version = 0
+    if revs is None:
+        revs = sorted(_to_str(ref) for ref in repo.refs.keys(base=b"refs/heads"))
+
+    heads = OrderedDict((rev, resolve_rev(repo, rev)) for rev in revs)
+    chains, children_per_first_parent = get_first_parent_histories(
+        repo_path, heads=list(OrderedDict.fromkeys(heads.values())), commits=commits
+    )
+    # version of each of the first parents of each head, oldest first
+    versions_per_head: Dict[str, List[Tuple[int, int, int]]] = {}
+    result: "OrderedDict[str, Tuple[str, Optional[str]]]" = OrderedDict()
+
+    for rev, head in heads.items():
+        chain = chains[head]
+        if head not in versions_per_head:
+            # start from where it diverges from the longest known history
+            shared_length = 0
+            versions: List[Tuple[int, int, int]] = []
+            for other_head, other_versions in versions_per_head.items():
+                length = _get_shared_length(chain, chains[other_head])
+                if length > shared_length:
+                    shared_length = length
+                    versions = other_versions[:length]
+
+            version = versions[-1] if versions else (0, 0, 0)
+            for commit_sha in chain[shared_length:]:
+                version = get_version(
+                    commit=commits.get(commit_sha),
+                    tags=tags,
+                    maj_version=version[0],
+                    feat_version=version[1],
+                    fix_version=version[2],
+                    children=children_per_first_parent[commit_sha],
+                    notes=commits.notes,
+                    exclude=commits.exclude,
+                )
+                versions.append(version)
+
+            versions_per_head[head] = versions
+
+        versions = versions_per_head[head]
+        changelog = None
+        if with_changelog:
+            own_start = max(
+                [
+                    _get_shared_length(chain, chains[other_head])
+                    for other_head in chains
+                    if other_head != head
+                ]
+                or [0]
+            )
+            entries: List[str] = []
+            for depth in range(own_start, len(chain)):
+                entry = _get_changelog_entry(
+                    commit=commits.get(chain[depth]),
+                    children=children_per_first_parent[chain[depth]],
+                    tags=tags,
+                    version=versions[depth],
+                    prev_version=versions[depth - 1] if depth else (0, 0, 0),
+                    bugtracker_url=bugtracker_url,
+                    notes=commits.notes,
+                    exclude=commits.exclude,
+                )
+                if entry:
+                    entries.append(entry)
+
+            changelog = "\n".join(reversed(entries))
+
+        result[rev] = ("%s.%s.%s" % versions[-1], changelog)
+
+    return result
 
-    for commit_sha, children in reversed(
-        list(get_children_per_first_parent(repo_path).items())
+
+def read_path_map(path_map_file: str) -> "OrderedDict[str, List[str]]":
+    """
+    Reads the paths of each subproject from a toml file, with the name of
+    each subproject as key, and a path or list of paths as value::
+
+        parser = "libs/parser"
+        cli = ["apps/cli", "libs/cli-common"]
+
+    Args:
+        path_map_file(str): path to the toml file.
+
+    Returns:
+        OrderedDict(str, list(str)): paths of each subproject, in the order
+            they are in the file.
+
+    Raises:
+        RuntimeError: if there's no toml parser available (tomli is needed
+            on python < 3.11).
+        ValueError: if any of the values is not a path or list of paths.
+    """
+    if tomllib is None:
+        raise RuntimeError(
+            "Reading %s needs the tomli package on python < 3.11" % path_map_file
+        )
+
+    with open(path_map_file, "rb") as path_map_fd:
+        contents = tomllib.load(path_map_fd)
+
+    path_map: "OrderedDict[str, List[str]]" = OrderedDict()
+    for subproject, paths in contents.items():
+        if isinstance(paths, str):
+            paths = [paths]
+
+        if not isinstance(paths, list) or not all(
+            isinstance(path, str) for path in paths
+        ):
+            raise ValueError(
+                "The paths of %s in %s must be a string or a list of strings"
+                % (subproject, path_map_file)
+            )
+
+        path_map[subproject] = paths
+
+    return path_map
+
+
+@_needs_git
+def get_subproject_versions(
+    repo_path: RepoPath,
+    path_map: Dict[str, List[str]],
+    rev: Optional[str] = None,
+    with_changelog: bool = False,
+    bugtracker_url: str = "",
+) -> "OrderedDict[str, Tuple[str, Optional[str]]]":
+    """
+    Given a repo and the paths of several subprojects in it, will return the
+    version of each of them, the same :func:`get_current_version` returns
+    for their paths. The history is walked only once, and the tree of each
+    commit compared only once with the one of its first parent for all of
+    them, see :class:`autosemver.git.PathRouter`.
+
+    Args:
+        repo_path(str): path to the git repository.
+        path_map(dict(str, list(str))): paths (relative to the root of the
+            repo) of each subproject, see :func:`read_path_map`.
+        rev(str): branch, tag or commit to get the versions for, HEAD if not
+            passed.
+        with_changelog(bool): if set, will also return the changelog of each
+            subproject.
+        bugtracker_url(str): URL to be prepended to any bug ids found in the
+            commits of the changelogs.
+
+    Returns:
+        OrderedDict(str, tuple(str, str)): version and changelog (None if
+            with_changelog is not set) of each subproject.
+
+    Raises:
+        ValueError: if any of the paths is outside of the repo.
+        ShallowHistoryError: if it's a shallow clone.
+    """
+    repo = open_repo(repo_path)
+    head = resolve_rev(repo, rev) if rev is not None else None
+    tags = _get_tags_for_paths(
+        repo, [path for paths in path_map.values() for path in paths]
+    )
+    commits = CommitCache(repo, head=head)
+    router = PathRouter(commits, path_map)
+    versions = {subproject: (0, 0, 0) for subproject in path_map}
+    changelogs: Dict[str, List[str]] = {subproject: [] for subproject in path_map}
+
+    for commit_sha, children in iter_children_per_first_parent(
+        repo_path, commits=commits, head=head
     ):
-        commit = get_repo_object(repo, commit_sha)
-        maj_version, feat_version, fix_version = get_version(
-            commit=commit,
-            tags=tags,
-            maj_version=maj_version,
-            feat_version=feat_version,
-            fix_version=fix_version,
-            children=children,
+        commit = commits.get(commit_sha)
+        for subproject in sorted(router.route(commit)):
+            subproject_children = [
+                child for child in children if subproject in router.route(child)
+            ]
+            prev_version = versions[subproject]
+            versions[subproject] = get_version(
+                commit=commit,
+                tags=tags,
+                maj_version=prev_version[0],
+                feat_version=prev_version[1],
+                fix_version=prev_version[2],
+                children=subproject_children,
+                notes=commits.notes,
+                exclude=commits.exclude,
+            )
+            if with_changelog:
+                entry = _get_changelog_entry(
+                    commit=commit,
+                    children=subproject_children,
+                    tags=tags,
+                    version=versions[subproject],
+                    prev_version=prev_version,
+                    bugtracker_url=bugtracker_url,
+                    notes=commits.notes,
+                    exclude=commits.exclude,
+                )
+                if entry:
+                    changelogs[subproject].append(entry)
+
+    return OrderedDict(
+        (
+            subproject,
+            (
+                "%s.%s.%s" % versions[subproject],
+                "\n".join(reversed(changelogs[subproject])) if with_changelog else None,
+            ),
         )
+        for subproject in path_map
+    )
+
+
+@_needs_git
+def get_head_status(repo_path: RepoPath) -> Tuple[str, bool]:
+    """
+    Given a repo will return the sha of HEAD and whether there are changes
+    not committed yet in the index or the working tree.
+
+    Args:
+        repo_path(str): path to the git repository.
+
+    Returns:
+        tuple(str, bool): sha of HEAD and dirty flag.
+    """
+    repo = open_repo(repo_path)
+    return _to_str(repo.head()), is_dirty(repo)
+
+
+@_needs_git
+def get_version_index(repo_path: RepoPath, persist: bool = False) -> Dict[str, str]:
+    """
+    Given a repo will return the version of every commit in the history of
+    HEAD. The first parents get the version they generate, and the merged
+    commits the version of the merge that brought them in.
+
+    Args:
+        repo_path(str): path to the git repository.
+        persist(bool): if set, will reuse the index saved inside the git
+            directory if it was generated for the current HEAD, and save it
+            there otherwise.
+
+    Returns:
+        dict(str, str): version string per commit sha.
+    """
+    index: Dict[str, str] = {}
+    for commit_sha, version, children in _get_mainline(repo_path, persist):
+        index[commit_sha] = version
+        for child_sha in children:
+            # a commit can be merged more than once, the first one counts
+            index.setdefault(child_sha, version)
 
-    return "%s.%s.%s" % (maj_version, feat_version, fix_version)
+    return index
 
 
 @_needs_git
-def tag_versions(repo_path: str) -> str:
+def get_version_of(repo_path: RepoPath, rev: str, persist: bool = True) -> str:
+    """
+    Given a repo and a revision, will return the version of that revision,
+    as given by :func:`get_version_index`.
+
+    Args:
+        repo_path(str): path to the git repository.
+        rev(str): sha, short sha, tag, branch or ref to get the version of.
+        persist(bool): if set, will reuse and save the version index inside
+            the git directory.
+
+    Returns:
+        str: Version string for that revision.
+
+    Raises:
+        RuntimeError: if the revision is not in the history of HEAD.
+    """
+    repo = open_repo(repo_path)
+    commit_sha = resolve_rev(repo, rev)
+    index = get_version_index(repo_path=repo_path, persist=persist)
+    if commit_sha not in index:
+        raise RuntimeError("Commit %s is not in the history of HEAD" % commit_sha)
+
+    return index[commit_sha]
+
+
+@_needs_git
+def get_version_commits(
+    repo_path: RepoPath, version: str, persist: bool = True
+) -> List[Tuple[str, str, List[str]]]:
+    """
+    Given a repo and a version or range of versions, will return the first
+    parent commits that generated those versions, and the commits they
+    merged.
+
+    Args:
+        repo_path(str): path to the git repository.
+        version(str): version (ex. ``4.12.3`` or ``4.12`` for all the
+            ``4.12.x``) or range of versions (ex. ``4.12.1..4.13``, both
+            included) to get the commits for.
+        persist(bool): if set, will reuse and save the version index inside
+            the git directory.
+
+    Returns:
+        list(tuple(str, str, list(str))): sha, version and merged commits
+            shas of each of the first parents, from the oldest.
+    """
+    low, high = get_version_range(version)
+    mainline = _get_mainline(repo_path, persist)
+    versions = [_tag2tuple(commit_version) for _, commit_version, _ in mainline]
+
+    # tags can make the version go back, only then it has to go one by one
+    if all(prev <= cur for prev, cur in zip(versions, versions[1:])):
+        return mainline[bisect_left(versions, low) : bisect_right(versions, high)]
+
+    return [
+        entry
+        for entry, commit_version in zip(mainline, versions)
+        if low <= commit_version <= high
+    ]
+
+
+@_needs_git
+def tag_versions(repo_path: RepoPath, rev: Optional[str] = None) -> str:
     """
     Given a repo will add a tag for each major version.
 
+    Concurrent calls on the same repo are serialized, so each one sees the
+    tags added by the previous ones.
+
     Args:
         repo_path(str): path to the git repository to tag.
+        rev(str): branch, tag or commit to tag the history of, HEAD if not
+            passed.
+
+    Raises:
+        ReadOnlyBundleError: if the repo is a git bundle.
     """
-    repo = dulwich.repo.Repo(repo_path)
-    tags = get_tags(repo)
-    maj_version = 0
-    feat_version = 0
-    fix_version = 0
+    repo = open_repo(repo_path)
+    if isinstance(repo, BundleRepo):
+        raise ReadOnlyBundleError("Can't tag %s, git bundles are read only" % repo_path)
+
+    head = resolve_rev(repo, rev) if rev is not None else None
+    commits = CommitCache(repo, head=head)
     last_maj_version = 0
     last_feat_version = 0
     result: List[str] = []
 
-    for commit_sha, children in reversed(
-        get_children_per_first_parent(repo_path).items()
-    ):
-        commit = get_repo_object(repo, commit_sha)
-        maj_version, feat_version, fix_version = get_version(
-            commit=commit,
-            tags=tags,
-            maj_version=maj_version,
-            feat_version=feat_version,
-            fix_version=fix_version,
-            children=children,
-        )
-        if last_maj_version != maj_version or last_feat_version != feat_version:
-            last_maj_version = maj_version
-            last_feat_version = feat_version
-            tag_name = "refs/tags/v%d.%d" % (maj_version, feat_version)
-            repo[str.encode(tag_name)] = commit
+    with file_lock(os.path.join(repo.controldir(), TAGS_LOCK_FILE)):
+        tags = get_tags(repo)
+        for commit_sha, commit, _, version in _iter_versions(
+            repo_path=repo_path, commits=commits, tags=tags, head=head
+        ):
+            maj_version, feat_version, _ = version
+            if last_maj_version != maj_version or last_feat_version != feat_version:
+                last_maj_version = maj_version
+                last_feat_version = feat_version
+                tag_name = "refs/tags/v%d.%d" % (maj_version, feat_version)
+                repo[str.encode(tag_name)] = commit
 
-            result.append("v%d.%d -> %s" % (maj_version, feat_version, commit_sha))
+                result.append("v%d.%d -> %s" % (maj_version, feat_version, commit_sha))
 
     return "\n".join(result)
 
 
 @_needs_git
-def get_authors(repo_path: str, from_commit: Optional[str] = None) -> List[str]:
+def sync_notes(repo_path: RepoPath, rev: Optional[str] = None) -> int:
+    """
+    Writes the notes with the classification of every commit in the history
+    of rev that has no note yet, or whose version changed, under
+    ``refs/notes/autosemver``.
+
+    Concurrent calls on the same repo are serialized.
+
+    Args:
+        repo_path(str): path to the git repository.
+        rev(str): branch, tag or commit to write the notes for the history
+            of, HEAD if not passed.
+
+    Returns:
+        int: number of notes written.
+
+    Raises:
+        ShallowHistoryError: if it's a shallow clone, as the versions and
+            merged commits there might not match the ones of a full clone.
+        ReadOnlyBundleError: if the repo is a git bundle.
+    """
+    repo = open_repo(repo_path)
+    if isinstance(repo, BundleRepo):
+        raise ReadOnlyBundleError(
+            "Can't write notes to %s, git bundles are read only" % repo_path
+        )
+
+    head = resolve_rev(repo, rev) if rev is not None else None
+    if get_shallow(repo):
+        raise ShallowHistoryError("Notes can't be written from shallow clones")
+
+    with file_lock(os.path.join(repo.controldir(), NOTES_LOCK_FILE)):
+        notes = NotesStore(repo)
+        commits = CommitCache(repo, head=head)
+        tags = get_tags(repo)
+
+        def get_note(commit: Commit, version: Optional[str] = None) -> Dict[str, Any]:
+            note = {
+                "type": get_own_commit_type(commit, notes),
+                "bugs": get_bugs_from_commit_msg(_to_str(commit.message)),
+            }
+            if version is not None:
+                note["version"] = version
+            return note
+
+        for commit_sha, commit, children, version in _iter_versions(
+            repo_path=repo_path, commits=commits, tags=tags, head=head
+        ):
+            for child in children:
+                child_sha = child.sha().hexdigest()
+                if child_sha not in notes:
+                    notes.set(child_sha, get_note(child))
+
+            note = get_note(commit, "%s.%s.%s" % version)
+            if notes.get(commit_sha) != note:
+                notes.set(commit_sha, note)
+
+        return notes.save()
+
+
+@_needs_git
+def get_author_stats(
+    repo_path: RepoPath,
+    from_commit: Optional[str] = None,
+    rev: Optional[str] = None,
+    mailmap: bool = True,
+) -> Dict[str, Tuple[int, int, int]]:
     """
     Given a repo and optionally a base revision to start from, will return
-    the list of authors.
+    the number of commits and the first and last author timestamps of each
+    author.
 
     Args:
         repo_path(str): Path to the code git repository.
         from_commit(str): Refspec of the commit to start aggregating the
             authors from.
+        rev(str): branch, tag or commit to get the authors for, HEAD if not
+            passed.
+        mailmap(bool): if True, the authors will be canonicalized with the
+            ``.mailmap`` file of the repo, if any.
 
     Returns:
-        list: lexicographically sorted list of authors of the repo.
+        dict(str, tuple(int, int, int)): commits, first and last seen
+            timestamps for each author.
     """
-    repo = dulwich.repo.Repo(repo_path)
+    repo = open_repo(repo_path)
+    head = resolve_rev(repo, rev) if rev is not None else None
+    stats = AuthorStats(read_mailmap(repo, head) if mailmap else None)
+
+    if from_commit is None and not repo.get_shallow():
+        # all the history is included, no need to analyze it, just read the
+        # author header of every commit
+        for commit_sha, headers in iter_commit_headers(repo, head):
+            stats.add(commit_sha, *split_identity(headers[b"author"][0]))
+
+        return stats.stats
+
+    commits = CommitCache(repo, head=head)
     refs = get_refs(repo)
-    start_including = False
-    authors: Set[str] = set()
+    start_including = from_commit is None
 
-    for commit_sha, children in reversed(
-        get_children_per_first_parent(repo_path).items()
+    for commit_sha, children in iter_children_per_first_parent(
+        repo_path, commits=commits, head=head
     ):
-        commit = get_repo_object(repo, commit_sha)
-        if from_commit is None:
-            start_including = True
-        else:
-            start_including = (
-                start_including
-                or commit_sha.startswith(from_commit)
-                or fuzzy_matches_refs(from_commit, refs.get(commit_sha, []))
-            )
+        start_including = (
+            start_including
+            or commit_sha.startswith(from_commit)
+            or fuzzy_matches_refs(from_commit, refs.get(commit_sha, []))
+        )
 
         if start_including:
-            authors.add(_to_str(commit.author))
+            stats.add_commit(commits.get(commit_sha))
             for child in children:
-                authors.add(_to_str(child.author))
+                stats.add_commit(child)
+
+    return stats.stats
+
+
+@_needs_git
+def get_authors(
+    repo_path: RepoPath,
+    from_commit: Optional[str] = None,
+    rev: Optional[str] = None,
+    mailmap: bool = True,
+) -> List[str]:
+    """
+    Given a repo and optionally a base revision to start from, will return
+    the list of authors.
+
+    Args:
+        repo_path(str): Path to the code git repository.
+        from_commit(str): Refspec of the commit to start aggregating the
+            authors from.
+        rev(str): branch, tag or commit to get the authors for, HEAD if not
+            passed.
+        mailmap(bool): if True, the authors will be canonicalized with the
+            ``.mailmap`` file of the repo, if any.
 
-    return sorted(authors)
+    Returns:
+        list: lexicographically sorted list of authors of the repo.
+    """
+    return sorted(get_author_stats(repo_path, from_commit, rev, mailmap))
 
 
 @_needs_git
 def get_releasenotes(
-    repo_path: str, from_commit: Optional[str] = None, bugtracker_url: str = ""
+    repo_path: RepoPath,
+    from_commit: Optional[str] = None,
+    bugtracker_url: str = "",
+    rev: Optional[str] = None,
 ) -> str:
     """
     Given a repo and optionally a base revision to start from, will return
@@ -302,41 +1056,33 @@ def get_releasenotes(
             authors from.
         bugtracker_url(str): URL to be prepended to any bug ids found in the
             commits.
+        rev(str): branch, tag or commit to get the release notes for, HEAD if
+            not passed.
 
     Returns:
         str: Release notes text.
     """
-    repo = dulwich.repo.Repo(repo_path)
+    repo = open_repo(repo_path)
+    head = resolve_rev(repo, rev) if rev is not None else None
+    commits = CommitCache(repo, head=head)
     tags = get_tags(repo)
     refs = get_refs(repo)
-    maj_version = 0
-    feat_version = 0
-    fix_version = 0
     start_including = False
-    release_notes_per_major: OrderedDict[
-        str, Tuple[List[str], List[str], List[str]]
-    ] = OrderedDict()
+    # a list, as tags can make the same version be the last of several majors
+    release_notes_per_major: List[
+        Tuple[str, Tuple[List[str], List[str], List[str]]]
+    ] = []
     cur_line = ""
 
-    prev_version = (maj_version, feat_version, fix_version)
+    prev_version = (0, 0, 0)
     prev_version_str = "%s.%s.%s" % prev_version
     bugs: List[str] = []
     features: List[str] = []
     api_break_changes: List[str] = []
 
-    for commit_sha, children in reversed(
-        get_children_per_first_parent(repo_path).items()
+    for commit_sha, commit, children, version in _iter_versions(
+        repo_path=repo_path, commits=commits, tags=tags, head=head
     ):
-        commit = get_repo_object(repo, commit_sha)
-        maj_version, feat_version, fix_version = get_version(
-            commit=commit,
-            tags=tags,
-            maj_version=maj_version,
-            feat_version=feat_version,
-            fix_version=fix_version,
-            children=children,
-        )
-        version = (maj_version, feat_version, fix_version)
         version_str = "%s.%s.%s" % version
 
         if from_commit is None:
@@ -354,31 +1100,28 @@ def get_releasenotes(
                 children=children,
                 tags=tags,
                 prev_version=prev_version,
+                notes=commits.notes,
+                exclude=commits.exclude,
             )
-            cur_line = pretty_commit(
+            if parent_commit_type == EXCLUDED:
+                prev_version = version
+                prev_version_str = version_str
+                continue
+
+            cur_line = _get_changelog_entry(
                 commit=commit,
-                version=version_str,
+                children=children,
+                tags=tags,
+                version=version,
+                prev_version=prev_version,
                 bugtracker_url=bugtracker_url,
+                notes=commits.notes,
+                exclude=commits.exclude,
                 commit_type=parent_commit_type,
             )
-            for child in children:
-                commit_type = get_commit_type(
-                    commit=commit,
-                    tags=tags,
-                    prev_version=prev_version,
-                )
-                cur_line += pretty_commit(
-                    commit=child,
-                    version=None,
-                    commit_type=commit_type,
-                    bugtracker_url=bugtracker_url,
-                )
-
             if parent_commit_type == "api_break":
-                release_notes_per_major[prev_version_str] = (
-                    api_break_changes,
-                    features,
-                    bugs,
+                release_notes_per_major.append(
+                    (prev_version_str, (api_break_changes, features, bugs))
                 )
                 bugs, features, api_break_changes = [], [], []
                 api_break_changes.append(cur_line)
@@ -390,16 +1133,27 @@ def get_releasenotes(
         prev_version = version
         prev_version_str = version_str
 
-    release_notes_per_major[prev_version_str] = (
-        api_break_changes,
-        features,
-        bugs,
+    release_notes_per_major.append(
+        (prev_version_str, (api_break_changes, features, bugs))
     )
 
-    releasenotes = ""
-    for major_version, lines in reversed(release_notes_per_major.items()):
-        api_break_changes, features, bugs = lines
-        releasenotes += """New changes for version %s
+    return "".join(
+        _render_releasenotes_section(major_version, *lines)
+        for major_version, lines in reversed(release_notes_per_major)
+    ).strip()
+
+
+def _render_releasenotes_section(
+    version: str,
+    api_break_changes: List[str],
+    features: List[str],
+    bugs: List[str],
+) -> str:
+    """
+    Returns the release notes section for the given version, with the entries
+    of each kind of change, oldest first.
+    """
+    return """New changes for version %s
 =================================
 
 API Breaking changes
@@ -413,10 +1167,107 @@ Bugfixes and minor changes
 %s
 
 """ % (
-            major_version,
-            ("\n".join(reversed(api_break_changes)) or "No new API breaking changes\n"),
-            "\n".join(reversed(features)) or "No new features\n",
-            "\n".join(reversed(bugs)) or "No new bugs\n",
+        version,
+        ("\n".join(reversed(api_break_changes)) or "No new API breaking changes\n"),
+        "\n".join(reversed(features)) or "No new features\n",
+        "\n".join(reversed(bugs)) or "No new bugs\n",
+    )
+
+
+@_needs_git
+def get_releasenotes_section(
+    repo_path: RepoPath,
+    version: str,
+    bugtracker_url: str = "",
+    rev: Optional[str] = None,
+    persist: bool = True,
+) -> str:
+    """
+    Given a repo and a version or range of versions, will return the release
+    notes section for them, in the same format as :func:`get_releasenotes`,
+    with all the changes that generated those versions.
+
+    Only the commits in the range are classified, the versions of the first
+    parents are taken from the version index (see :func:`get_version_index`),
+    that is saved the first time for HEAD.
+
+    Args:
+        repo_path(str): path to the git repository.
+        version(str): version (ex. ``4`` or ``4.12`` for all the ``4.12.x``)
+            or range of versions (ex. ``4.12.1..4.13``, both included) to get
+            the release notes of.
+        bugtracker_url(str): URL to be prepended to any bug ids found in the
+            commits.
+        rev(str): branch, tag or commit to get the release notes for, HEAD if
+            not passed.
+        persist(bool): if set, will reuse the version index saved inside the
+            git directory, or save it there, when getting them for HEAD.
+
+    Returns:
+        str: Release notes section, headed by the newest version in the range.
+
+    Raises:
+        ValueError: if the version is not a valid version or range.
+        RuntimeError: if no commit in the history generated any of those
+            versions.
+    """
+    low, high = get_version_range(version)
+    repo = open_repo(repo_path)
+    head = resolve_rev(repo, rev) if rev is not None else None
+    commits = CommitCache(repo, head=head)
+    tags = get_tags(repo)
+    # saving the index of another revision would replace the one of HEAD
+    mainline = _get_mainline(repo_path, persist=persist and rev is None, head=head)
+
+    range_commits = []
+    prev_version = (0, 0, 0)
+    for commit_sha, version_str, children_shas in mainline:
+        commit_version = _tag2tuple(version_str)
+        if low <= commit_version <= high:
+            range_commits.append(
+                (
+                    commits.get(commit_sha),
+                    [commits.get(child_sha) for child_sha in children_shas],
+                    commit_version,
+                    prev_version,
+                )
+            )
+
+        prev_version = commit_version
+
+    if not range_commits:
+        raise RuntimeError("No commits for version %s" % version)
+
+    lines: Dict[str, List[str]] = {"api_break": [], "feature": [], "bug": []}
+    for commit, children, commit_version, prev_version in range_commits:
+        commit_type = get_commit_type(
+            commit=commit,
+            children=children,
+            tags=tags,
+            prev_version=prev_version,
+            notes=commits.notes,
+            exclude=commits.exclude,
+        )
+        if commit_type == EXCLUDED:
+            continue
+
+        lines.get(commit_type, lines["bug"]).append(
+            _get_changelog_entry(
+                commit=commit,
+                children=children,
+                tags=tags,
+                version=commit_version,
+                prev_version=prev_version,
+                bugtracker_url=bugtracker_url,
+                notes=commits.notes,
+                exclude=commits.exclude,
+                commit_type=commit_type,
+            )
         )
 
-    return releasenotes.strip()
+    return _render_releasenotes_section(
+        "%s.%s.%s" % range_commits[-1][2],
+        lines["api_break"],
+        lines["feature"],
+        lines["bug"],
+    ).strip()
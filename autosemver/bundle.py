@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""
+Read-only access to git bundle files (``git bundle create``), as if they
+were bare repositories, without cloning them.
+
+The refs are read from the header of the bundle, and the pack embedded after
+it is read and indexed in memory, so nothing is unpacked to disk, but the
+whole pack is kept in memory while the bundle is open. Bundles with
+prerequisites (the ones created for a range of commits) are handled as
+shallow clones, the commits that have a prerequisite as parent being the
+shallow boundary.
+"""
+import io
+import os
+from typing import IO, Any, Dict, Optional, Set, Tuple
+
+from dulwich.object_store import BaseObjectStore
+from dulwich.objects import Commit
+from dulwich.pack import MemoryPackIndex, Pack, PackData
+from dulwich.refs import DictRefsContainer
+from dulwich.repo import BaseRepo
+
+from .profiling import count, span
+
+try:
+    from dulwich.object_format import DEFAULT_OBJECT_FORMAT
+
+    _FORMAT_KWARGS: Dict[str, Any] = {"object_format": DEFAULT_OBJECT_FORMAT}
+except ImportError:  # dulwich < 1.0, sha1 only
+    _FORMAT_KWARGS = {}
+
+BUNDLE_SUFFIX: str = ".bundle"
+BUNDLE_SIGNATURES = (b"# v2 git bundle\n", b"# v3 git bundle\n")
+
+
+class ReadOnlyBundleError(RuntimeError):
+    """Raised when trying to write to a git bundle, ex. tags or notes."""
+
+
+class _PackSection:
+    """
+    The part of the bundle file with the pack, as dulwich expects the pack to
+    start at the beginning of the file, read in one go and only once.
+
+    The whole pack is kept in memory, dulwich can only map a pack file from
+    its start, and reads the objects slicing the mapping as bytes, so a view
+    of the mapped bundle from the offset of the pack would not do. Bundles
+    bigger than the available memory have to be cloned instead.
+    """
+
+    def __init__(self, bundle_fd: IO[bytes]) -> None:
+        self.bundle_fd = bundle_fd
+
+    def fileno(self) -> int:
+        # that would make dulwich map the whole bundle, header included
+        raise io.UnsupportedOperation("Not a standalone pack file")
+
+    def read(self, *_: Any) -> bytes:
+        return self.bundle_fd.read()
+
+
+class BundleObjectStore(BaseObjectStore):
+    """Object store with only the pack of a bundle, indexed in memory."""
+
+    def __init__(self, pack: Pack) -> None:
+        super().__init__(**_FORMAT_KWARGS)
+        self.pack = pack
+
+    @property
+    def packs(self):
+        return [self.pack]
+
+    def __contains__(self, sha: bytes) -> bool:
+        return sha in self.pack
+
+    def contains_packed(self, sha: bytes) -> bool:
+        return sha in self.pack
+
+    def contains_loose(self, sha: bytes) -> bool:
+        return False
+
+    def __iter__(self):
+        return iter(self.pack)
+
+    def get_raw(self, name: bytes) -> Tuple[int, bytes]:
+        return self.pack.get_raw(name)
+
+    def add_object(self, obj: Any) -> None:
+        raise ReadOnlyBundleError("Can't add objects to a git bundle")
+
+    def add_objects(self, *args: Any, **kwargs: Any) -> None:
+        raise ReadOnlyBundleError("Can't add objects to a git bundle")
+
+
+class BundleRepo(BaseRepo):
+    """
+    A git bundle file as a bare repository. The bundle file itself stands
+    for the control dir, so there are no anchors nor persisted indexes.
+    """
+
+    bare = True
+
+    def __init__(
+        self,
+        path: str,
+        object_store: BundleObjectStore,
+        refs: Dict[bytes, bytes],
+        prerequisites: Set[bytes],
+    ) -> None:
+        super().__init__(object_store, DictRefsContainer(refs))
+        self.path = path
+        self.prerequisites = prerequisites
+        self._shallow: Optional[Set[bytes]] = None
+
+    def controldir(self) -> str:
+        return self.path
+
+    def get_named_file(self, path: str, basedir: Optional[str] = None) -> None:
+        return None
+
+    def get_shallow(self) -> Set[bytes]:
+        """Returns the commits with a prerequisite of the bundle as parent."""
+        if self._shallow is None:
+            self._shallow = set()
+            if self.prerequisites:
+                for sha in self.object_store:
+                    type_num, raw = self.object_store.get_raw(sha)
+                    if type_num != Commit.type_num:
+                        continue
+
+                    headers = raw.split(b"\n\n", 1)[0].split(b"\n")
+                    if any(
+                        line[len(b"parent ") :] in self.prerequisites
+                        for line in headers
+                        if line.startswith(b"parent ")
+                    ):
+                        self._shallow.add(sha)
+
+        return self._shallow
+
+    def close(self) -> None:
+        self.object_store.pack.close()
+
+
+def is_bundle(path: str) -> bool:
+    """Tells if the path is a git bundle file, by its suffix or signature."""
+    if not os.path.isfile(path):
+        return False
+
+    if path.endswith(BUNDLE_SUFFIX):
+        return True
+
+    with open(path, "rb") as bundle_fd:
+        return bundle_fd.readline() in BUNDLE_SIGNATURES
+
+
+def open_bundle(path: str) -> BundleRepo:
+    """
+    Reads the refs of a bundle file and indexes its pack.
+
+    Raises:
+        ValueError: if the file is not a valid git bundle.
+    """
+    with open(path, "rb") as bundle_fd:
+        if bundle_fd.readline() not in BUNDLE_SIGNATURES:
+            raise ValueError("%s is not a v2 or v3 git bundle" % path)
+
+        refs: Dict[bytes, bytes] = {}
+        prerequisites: Set[bytes] = set()
+        for line in iter(bundle_fd.readline, b"\n"):
+            if not line:
+                raise ValueError("Truncated git bundle %s" % path)
+            elif line.startswith(b"@"):
+                # v3 capabilities, only sha1 bundles are supported anyway
+                continue
+            elif line.startswith(b"-"):
+                prerequisites.add(line[1:41])
+            else:
+                sha, _, ref = line.rstrip(b"\n").partition(b" ")
+                refs.setdefault(ref, sha)
+
+        with span("bundle_index"):
+            pack_data = PackData.from_file(_PackSection(bundle_fd), **_FORMAT_KWARGS)
+            entries = pack_data.sorted_entries()
+            count("bundle_objects", len(entries))
+            pack_index = MemoryPackIndex(
+                entries, pack_checksum=pack_data.get_stored_checksum(), **_FORMAT_KWARGS
+            )
+
+    head = refs.pop(b"HEAD", None)
+    if head is None and refs:
+        # no HEAD in the bundle, like a clone of it, use the first ref
+        head = next(iter(refs.values()))
+
+    if head is not None:
+        refs[b"HEAD"] = head
+
+    repo = BundleRepo(
+        path=path,
+        object_store=BundleObjectStore(Pack.from_objects(pack_data, pack_index)),
+        refs=refs,
+        prerequisites=prerequisites,
+    )
+    # point HEAD to the branch it's at, if any
+    for ref, sha in refs.items():
+        if ref.startswith(b"refs/heads/") and sha == head:
+            repo.refs.set_symbolic_ref(b"HEAD", ref)
+            break
+
+    return repo
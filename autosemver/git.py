@@ -30,15 +30,30 @@
 Script to generate the version, changelog and releasenotes from the git
 repository.
 """
+import abc
+import atexit
 import datetime
+import hashlib
+import heapq
+import json
 import os
+import posixpath
 import re
-from collections import OrderedDict, defaultdict
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+from collections import OrderedDict, defaultdict, deque
 from typing import (
+    Any,
+    Container,
     DefaultDict,
     Dict,
     Iterable,
+    Iterator,
     List,
+    NamedTuple,
     Optional,
     Pattern,
     Set,
@@ -47,10 +62,20 @@ from typing import (
 )
 
 import dulwich.walk
+from dulwich.index import blob_from_path_and_stat, cleanup_mode
+from dulwich.objects import ShaFile
+from dulwich.objectspec import parse_commit
 from dulwich.repo import Commit, Repo
 
+from .bundle import BundleRepo
+from .locking import atomic_write
+from .notes import NOTES_REF, NotesStore, load_notes
+from .pool import RepoHandle, RepoPath, get_bound_repo, open_new_repo
+from .profiling import count, profiled, span
+
 BUG_URL_REG: Pattern = re.compile(r".*(closes #|fixes #|adresses #)(?P<bugid>\d+)")
 VALID_TAG: Pattern = re.compile(r"^v?\d+\.\d+(\.\d+)?$")
+VALID_VERSION_SPEC: Pattern = re.compile(r"^v?\d+(\.\d+){0,2}$")
 FEAT_HEADER: Pattern = re.compile(
     r"\nsem-ver:\s*.*(feature|deprecat).*(\n|$)",
     flags=re.IGNORECASE,
@@ -58,6 +83,47 @@ FEAT_HEADER: Pattern = re.compile(
 FEAT_MSG: Pattern = re.compile(r"\n\* NEW")
 MAJOR_HEADER: Pattern = re.compile(r"\nsem-ver:\s*.*break.*(\n|$)", flags=re.IGNORECASE)
 MAJOR_MSG: Pattern = re.compile(r"\n\* INCOMPATIBLE")
+#: max number of parsed commits kept in memory by a CommitCache
+COMMIT_CACHE_SIZE: int = 10000
+#: file inside the git control dir with ``<sha> <version>`` lines to use as
+#: version anchors on shallow clones
+ANCHORS_FILE: str = os.path.join("autosemver", "anchors")
+#: file inside the git control dir where the version index is persisted
+VERSION_INDEX_FILE: str = os.path.join("autosemver", "version-index.json")
+#: file at the root of the working tree (or HEAD on bare repos) that maps
+#: the commit authors to their canonical names and emails
+MAILMAP_FILE: str = ".mailmap"
+MAILMAP_LINE: Pattern = re.compile(
+    r"^\s*([^<]*?)\s*<([^>]*)>\s*(?:([^<]*?)\s*<([^>]*)>)?"
+)
+AUTHOR_IDENTITY: Pattern = re.compile(r"^\s*(.*?)\s*<([^>]*)>\s*$")
+#: file at the root of the working tree (or HEAD on bare repos) with the
+#: rules of the commits to leave out of the versioning and the changelogs
+EXCLUDE_FILE: str = ".autosemver-exclude"
+#: type of change of the first parents whose commits are all excluded
+EXCLUDED: str = "excluded"
+#: file inside the git control dir locked while tagging
+TAGS_LOCK_FILE: str = os.path.join("autosemver", "tags")
+#: environment variable with the name of the backend to read the repos with
+BACKEND_ENV_VAR: str = "AUTOSEMVER_BACKEND"
+DULWICH_BACKEND: str = "dulwich"
+GIT_BACKEND: str = "git"
+#: proper ``(name, email)`` per lowercased ``(commit name, commit email)``
+Mailmap = Dict[Tuple[Optional[str], str], Tuple[Optional[str], Optional[str]]]
+
+
+class ShallowHistoryError(RuntimeError):
+    """
+    Raised when the history available on a shallow clone is not enough to
+    calculate the versions.
+    """
+
+
+class StaleHistoryError(RuntimeError):
+    """
+    Raised when the history can't be processed incrementally from a commit
+    processed before, ex. if it's no longer a first parent of HEAD.
+    """
 
 
 def _to_str(maybe_str: Union[bytes, str]) -> str:
@@ -89,10 +155,63 @@ def _tag2tuple(
     return maj_version, feat_version, fix_version
 
 
+def get_version_range(
+    spec: str,
+) -> Tuple[Tuple[int, int, int], Tuple[int, int, int]]:
+    """
+    Parses a version or a version range into the lowest and highest versions
+    it covers (both included). The missing numbers of a version cover all the
+    values, so ``4.12`` covers from ``4.12.0`` to any ``4.12.x``.
+
+    Args:
+        spec(str): version (ex. ``4``, ``4.12`` or ``v4.12.3``) or range of
+            versions (ex. ``4.12.1..4.13``).
+
+    Returns:
+        tuple(tuple(int, int, int), tuple(int, int, int)): lowest and highest
+            versions.
+
+    Raises:
+        ValueError: if the spec is not a valid version or range.
+    """
+    low_spec, _, high_spec = spec.partition("..")
+    high_spec = high_spec or low_spec
+    for version_spec in (low_spec, high_spec):
+        if not VALID_VERSION_SPEC.match(version_spec):
+            raise ValueError("Invalid version spec %s" % spec)
+
+    low = _tag2tuple(low_spec)
+    given_numbers = len(high_spec.split("."))
+    high = tuple(
+        number if position < given_numbers else sys.maxsize
+        for position, number in enumerate(_tag2tuple(high_spec))
+    )
+
+    return low, (high[0], high[1], high[2])
+
+
+def open_repo(repo_path: RepoPath) -> Repo:
+    """
+    Returns the git repository for the given path (that can also be a git
+    bundle file, see :mod:`autosemver.bundle`) or repo handle. If there's a
+    handle bound to the path in the current thread (ex. inside an api call),
+    that one is used, see :mod:`autosemver.pool`.
+    """
+    if isinstance(repo_path, RepoHandle):
+        return repo_path.repo
+
+    repo = get_bound_repo(repo_path)
+    if repo is None:
+        repo = open_new_repo(repo_path)
+
+    return repo
+
+
 def get_repo_object(repo: Repo, object_name: Union[str, bytes]) -> Commit:
     if isinstance(object_name, str):
         object_name = object_name.encode()
 
+    count("objects_read")
     gotten_object = repo.get_object(object_name)
     if isinstance(gotten_object, Commit):
         return gotten_object
@@ -100,6 +219,499 @@ def get_repo_object(repo: Repo, object_name: Union[str, bytes]) -> Commit:
     raise RuntimeError(f"Got non-commit object {gotten_object}")
 
 
+class WalkEntry(NamedTuple):
+    sha: str
+    parents: List[str]
+    #: parsed commit, if the backend had to read it for the walk
+    commit: Optional[Commit]
+
+
+def _parse_commit(raw: bytes) -> Commit:
+    count("objects_read")
+    commit = ShaFile.from_raw_string(Commit.type_num, raw)
+    if not isinstance(commit, Commit):
+        raise RuntimeError(f"Got non-commit object {commit}")
+
+    return commit
+
+
+class Backend(abc.ABC):
+    """
+    Access to the refs and commits of a repository, that's all the history
+    analysis needs. All the shas are hex strings.
+    """
+
+    name: str = ""
+
+    def __init__(self, repo: Repo) -> None:
+        self.repo = repo
+
+    @abc.abstractmethod
+    def get_refs(self) -> Dict[str, str]:
+        """Returns the sha each ref (including HEAD) points to."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_parents(
+        self,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        topo: bool = True,
+    ) -> Iterator[WalkEntry]:
+        """
+        Yields every commit in the history of the included commits (HEAD if
+        none passed) that is not in the history of the excluded ones, children
+        before parents if topo is True.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_first_parents(self, head: str) -> Iterator[Tuple[str, List[str]]]:
+        """Yields the sha and parents of each first parent of head."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read_raw(self, sha: str) -> bytes:
+        """
+        Returns the raw contents of the given commit.
+
+        Raises:
+            KeyError: if the commit is not in the repo.
+        """
+        raise NotImplementedError
+
+    def read_commit(self, sha: str) -> Commit:
+        return _parse_commit(self.read_raw(sha))
+
+    def read_headers(self, sha: str) -> Dict[bytes, List[bytes]]:
+        """
+        Reads the headers of a commit straight from its raw contents, without
+        parsing the message, signatures or any multi-line header.
+
+        Returns:
+            dict(bytes, list(bytes)): values of each header, in order.
+        """
+        count("objects_read")
+        headers: DefaultDict[bytes, List[bytes]] = defaultdict(list)
+        for line in self.read_raw(sha).split(b"\n\n", 1)[0].split(b"\n"):
+            if line and not line.startswith(b" "):
+                name, _, value = line.partition(b" ")
+                headers[name].append(value)
+
+        return headers
+
+    def read_message(self, sha: str) -> bytes:
+        count("objects_read")
+        return self.read_raw(sha).partition(b"\n\n")[2]
+
+    def close(self) -> None:
+        pass
+
+
+class DulwichBackend(Backend):
+    """Pure python backend, using dulwich."""
+
+    name = DULWICH_BACKEND
+
+    def get_refs(self) -> Dict[str, str]:
+        return {_to_str(ref): _to_str(sha) for ref, sha in self.repo.get_refs().items()}
+
+    def iter_parents(
+        self,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        topo: bool = True,
+    ) -> Iterator[WalkEntry]:
+        walker = self.repo.get_walker(
+            include=[sha.encode("utf-8") for sha in include] if include else None,
+            exclude=[sha.encode("utf-8") for sha in exclude] if exclude else None,
+            order=dulwich.walk.ORDER_TOPO if topo else dulwich.walk.ORDER_DATE,
+        )
+        for entry in walker:
+            count("commits_walked")
+            yield WalkEntry(
+                sha=entry.commit.sha().hexdigest(),
+                parents=[_to_str(parent) for parent in entry.commit.parents],
+                commit=entry.commit,
+            )
+
+    def iter_first_parents(self, head: str) -> Iterator[Tuple[str, List[str]]]:
+        shallow = get_shallow(self.repo)
+        sha: Optional[str] = head
+        while sha is not None:
+            count("commits_walked")
+            parents = [_to_str(parent) for parent in self.read_commit(sha).parents]
+            yield sha, parents
+            sha = parents[0] if parents and sha not in shallow else None
+
+    def read_raw(self, sha: str) -> bytes:
+        _, raw = self.repo.object_store.get_raw(sha.encode())
+        return raw
+
+    def read_commit(self, sha: str) -> Commit:
+        return get_repo_object(self.repo, sha)
+
+
+def _date_order(
+    heads: List[str], parents: Dict[str, List[str]], commit_times: Dict[str, int]
+) -> List[str]:
+    """
+    Returns the commits in the order the dulwich walker finds them, always the
+    most recent (by commit time, then sha) of the ones reached so far.
+    """
+    queue = [(-commit_times[head], head) for head in set(heads)]
+    heapq.heapify(queue)
+    reached = set(heads)
+    order: List[str] = []
+    while queue:
+        _, sha = heapq.heappop(queue)
+        order.append(sha)
+        for parent in parents[sha]:
+            if parent not in reached:
+                reached.add(parent)
+                heapq.heappush(queue, (-commit_times[parent], parent))
+
+    return order
+
+
+def _topo_order(order: List[str], parents: Dict[str, List[str]]) -> Iterator[str]:
+    """
+    Reorders the given commits so the children go before their parents,
+    keeping the given order otherwise, as the dulwich walker does.
+    """
+    todo = deque(order)
+    pending: Set[str] = set()
+    num_children: DefaultDict[str, int] = defaultdict(int)
+    for sha in order:
+        for parent in parents[sha]:
+            num_children[parent] += 1
+
+    while todo:
+        sha = todo.popleft()
+        if num_children[sha]:
+            pending.add(sha)
+            continue
+
+        for parent in parents[sha]:
+            num_children[parent] -= 1
+            if not num_children[parent] and parent in pending:
+                pending.discard(parent)
+                todo.appendleft(parent)
+
+        yield sha
+
+
+class GitCliBackend(Backend):
+    """
+    Backend driving the ``git`` binary, the walks are done by ``git rev-list``
+    and the commits are read through a long running ``git cat-file --batch``
+    process, shared by all the readers of the repo.
+    """
+
+    name = GIT_BACKEND
+
+    def __init__(self, repo: Repo) -> None:
+        super().__init__(repo)
+        self._cat_file: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _git(self, *args: str) -> List[str]:
+        return ["git", "--git-dir", self.repo.controldir()] + list(args)
+
+    def get_refs(self) -> Dict[str, str]:
+        output = subprocess.run(
+            self._git("for-each-ref", "--format=%(objectname) %(refname)"),
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        refs: Dict[str, str] = {}
+        for line in output.splitlines():
+            sha, ref = _to_str(line).split(" ", 1)
+            refs[ref] = sha
+
+        head = subprocess.run(
+            self._git("rev-parse", "--verify", "-q", "HEAD"), stdout=subprocess.PIPE
+        ).stdout.strip()
+        if head:
+            refs["HEAD"] = _to_str(head)
+
+        return refs
+
+    def _run_rev_list(self, *args: str) -> Iterator[List[str]]:
+        process = subprocess.Popen(
+            self._git("rev-list", "--parents", *args), stdout=subprocess.PIPE
+        )
+        assert process.stdout is not None
+        try:
+            for line in process.stdout:
+                count("commits_walked")
+                yield _to_str(line).split()
+        finally:
+            process.stdout.close()
+            if process.poll() is None:
+                process.kill()
+            if process.wait() > 0:
+                raise RuntimeError("Failed to run %s" % " ".join(process.args))
+
+    def _get_parents(
+        self, sha: str, shallow: Set[str], parents: List[str]
+    ) -> List[str]:
+        # git hides the parents of the shallow boundary
+        if sha in shallow:
+            return [_to_str(parent) for parent in self.read_headers(sha)[b"parent"]]
+
+        return parents
+
+    def _rev_list(self, *args: str) -> Iterator[Tuple[str, List[str]]]:
+        shallow = get_shallow(self.repo)
+        for sha, *parents in self._run_rev_list(*args):
+            yield sha, self._get_parents(sha, shallow, parents)
+
+    def _iter_topo(self, heads: List[str]) -> Iterator[WalkEntry]:
+        """
+        Walks the history in the same order as the dulwich walker, as the
+        first parents of histories with several roots depend on it.
+        """
+        shallow = get_shallow(self.repo)
+        walk_parents: Dict[str, List[str]] = {}
+        commit_times: Dict[str, int] = {}
+        for commit_time, sha, *parents in self._run_rev_list("--timestamp", *heads):
+            commit_times[sha] = int(commit_time)
+            walk_parents[sha] = parents
+
+        for sha in _topo_order(
+            _date_order(heads, walk_parents, commit_times), walk_parents
+        ):
+            yield WalkEntry(
+                sha=sha,
+                parents=self._get_parents(sha, shallow, walk_parents[sha]),
+                commit=None,
+            )
+
+    def iter_parents(
+        self,
+        include: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        topo: bool = True,
+    ) -> Iterator[WalkEntry]:
+        if topo and not exclude:
+            yield from self._iter_topo(include or [_to_str(self.repo.head())])
+            return
+
+        args = ["--topo-order"] if topo else []
+        args.extend(include or ["HEAD"])
+        args.extend("^" + sha for sha in exclude or [])
+        for sha, parents in self._rev_list(*args):
+            yield WalkEntry(sha=sha, parents=parents, commit=None)
+
+    def iter_first_parents(self, head: str) -> Iterator[Tuple[str, List[str]]]:
+        return self._rev_list("--first-parent", head)
+
+    def read_raw(self, sha: str) -> bytes:
+        with self._lock:
+            if self._cat_file is None or self._cat_file.poll() is not None:
+                self._cat_file = subprocess.Popen(
+                    self._git("cat-file", "--batch"),
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                )
+
+            assert self._cat_file.stdin and self._cat_file.stdout
+            self._cat_file.stdin.write(sha.encode() + b"\n")
+            self._cat_file.stdin.flush()
+            header = self._cat_file.stdout.readline().split()
+            if len(header) != 3:
+                raise KeyError(sha)
+
+            raw = self._cat_file.stdout.read(int(header[2]) + 1)[:-1]
+
+        if header[1] != b"commit":
+            raise RuntimeError(f"Got non-commit object {sha}")
+
+        return raw
+
+    def close(self) -> None:
+        with self._lock:
+            if self._cat_file is not None:
+                assert self._cat_file.stdin is not None
+                self._cat_file.stdin.close()
+                self._cat_file.wait()
+                self._cat_file = None
+
+
+BACKENDS: Dict[str, type] = {
+    DULWICH_BACKEND: DulwichBackend,
+    GIT_BACKEND: GitCliBackend,
+}
+_GIT_BACKENDS: Dict[str, GitCliBackend] = {}
+_GIT_BACKENDS_LOCK = threading.Lock()
+
+
+def _close_backends() -> None:
+    with _GIT_BACKENDS_LOCK:
+        for backend in _GIT_BACKENDS.values():
+            backend.close()
+        _GIT_BACKENDS.clear()
+
+
+atexit.register(_close_backends)
+
+
+def get_backend(repo: Repo, name: Optional[str] = None) -> Backend:
+    """
+    Returns the backend to access the history of the repo.
+
+    Args:
+        repo(Repo): repository to get the backend for.
+        name(str): name of the backend to use, if not passed, the one in the
+            ``AUTOSEMVER_BACKEND`` environment variable, dulwich if not set.
+            The git backend falls back to dulwich if there's no git binary,
+            or it can't read the repo (ex. git bundles).
+
+    Returns:
+        Backend: backend for the repo, the git ones are shared by all the
+            callers for the same repo.
+
+    Raises:
+        ValueError: if the backend is not known.
+    """
+    name = name or os.environ.get(BACKEND_ENV_VAR) or DULWICH_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(
+            "Unknown backend %s, should be one of %s" % (name, ", ".join(BACKENDS))
+        )
+
+    # git can't read the bundles in place
+    if name == DULWICH_BACKEND or isinstance(repo, BundleRepo):
+        return DulwichBackend(repo)
+
+    controldir = os.path.abspath(repo.controldir())
+    with _GIT_BACKENDS_LOCK:
+        if controldir not in _GIT_BACKENDS:
+            if not _can_run_git(controldir):
+                count("backend_fallbacks")
+                return DulwichBackend(repo)
+
+            _GIT_BACKENDS[controldir] = GitCliBackend(repo)
+
+        return _GIT_BACKENDS[controldir]
+
+
+def _can_run_git(controldir: str) -> bool:
+    if shutil.which("git") is None:
+        return False
+
+    try:
+        return (
+            subprocess.run(
+                ["git", "--git-dir", controldir, "rev-parse", "--git-dir"],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            ).returncode
+            == 0
+        )
+    except OSError:
+        return False
+
+
+class CommitCache:
+    """
+    Bounded LRU of parsed commits, meant to be shared by all the steps of the
+    history analysis so every commit object is read and parsed only once.
+
+    Commits can be loaded in bulk with :meth:`prefetch`, that reads them in
+    the order they are stored in the pack files, so the (mmapped) packs are
+    read sequentially instead of jumping around.
+    """
+
+    def __init__(
+        self,
+        repo: Repo,
+        max_size: int = COMMIT_CACHE_SIZE,
+        head: Optional[str] = None,
+    ) -> None:
+        self.repo = repo
+        self.backend = get_backend(repo)
+        self.max_size = max_size
+        #: revision being processed, if not HEAD, to read the rules from
+        self.head = head
+        self._commits: "OrderedDict[str, Commit]" = OrderedDict()
+        self._notes: Optional[NotesStore] = None
+        self._notes_loaded = False
+        self._exclude: Optional[ExcludeRules] = None
+
+    @property
+    def notes(self) -> Optional[NotesStore]:
+        """Notes with the classification of the commits, if the repo has them."""
+        if not self._notes_loaded:
+            self._notes = load_notes(self.repo)
+            self._notes_loaded = True
+
+        return self._notes
+
+    @property
+    def exclude(self) -> Optional["ExcludeRules"]:
+        """Rules of the commits to leave out, if the repo has any."""
+        if self._exclude is None:
+            self._exclude = read_exclude_rules(self.repo, self.head)
+
+        return self._exclude or None
+
+    def __contains__(self, sha: Union[str, bytes]) -> bool:
+        return _to_str(sha) in self._commits
+
+    def add(self, commit: Commit) -> None:
+        sha = commit.sha().hexdigest()
+        self._commits[sha] = commit
+        self._commits.move_to_end(sha)
+        while len(self._commits) > self.max_size:
+            self._commits.popitem(last=False)
+
+    def get(self, sha: Union[str, bytes]) -> Commit:
+        sha = _to_str(sha)
+        commit = self._commits.get(sha)
+        if commit is None:
+            count("commit_cache_misses")
+            commit = self._read(sha)
+            self.add(commit)
+        else:
+            count("commit_cache_hits")
+            self._commits.move_to_end(sha)
+
+        return commit
+
+    def _pack_position(self, sha: str) -> Tuple[int, int]:
+        packs = getattr(self.repo.object_store, "packs", [])
+        for pack_num, pack in enumerate(packs):
+            try:
+                return pack_num, pack.index.object_offset(sha.encode())
+            except KeyError:
+                continue
+
+        # loose objects go last
+        return len(packs), 0
+
+    def prefetch(self, shas: Iterable[Union[str, bytes]]) -> None:
+        """
+        Loads the given commits that are not cached yet, sorted by their
+        position in the pack files.
+        """
+        missing = set(_to_str(sha) for sha in shas if sha not in self)
+        count("commit_cache_misses", len(missing))
+        for sha in sorted(missing, key=self._pack_position):
+            self.add(self._read(sha))
+
+    def _read(self, sha: str) -> Commit:
+        exclude = self.exclude
+        if exclude is None:
+            return self.backend.read_commit(sha)
+
+        # the exclude rules are matched before parsing it
+        raw = self.backend.read_raw(sha)
+        exclude.excludes_raw(sha.encode("utf-8"), raw)
+        return _parse_commit(raw)
+
+
 def split_line(what: str, indent: str = "", cols: int = 79) -> Tuple[str, str]:
     """Split a line on the closest space, or break the last word with '-'.
 
@@ -182,6 +794,7 @@ def get_bugs_from_commit_msg(commit_msg: str) -> List[str]:
     return bugs
 
 
+@profiled("rendering")
 def pretty_commit(
     commit: Commit,
     version: Optional[str] = None,
@@ -243,22 +856,280 @@ def pretty_commit(
 
 def get_tags(repo: Repo) -> Dict[str, str]:
     tags: Dict[str, str] = {}
-    for tag_ref, commit in repo.get_refs().items():
-        tag_ref_str = _to_str(tag_ref)
+    for tag_ref_str, commit in get_backend(repo).get_refs().items():
         if tag_ref_str.startswith("refs/tags/") and VALID_TAG.match(
             tag_ref_str[len("refs/tags/") :]
         ):
-            tags[_to_str(commit)] = os.path.basename(tag_ref_str)
+            tags[commit] = os.path.basename(tag_ref_str)
+
+    # On shallow clones the known versions are used as if they were tags, so
+    # the versioning can start from there instead of the cut history
+    if repo.get_shallow():
+        for sha, version in get_anchors(repo).items():
+            tags.setdefault(sha, version)
 
     return tags
 
 
+def get_shallow(repo: Repo) -> Set[str]:
+    """
+    Returns the shas of the commits that are at the boundary of a shallow
+    clone (their parents are not available), empty for full clones.
+    """
+    return set(_to_str(sha) for sha in repo.get_shallow())
+
+
+def get_anchors(repo: Repo) -> Dict[str, str]:
+    """
+    Reads the version anchors for the repo, those are commits for which the
+    version is already known, stored as ``<sha> <version>`` lines in the
+    ``autosemver/anchors`` file inside the git control dir.
+
+    Args:
+        repo(Repo): repository to get the anchors for.
+
+    Returns:
+        dict(str, str): version for each anchored commit sha.
+    """
+    anchors: Dict[str, str] = {}
+    anchors_path = os.path.join(repo.controldir(), ANCHORS_FILE)
+    if not os.path.exists(anchors_path):
+        return anchors
+
+    with open(anchors_path) as anchors_fd:
+        for line in anchors_fd:
+            fields = line.split()
+            if len(fields) == 2 and VALID_TAG.match(fields[1]):
+                anchors[fields[0]] = fields[1]
+
+    return anchors
+
+
+def get_version_index_path(repo: Repo) -> str:
+    return os.path.join(repo.controldir(), VERSION_INDEX_FILE)
+
+
+def get_version_inputs_digest(
+    repo: Repo, tags: Dict[str, str], exclude: Optional["ExcludeRules"] = None
+) -> str:
+    """
+    Returns a digest of what the versions of a history depend on besides its
+    commits: the tags (with the anchors on shallow clones), the shallow
+    boundary, the notes and the exclude rules. The versions saved for a head
+    can only be reused while it does not change.
+
+    Args:
+        repo(Repo): repository the versions are computed for.
+        tags(dict(str, str)): version per sha the history is versioned with,
+            see :func:`get_tags`.
+        exclude(ExcludeRules): rules of the commits left out, if any.
+
+    Returns:
+        str: hex digest.
+    """
+    digest = hashlib.sha1()
+    for commit_sha, version in sorted(tags.items()):
+        digest.update(("tag %s %s\n" % (commit_sha, version)).encode("utf-8"))
+
+    for commit_sha in sorted(get_shallow(repo)):
+        digest.update(("shallow %s\n" % commit_sha).encode("utf-8"))
+
+    notes_sha = repo.refs[NOTES_REF] if NOTES_REF in repo.refs else b""
+    digest.update(b"notes " + notes_sha + b"\n")
+    if exclude:
+        digest.update(("exclude %s\n" % exclude.digest).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+def load_version_index(
+    repo: Repo, head: str, digest: str
+) -> Optional[List[Tuple[str, str, List[str]]]]:
+    """
+    Loads the version index persisted in the git control dir, if it was
+    generated for the given head and inputs.
+
+    Args:
+        repo(Repo): repository to load the index for.
+        head(str): sha of the commit the index should have been generated for.
+        digest(str): digest of the inputs of the versioning it should have
+            been generated with, see :func:`get_version_inputs_digest`.
+
+    Returns:
+        list(tuple(str, str, list(str))): sha, version and merged commits shas
+            of each first parent, from the oldest, or None if there's no index
+            for that head and inputs.
+    """
+    try:
+        with open(get_version_index_path(repo)) as index_fd:
+            persisted = json.load(index_fd)
+    except (OSError, ValueError):
+        return None
+
+    if (
+        not isinstance(persisted, dict)
+        or persisted.get("head") != head
+        or persisted.get("digest") != digest
+    ):
+        return None
+
+    return [
+        (commit_sha, version, children)
+        for commit_sha, version, children in persisted.get("mainline", [])
+    ]
+
+
+def save_version_index(
+    repo: Repo, head: str, digest: str, mainline: List[Tuple[str, str, List[str]]]
+) -> None:
+    """
+    Persists the given version index in the git control dir, atomically so
+    other processes can read it at any time.
+
+    Args:
+        repo(Repo): repository the index belongs to.
+        head(str): sha of the commit the index was generated for.
+        digest(str): digest of the inputs of the versioning it was generated
+            with, see :func:`get_version_inputs_digest`.
+        mainline(list(tuple(str, str, list(str)))): sha, version and merged
+            commits shas of each first parent, from the oldest.
+    """
+    atomic_write(
+        get_version_index_path(repo),
+        json.dumps({"head": head, "digest": digest, "mainline": mainline}),
+    )
+
+
+def get_head_branch(repo: Repo, rev: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the name of the branch HEAD (or the given revision) points to
+    (ex. ``release/1.2``), or None if it's detached (or not a branch).
+    """
+    if rev is not None:
+        for ref in (rev, "refs/heads/%s" % rev):
+            if ref.startswith("refs/heads/") and ref.encode("utf-8") in repo.refs:
+                return ref[len("refs/heads/") :]
+
+        return None
+
+    ref_chain, _ = repo.refs.follow(b"HEAD")
+    head_ref = _to_str(ref_chain[-1])
+    if not head_ref.startswith("refs/heads/"):
+        return None
+
+    return head_ref[len("refs/heads/") :]
+
+
+def resolve_rev(repo: Repo, rev: Union[str, bytes]) -> str:
+    """
+    Returns the sha of the commit the given revision (sha, short sha, tag,
+    branch or full ref) points to.
+
+    Raises:
+        KeyError: if the revision could not be found.
+    """
+    return parse_commit(repo, rev.encode() if isinstance(rev, str) else rev).id.decode()
+
+
+def _split_index_time(
+    index_time: Union[int, float, Tuple[int, int]],
+) -> Tuple[int, int]:
+    if isinstance(index_time, tuple):
+        return index_time[0], index_time[1]
+
+    return int(index_time), 0
+
+
+def _get_worktree_changes(repo: Repo, index: Any) -> Iterator[Tuple[bytes, bytes]]:
+    """
+    Yields the path and the current blob sha (empty if removed) of the files
+    in the working tree that differ from the index, in contents or mode.
+
+    Like git does, the files with the same size, mode and mtime as in the
+    index are considered unchanged without reading them, unless they were
+    modified after the index was written (racily clean).
+    """
+    root_path = repo.path.encode() if isinstance(repo.path, str) else repo.path
+    try:
+        index_mtime = os.stat(repo.index_path()).st_mtime
+    except OSError:
+        # no index written yet, nothing to compare against
+        return
+    for path in index:
+        entry = index[path]
+        full_path = os.path.join(root_path, path)
+        try:
+            path_stat = os.lstat(full_path)
+        except OSError:
+            yield path, b""
+            continue
+
+        entry_sec, entry_nsec = _split_index_time(entry.mtime)
+        if (
+            path_stat.st_size == entry.size
+            and cleanup_mode(path_stat.st_mode) == entry.mode
+            and int(path_stat.st_mtime) == entry_sec
+            and (not entry_nsec or path_stat.st_mtime_ns % 10**9 == entry_nsec)
+            and path_stat.st_mtime < index_mtime
+        ):
+            continue
+
+        if os.path.isdir(full_path):
+            # a submodule, not comparable by content
+            continue
+
+        blob = blob_from_path_and_stat(full_path, path_stat)
+        if blob.id != entry.sha or cleanup_mode(path_stat.st_mode) != entry.mode:
+            yield path, blob.id
+
+
+def get_dirty_hash(repo: Repo) -> Optional[str]:
+    """
+    Returns a short hash that identifies the changes in the index (against
+    HEAD) and the working tree (against the index) of the repo that are not
+    committed yet, or None if there are none. Bare repos are never dirty.
+
+    Untracked files are not taken into account.
+
+    Args:
+        repo(Repo): repository to check.
+
+    Returns:
+        str: 8 chars hash of the uncommitted changes, None if there are none.
+    """
+    if repo.bare:
+        return None
+
+    index = repo.open_index()
+    head_tree = get_repo_object(repo, repo.head()).tree
+    changes: List[bytes] = []
+    for (old_path, new_path), _, (_, new_sha) in index.changes_from_tree(
+        repo.object_store, head_tree
+    ):
+        changes.append(b"staged %s %s" % (new_path or old_path, new_sha or b""))
+
+    for path, new_sha in _get_worktree_changes(repo, index):
+        changes.append(b"unstaged %s %s" % (path, new_sha))
+
+    if not changes:
+        return None
+
+    return hashlib.sha1(b"\n".join(sorted(changes))).hexdigest()[:8]
+
+
+def is_dirty(repo: Repo) -> bool:
+    """
+    Returns True if the index or the working tree of the repo have changes
+    that are not in HEAD. Bare repos are never dirty.
+    """
+    return get_dirty_hash(repo) is not None
+
+
 def get_refs(repo: Repo) -> DefaultDict[str, Set[str]]:
     refs: DefaultDict[str, Set[str]] = defaultdict(set)
-    for ref, commit in repo.get_refs().items():
-        str_commit = _to_str(commit)
-        refs[str_commit].add(str_commit)
-        refs[str_commit].add(_to_str(ref))
+    for ref, commit in get_backend(repo).get_refs().items():
+        refs[commit].add(commit)
+        refs[commit].add(ref)
     return refs
 
 
@@ -275,121 +1146,981 @@ def fuzzy_matches_refs(fuzzy_ref: str, refs: Iterable[str]) -> bool:
     return any(fuzzy_matches_ref(fuzzy_ref, ref) for ref in refs)
 
 
-def get_children_per_parent(repo_path: str) -> DefaultDict[str, Set[str]]:
-    repo = Repo(repo_path)
+def parse_mailmap(contents: str) -> Mailmap:
+    """
+    Compiles the contents of a ``.mailmap`` file into a dict, keyed by the
+    lowercased ``(commit name, commit email)``, with the name set to None for
+    the entries that match any name, as ``git shortlog`` does.
+
+    Args:
+        contents(str): contents of the mailmap file.
+
+    Returns:
+        dict: proper ``(name, email)`` for each commit identity, any of them
+            None if it should be kept as in the commit.
+    """
+    mailmap: Mailmap = {}
+    for line in contents.splitlines():
+        match = MAILMAP_LINE.match(line.split("#", 1)[0])
+        if not match:
+            continue
+
+        proper_name, proper_email, commit_name, commit_email = match.groups()
+        if commit_email is None:
+            # only one email, it's both the proper and the commit one
+            commit_email, proper_email = proper_email, None
+
+        key = (commit_name.lower() if commit_name else None, commit_email.lower())
+        mailmap[key] = (proper_name or None, proper_email or None)
+
+    return mailmap
+
+
+def read_mailmap(repo: Repo, head: Optional[str] = None) -> Mailmap:
+    """
+    Reads the mailmap of the repo, from the working tree if any or from the
+    tree of the given commit (HEAD if not passed) for bare repos.
+
+    Args:
+        repo(Repo): repository to get the mailmap for.
+        head(str): sha of the commit to get the mailmap from on bare repos.
+
+    Returns:
+        dict: compiled mailmap, see :func:`parse_mailmap`, empty if the repo
+            has none.
+    """
+    contents = _read_root_file(repo, MAILMAP_FILE, head)
+    return parse_mailmap(contents) if contents is not None else {}
+
+
+def _read_root_file(
+    repo: Repo, name: str, head: Optional[str] = None, from_tree: bool = False
+) -> Optional[str]:
+    """
+    Returns the contents of a file at the root of the working tree, or of the
+    tree of the given commit (HEAD if not passed) on bare repos or if
+    from_tree is set, None if there's no such file.
+    """
+    if not repo.bare and not from_tree:
+        path = os.path.join(repo.path, name)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, encoding="utf-8", errors="replace") as file_fd:
+            return file_fd.read()
+
+    try:
+        tree = repo[get_repo_object(repo, head or repo.head()).tree]
+        _, blob_sha = tree[name.encode()]
+    except KeyError:
+        return None
+
+    return repo[blob_sha].data.decode("utf-8", errors="replace")
+
+
+class ExcludeRules:
+    """
+    Rules of the commits to leave out, ex. the ones from bots. They are
+    matched against the raw author, committer and subject headers of the
+    commits as they are read, before parsing them, so the excluded ones are
+    never decoded nor classified.
+
+    The excluded commits are still part of the history, but their type of
+    change is ignored, and they are not in the changelogs. A first parent
+    whose commits (itself and the ones it merged) are all excluded does not
+    change the version, unless bump is set, then it's counted as a bugfix.
+    """
+
+    def __init__(
+        self,
+        authors: Iterable[bytes] = (),
+        committers: Iterable[bytes] = (),
+        subjects: Iterable[bytes] = (),
+        bump: bool = False,
+    ) -> None:
+        self.authors = [re.compile(author) for author in authors]
+        self.committers = [re.compile(committer) for committer in committers]
+        self.subjects = tuple(subjects)
+        self.bump = bump
+        #: whether each of the commits checked so far is excluded, by sha
+        self._decisions: Dict[bytes, bool] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.authors or self.committers or self.subjects)
+
+    @property
+    def digest(self) -> str:
+        """Hex digest of the rules, to tell when they change."""
+        rules = (
+            [author.pattern for author in self.authors],
+            [committer.pattern for committer in self.committers],
+            list(self.subjects),
+            self.bump,
+        )
+        return hashlib.sha1(repr(rules).encode("utf-8")).hexdigest()
+
+    def excludes_raw(self, sha: bytes, raw: bytes) -> bool:
+        """
+        Matches the rules against the raw contents of a commit, before it's
+        parsed, and remembers the result for :meth:`excludes`.
+        """
+        excluded = self._decisions.get(sha)
+        if excluded is None:
+            headers, _, message = raw.partition(b"\n\n")
+            excluded = self._decisions[sha] = (
+                any(
+                    author.search(_get_raw_identity(headers, b"author"))
+                    for author in self.authors
+                )
+                or any(
+                    committer.search(_get_raw_identity(headers, b"committer"))
+                    for committer in self.committers
+                )
+                or (bool(self.subjects) and message.lstrip().startswith(self.subjects))
+            )
+
+        return excluded
+
+    def excludes(self, commit: Commit) -> bool:
+        excluded = self._decisions.get(commit.id)
+        if excluded is None:
+            # not read through a CommitCache, its raw contents are still there
+            excluded = self.excludes_raw(commit.id, commit.as_raw_string())
+
+        if excluded:
+            count("commits_excluded")
+
+        return excluded
+
+
+def _get_raw_identity(headers: bytes, name: bytes) -> bytes:
+    """
+    Returns the ``Name <email>`` of the given identity header (author or
+    committer) of the raw headers of a commit, without its date.
+    """
+    start = headers.find(b"\n%s " % name)
+    if start == -1:
+        return b""
+
+    start += len(name) + 2
+    end = headers.find(b"\n", start)
+    line = headers[start:] if end == -1 else headers[start:end]
+    return line.rsplit(b" ", 2)[0]
+
+
+def parse_exclude_rules(contents: str) -> ExcludeRules:
+    """
+    Parses the contents of an exclude file, with one rule per line, any of::
+
+        author <regex>
+        committer <regex>
+        subject <prefix>
+        versioning skip|bump
+
+    The author and committer regexes are searched for in the ``Name <email>``
+    of the commits, and the subject prefix must be at the start of the
+    message. The versioning rule sets what happens to the first parents with
+    only excluded commits, see :class:`ExcludeRules`.
+
+    Raises:
+        ValueError: if any of the lines is not a valid rule.
+    """
+    rules: Dict[str, List[bytes]] = {"author": [], "committer": [], "subject": []}
+    bump = False
+    for line in contents.splitlines():
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+
+        kind, _, value = line.strip().partition(" ")
+        value = value.strip()
+        if kind in rules and value:
+            rules[kind].append(value.encode("utf-8"))
+        elif kind == "versioning" and value in ("skip", "bump"):
+            bump = value == "bump"
+        else:
+            raise ValueError("Invalid rule in %s: %s" % (EXCLUDE_FILE, line))
+
+    return ExcludeRules(
+        authors=rules["author"],
+        committers=rules["committer"],
+        subjects=rules["subject"],
+        bump=bump,
+    )
+
+
+def read_exclude_rules(repo: Repo, head: Optional[str] = None) -> ExcludeRules:
+    """
+    Reads the exclude rules of the repo from the ``.autosemver-exclude``
+    file, see :func:`parse_exclude_rules`, from the tree of the given commit
+    if passed, or else from the working tree if any or the tree of HEAD for
+    bare repos.
+
+    Returns:
+        ExcludeRules: the rules, empty if the repo has no exclude file.
+    """
+    contents = _read_root_file(repo, EXCLUDE_FILE, head, from_tree=head is not None)
+    return parse_exclude_rules(contents) if contents is not None else ExcludeRules()
+
+
+def canonical_author(author: str, mailmap: Mailmap) -> str:
+    """
+    Returns the ``Name <email>`` author with the name and email replaced by
+    the proper ones from the mailmap, if it has any entry for it.
+    """
+    match = AUTHOR_IDENTITY.match(author)
+    if not mailmap or not match:
+        return author
+
+    name, email = match.groups()
+    proper = mailmap.get((name.lower(), email.lower())) or mailmap.get(
+        (None, email.lower())
+    )
+    if proper is None:
+        return author
+
+    return "%s <%s>" % (proper[0] or name, proper[1] or email)
+
+
+def split_identity(identity: bytes) -> Tuple[str, int]:
+    """
+    Splits an ``author``/``committer`` header in the ``Name <email>`` and the
+    timestamp.
+    """
+    person, timestamp, _ = identity.rsplit(b" ", 2)
+    return _to_str(person), int(timestamp)
+
+
+@profiled("iter_commit_headers")
+def iter_commit_headers(
+    repo: Repo, head: Optional[str] = None
+) -> Iterator[Tuple[str, Dict[bytes, List[bytes]]]]:
+    """
+    Yields the sha and headers of every commit in the history of the given
+    commit (HEAD if not passed), reading only the headers of each of them,
+    see :meth:`Backend.read_headers`. Stops at the shallow boundary, if any.
+    """
+    backend = get_backend(repo)
+    shallow = get_shallow(repo)
+    pending = [head or _to_str(repo.head())]
+    seen: Set[str] = set()
+    while pending:
+        sha = pending.pop()
+        if sha in seen:
+            continue
+
+        seen.add(sha)
+        headers = backend.read_headers(sha)
+        yield sha, headers
+        if sha not in shallow:
+            pending.extend(_to_str(parent) for parent in headers[b"parent"])
+
+
+class AuthorStats:
+    """
+    Streaming aggregator of the authors of a set of commits, canonicalized
+    with the given mailmap. Every commit is counted once, no matter how many
+    times it's added, and only the canonical name of each distinct raw author
+    is computed.
+    """
+
+    def __init__(self, mailmap: Optional[Mailmap] = None) -> None:
+        self.mailmap = mailmap or {}
+        #: commits, first and last author timestamps of each author
+        self.stats: Dict[str, Tuple[int, int, int]] = {}
+        self._canonical: Dict[str, str] = {}
+        self._seen: Set[str] = set()
+
+    def add(self, sha: Union[str, bytes], author: Union[str, bytes], timestamp: int):
+        sha = _to_str(sha)
+        if sha in self._seen:
+            return
+
+        self._seen.add(sha)
+        author = _to_str(author)
+        canonical = self._canonical.get(author)
+        if canonical is None:
+            canonical = self._canonical[author] = canonical_author(author, self.mailmap)
+
+        commits, first_seen, last_seen = self.stats.get(
+            canonical, (0, timestamp, timestamp)
+        )
+        self.stats[canonical] = (
+            commits + 1,
+            min(first_seen, timestamp),
+            max(last_seen, timestamp),
+        )
+
+    def add_commit(self, commit: Commit) -> None:
+        self.add(commit.id, commit.author, commit.author_time)
+
+    def get_authors(self) -> List[str]:
+        return sorted(self.stats)
+
+
+@profiled("get_children_per_parent")
+def get_children_per_parent(
+    repo_path: RepoPath, head: Optional[str] = None, heads: Optional[List[str]] = None
+) -> DefaultDict[str, Set[str]]:
+    repo = open_repo(repo_path)
     children_per_parent: DefaultDict[str, Set[str]] = defaultdict(set)
 
-    for entry in repo.get_walker(order=dulwich.walk.ORDER_TOPO):
-        for parent in entry.commit.parents:
-            children_per_parent[_to_str(parent)].add(entry.commit.sha().hexdigest())
+    if heads is None and head is not None:
+        heads = [head]
+
+    for entry in get_backend(repo).iter_parents(heads):
+        for parent in entry.parents:
+            children_per_parent[parent].add(entry.sha)
 
     return children_per_parent
 
 
-def get_first_parents(repo_path: str) -> List[str]:
-    repo = Repo(repo_path)
+@profiled("get_first_parents")
+def get_first_parents(
+    repo_path: RepoPath,
+    commits: Optional[CommitCache] = None,
+    head: Optional[str] = None,
+) -> List[str]:
+    repo = open_repo(repo_path)
+    shallow = get_shallow(repo)
     #: these are the commits that are parents of more than one other commit
     first_parents: List[str] = []
+    seen: Set[str] = set()
     on_merge = False
 
-    for entry in repo.get_walker(order=dulwich.walk.ORDER_TOPO):
-        commit = entry.commit
-        # In order to properly work on python 2 and 3 we need some utf magic
-        parents = commit.parents and [_to_str(i) for i in commit.parents]
-        if not parents:
-            if commit.sha().hexdigest() not in first_parents:
-                first_parents.append(commit.sha().hexdigest())
+    def add_first_parent(sha: str) -> None:
+        if sha not in seen:
+            seen.add(sha)
+            first_parents.append(sha)
+
+    for entry in get_backend(repo).iter_parents([head] if head is not None else None):
+        sha, parents = entry.sha, entry.parents
+        # the parents of the shallow boundary are not there
+        if sha in shallow:
+            if not on_merge:
+                add_first_parent(sha)
+        elif not parents:
+            add_first_parent(sha)
         elif len(parents) == 1 and not on_merge:
-            if commit.sha().hexdigest() not in first_parents:
-                first_parents.append(commit.sha().hexdigest())
-            if parents[0] not in first_parents:
-                first_parents.append(parents[0])
+            add_first_parent(sha)
+            add_first_parent(parents[0])
         elif len(parents) > 1 and not on_merge:
             on_merge = True
-            if commit.sha().hexdigest() not in first_parents:
-                first_parents.append(commit.sha().hexdigest())
-            if parents[0] not in first_parents:
-                first_parents.append(parents[0])
-        elif parents and commit.sha().hexdigest() in first_parents:
-            if parents[0] not in first_parents:
-                first_parents.append(parents[0])
+            add_first_parent(sha)
+            add_first_parent(parents[0])
+        elif parents and sha in seen:
+            add_first_parent(parents[0])
 
-    return first_parents
+        # save reading the first parents again later
+        if commits is not None and entry.commit and sha in seen:
+            commits.add(entry.commit)
 
-
-def has_firstparent_child(
-    sha: str,
-    first_parents: List[str],
-    parents_per_child: DefaultDict[str, Set[str]],
-) -> bool:
-    return any(child for child in parents_per_child[sha] if child in first_parents)
+    return first_parents
 
 
+@profiled("get_merged_commits")
 def get_merged_commits(
     repo: Repo,
     commit: Commit,
-    first_parents: List[str],
-    children_per_parent: DefaultDict[str, Set[str]],
+    first_parents: Container[str],
+    shallow: Optional[Set[str]] = None,
+    commits: Optional[CommitCache] = None,
 ) -> Set[str]:
     merge_children: Set[str] = set()
+    if commits is None:
+        commits = CommitCache(repo)
 
     to_explore: Set[str] = set([commit.sha().hexdigest()])
 
     while to_explore:
-        next_sha = to_explore.pop()
-        try:
-            next_commit = get_repo_object(repo, next_sha)
-        except KeyError:
-            continue
-
-        if (
-            next_sha not in first_parents
-            and not has_firstparent_child(next_sha, first_parents, children_per_parent)
-            or next_sha.encode("utf-8") in commit.parents
-        ):
-            merge_children.add(next_sha)
+        # load the whole next level of the merged branches in one go
+        commits.prefetch(to_explore)
+        next_level: Set[str] = set()
+        for next_sha in to_explore:
+            next_commit = commits.get(next_sha)
+
+            if (
+                next_sha not in first_parents
+                or next_sha.encode("utf-8") in commit.parents
+            ):
+                merge_children.add(next_sha)
+
+            if shallow and _to_str(next_sha) in shallow:
+                continue
+
+            non_first_parents = (
+                parent
+                for parent in next_commit.parents
+                if _to_str(parent) not in first_parents
+            )
+            for child_sha in non_first_parents:
+                if child_sha != next_sha:
+                    next_level.add(child_sha)
 
-        non_first_parents = (
-            parent
-            for parent in next_commit.parents
-            if _to_str(parent) not in first_parents
-        )
-        for child_sha in non_first_parents:
-            if child_sha not in merge_children and child_sha != next_sha:
-                to_explore.add(child_sha)
+        to_explore = next_level - merge_children
 
     return merge_children
 
 
-def get_children_per_first_parent(repo_path: str) -> "OrderedDict[str, List[Commit]]":
-    repo = Repo(repo_path)
-    first_parents = get_first_parents(repo_path)
-    children_per_parent = get_children_per_parent(repo_path)
+def sort_commits(
+    commits: CommitCache, shas: Iterable[Union[str, bytes]]
+) -> List[Commit]:
+    """
+    Returns the given commits newest first, so the merged commits are always
+    listed in the same order.
+    """
+    return sorted(
+        (commits.get(sha) for sha in shas),
+        key=lambda commit: (commit.commit_time, commit.id),
+        reverse=True,
+    )
+
+
+def get_children_per_first_parent(
+    repo_path: RepoPath,
+    commits: Optional[CommitCache] = None,
+    head: Optional[str] = None,
+) -> "OrderedDict[str, List[Commit]]":
+    repo = open_repo(repo_path)
+    if commits is None:
+        commits = CommitCache(repo)
+    shallow = get_shallow(repo)
+    first_parents = get_first_parents(repo_path, commits=commits, head=head)
+    first_parents_set = set(first_parents)
     children_per_first_parent: "OrderedDict[str, List[Commit]]" = OrderedDict()
 
     for first_parent in first_parents:
-        try:
-            commit = get_repo_object(repo, first_parent)
-        except KeyError:
-            continue
+        commit = commits.get(first_parent)
+
+        if len(commit.parents) > 1:
+            children = get_merged_commits(
+                repo=repo,
+                commit=commit,
+                first_parents=first_parents_set,
+                shallow=shallow,
+                commits=commits,
+            )
+        else:
+            children = set()
+
+        children_per_first_parent[first_parent] = sort_commits(commits, children)
+
+    if shallow:
+        children_per_first_parent = cut_at_anchor(
+            children_per_first_parent=children_per_first_parent,
+            tags=get_tags(repo),
+            shallow=shallow,
+        )
+
+    return children_per_first_parent
+
+
+def iter_children_per_first_parent(
+    repo_path: RepoPath,
+    commits: Optional[CommitCache] = None,
+    head: Optional[str] = None,
+) -> Iterator[Tuple[str, List[Commit]]]:
+    """
+    Same as :func:`get_children_per_first_parent`, but yielding the first
+    parents from the oldest, and only keeping the shas of the first parents
+    and the merged commits in memory, the merged commits are read again (if
+    they are no longer cached) when their merge is reached.
+
+    Before yielding the first one, the first parents and the merged commits
+    of every merge are walked, as a root of an unrelated history among them
+    changes the order of the whole history, so the time to the first one and
+    the memory are still proportional to the history. The shas of each merge
+    are dropped once it's yielded.
+    """
+    repo = open_repo(repo_path)
+    if commits is None:
+        commits = CommitCache(repo)
+    head = head or _to_str(repo.head())
+
+    with span("first_parents"):
+        chain: List[str] = []
+        merges: Set[str] = set()
+        for sha, parents in commits.backend.iter_first_parents(head):
+            chain.append(sha)
+            if len(parents) > 1:
+                merges.add(sha)
+
+    # shallow clones are cut at the anchors, they need the whole history
+    if get_shallow(repo):
+        yield from _iter_whole_history(repo_path, commits, head)
+        return
+
+    first_parents = set(chain)
+    merged_per_merge: Dict[str, Set[str]] = {}
+    for sha in merges:
+        merged = get_merged_commits(
+            repo=repo,
+            commit=commits.get(sha),
+            first_parents=first_parents,
+            commits=commits,
+        )
+        # the roots of the unrelated histories that were merged are first
+        # parents too, that needs the whole history, so all the merges have
+        # to be walked before yielding anything
+        if any(not commits.get(child).parents for child in merged):
+            yield from _iter_whole_history(repo_path, commits, head)
+            return
+
+        merged_per_merge[sha] = merged
+
+    while chain:
+        sha = chain.pop()
+        yield sha, sort_commits(commits, merged_per_merge.pop(sha, ()))
+
+
+def _iter_whole_history(
+    repo_path: RepoPath, commits: CommitCache, head: str
+) -> Iterator[Tuple[str, List[Commit]]]:
+    history = get_children_per_first_parent(repo_path, commits=commits, head=head)
+    yield from reversed(history.items())
+
+
+class _FirstParentsSince:
+    """
+    The first parents of a head, as the new ones since a base commit, the
+    ones of the base commit walked so far, and the root commits.
+    """
+
+    def __init__(
+        self,
+        new_first_parents: Set[str],
+        base_first_parents: Set[str],
+        commits: CommitCache,
+    ) -> None:
+        self.new_first_parents = new_first_parents
+        self.base_first_parents = base_first_parents
+        self.commits = commits
 
+    def __contains__(self, sha: object) -> bool:
+        if not isinstance(sha, str):
+            return False
+
+        return (
+            sha in self.new_first_parents
+            or sha in self.base_first_parents
+            or not self.commits.get(sha).parents
+        )
+
+
+@profiled("get_children_per_first_parent_since")
+def get_children_per_first_parent_since(
+    repo_path: RepoPath,
+    base: str,
+    commits: Optional[CommitCache] = None,
+    head: Optional[str] = None,
+    tags: Optional[Dict[str, str]] = None,
+    base_tags: Optional[Dict[str, str]] = None,
+) -> "OrderedDict[str, List[Commit]]":
+    """
+    Same as :func:`get_children_per_first_parent`, but only for the first
+    parents newer than the given base one. Only the commits that are not in
+    the history of the base are walked, and the first parents of the base as
+    far as the new commits branched from them.
+
+    Args:
+        repo_path(str): path to the git repository.
+        base(str): sha of the first parent to start after.
+        commits(CommitCache): cache to read the commits from.
+        head(str): sha of the commit to get the history of, HEAD if None.
+        tags(dict(str, str)): current tags, to check against base_tags.
+        base_tags(dict(str, str)): tags when the base was processed, if
+            passed, any change to the tags of the base history (that would
+            change its versions) is an error.
+
+    Returns:
+        OrderedDict(str, list(Commit)): merged commits of each of the new
+            first parents, newest first.
+
+    Raises:
+        StaleHistoryError: if the base is not a first parent of the head, the
+            new commits bring in an unrelated history, the tags of the base
+            history changed or it's a shallow clone.
+    """
+    repo = open_repo(repo_path)
+    if commits is None:
+        commits = CommitCache(repo)
+    if get_shallow(repo):
+        raise StaleHistoryError("Shallow clones can't be processed incrementally")
+
+    head = head or _to_str(repo.head())
+    backend = commits.backend
+    #: parents of each of the new commits
+    new_commits: Dict[str, List[str]] = {}
+    children_per_parent: DefaultDict[str, Set[str]] = defaultdict(set)
+    for entry in backend.iter_parents([head], exclude=[base], topo=False):
+        if not entry.parents:
+            raise StaleHistoryError(
+                "Commit %s is not in the same history as %s" % (entry.sha, base)
+            )
+
+        if entry.commit is not None:
+            commits.add(entry.commit)
+        new_commits[entry.sha] = entry.parents
+        for parent in entry.parents:
+            children_per_parent[parent].add(entry.sha)
+
+    new_first_parents: List[str] = []
+    commit_sha = head
+    while commit_sha != base:
+        if commit_sha not in new_commits:
+            raise StaleHistoryError(
+                "Commit %s is not a first parent of %s" % (base, head)
+            )
+
+        new_first_parents.append(commit_sha)
+        commit_sha = new_commits[commit_sha][0]
+
+    if base_tags is not None:
+        changed_tags = set(
+            tag_sha
+            for tag_sha in set(tags or {}) | set(base_tags)
+            if (tags or {}).get(tag_sha) != base_tags.get(tag_sha)
+        )
+        if not changed_tags.issubset(new_first_parents):
+            raise StaleHistoryError("The tags of the history of %s changed" % base)
+
+    # the merged commits are explored until reaching a first parent, so the
+    # ones of the base are needed only until the new commits branched from
+    # them
+    pending = set(children_per_parent) - new_commits.keys()
+    base_first_parents: Set[str] = set()
+    if pending:
+        for sha, _ in backend.iter_first_parents(base):
+            base_first_parents.add(sha)
+            pending.discard(sha)
+            if not pending:
+                break
+
+    first_parents = _FirstParentsSince(
+        new_first_parents=set(new_first_parents),
+        base_first_parents=base_first_parents,
+        commits=commits,
+    )
+    children_per_first_parent: "OrderedDict[str, List[Commit]]" = OrderedDict()
+    for first_parent in new_first_parents:
+        commit = commits.get(first_parent)
         if len(commit.parents) > 1:
             children = get_merged_commits(
                 repo=repo,
                 commit=commit,
                 first_parents=first_parents,
-                children_per_parent=children_per_parent,
+                commits=commits,
             )
         else:
             children = set()
 
-        children_per_first_parent[first_parent] = [
-            get_repo_object(repo, child) for child in children
-        ]
+        children_per_first_parent[first_parent] = sort_commits(commits, children)
 
     return children_per_first_parent
 
 
+class _FirstParentsView:
+    """
+    The first parents of a commit, as a view of the first parents (oldest
+    first) of a descendant of it, given the position of every first parent
+    in those.
+    """
+
+    def __init__(
+        self, chain: List[str], positions: Dict[str, Tuple[str, int]], depth: int
+    ) -> None:
+        self.chain = chain
+        self.positions = positions
+        self.depth = depth
+
+    def __contains__(self, sha: object) -> bool:
+        position = self.positions.get(sha)  # type: ignore
+        return (
+            position is not None
+            and position[1] <= self.depth
+            and self.chain[position[1]] == sha
+        )
+
+
+def _get_shared_first_parents(
+    repo: Repo, heads: List[str], commits: CommitCache
+) -> Optional[Tuple[Dict[str, List[str]], Dict[str, List[Commit]]]]:
+    """
+    Follows the first parents of each head only until reaching the ones
+    already seen for the previous heads. Returns None if any of them merges
+    an unrelated history, as its root would be a first parent too.
+    """
+    chains: Dict[str, List[str]] = {}
+    children_per_first_parent: Dict[str, List[Commit]] = {}
+    # head and position in its first parents of every first parent seen
+    positions: Dict[str, Tuple[str, int]] = {}
+
+    for head in heads:
+        tail: List[str] = []
+        merges: List[str] = []
+        sha: Optional[str] = None
+        for first_parent, parents in commits.backend.iter_first_parents(head):
+            if first_parent in positions:
+                sha = first_parent
+                break
+
+            tail.append(first_parent)
+            if len(parents) > 1:
+                merges.append(first_parent)
+
+        if sha is None:
+            chain = []
+        else:
+            shared_head, depth = positions[sha]
+            chain = chains[shared_head][: depth + 1]
+
+        chain.extend(reversed(tail))
+        chains[head] = chain
+        for depth in range(len(chain) - len(tail), len(chain)):
+            positions[chain[depth]] = (head, depth)
+            children_per_first_parent[chain[depth]] = []
+
+        for merge_sha in merges:
+            children = sort_commits(
+                commits,
+                get_merged_commits(
+                    repo=repo,
+                    commit=commits.get(merge_sha),
+                    first_parents=_FirstParentsView(
+                        chain, positions, positions[merge_sha][1]
+                    ),
+                    commits=commits,
+                ),
+            )
+            if any(not child.parents for child in children):
+                return None
+
+            children_per_first_parent[merge_sha] = children
+
+    return chains, children_per_first_parent
+
+
+@profiled("get_first_parent_histories")
+def get_first_parent_histories(
+    repo_path: RepoPath, heads: List[str], commits: Optional[CommitCache] = None
+) -> Tuple[Dict[str, List[str]], Dict[str, List[Commit]]]:
+    """
+    Same as :func:`get_children_per_first_parent` for several heads at once,
+    but reading the first parents they share, and the commits merged into
+    them, only once.
+
+    Args:
+        repo_path(str): path to the git repository.
+        heads(list(str)): shas of the commits to get the history of.
+        commits(CommitCache): cache to read the commits from.
+
+    Returns:
+        tuple(dict(str, list(str)), dict(str, list(Commit))): first parents
+            of each head (oldest first), and the merged commits of each of
+            those first parents.
+    """
+    repo = open_repo(repo_path)
+    if commits is None:
+        commits = CommitCache(repo)
+
+    # on shallow clones the history is cut at a different place for each head
+    if not get_shallow(repo):
+        histories = _get_shared_first_parents(repo, heads, commits)
+        if histories is not None:
+            return histories
+
+    chains: Dict[str, List[str]] = {}
+    children_per_first_parent: Dict[str, List[Commit]] = {}
+    for head in heads:
+        history = get_children_per_first_parent(repo_path, commits=commits, head=head)
+        chains[head] = list(reversed(history))
+        children_per_first_parent.update(history)
+
+    return chains, children_per_first_parent
+
+
+def cut_at_anchor(
+    children_per_first_parent: "OrderedDict[str, List[Commit]]",
+    tags: Dict[str, str],
+    shallow: Set[str],
+) -> "OrderedDict[str, List[Commit]]":
+    """
+    Drops the history of a shallow clone that is older than the newest
+    commit with a known version (a tag or an anchor), as the versions of
+    those commits can't be calculated without the missing history.
+
+    Args:
+        children_per_first_parent(OrderedDict): first parents (newest first)
+            and their merged commits, as returned by
+            :func:`get_children_per_first_parent`.
+        tags(dict): known versions per commit sha.
+        shallow(set): shas of the commits at the shallow boundary.
+
+    Returns:
+        OrderedDict: the given history up to the anchor, included.
+
+    Raises:
+        ShallowHistoryError: if there's no anchor before the shallow boundary
+            is reached.
+    """
+    cut_history: "OrderedDict[str, List[Commit]]" = OrderedDict()
+    for commit_sha, children in children_per_first_parent.items():
+        cut_history[commit_sha] = children
+        if commit_sha in tags:
+            return cut_history
+
+        truncated = [
+            child.sha().hexdigest()
+            for child in children
+            if child.sha().hexdigest() in shallow
+        ]
+        if commit_sha in shallow or truncated:
+            raise ShallowHistoryError(
+                "The shallow clone history is cut at %s before reaching any "
+                "tag or version anchor, fetch more history (git fetch "
+                "--deepen/--unshallow) or add an anchor to the %s file."
+                % ((truncated or [commit_sha])[0], ANCHORS_FILE)
+            )
+
+    return cut_history
+
+
+def split_path(path: str) -> Tuple[bytes, ...]:
+    """
+    Splits a path relative to the root of the repo into the names of the tree
+    entries to follow, the root of the repo being the empty tuple.
+
+    Raises:
+        ValueError: if the path points outside of the repo.
+    """
+    path = posixpath.normpath(path.replace(os.sep, "/").strip("/") or ".")
+    if path == ".." or path.startswith("../"):
+        raise ValueError("The path %s is outside of the repo" % path)
+
+    if path == ".":
+        return ()
+
+    return tuple(name.encode("utf-8") for name in path.split("/"))
+
+
+class PathTrie:
+    """
+    Prefix tree of the paths of some subprojects, each node is a tree entry
+    name with the subprojects rooted there.
+    """
+
+    def __init__(self) -> None:
+        self.children: Dict[bytes, "PathTrie"] = {}
+        self.subprojects: Set[str] = set()
+        #: subprojects rooted at this node or under it
+        self.all_subprojects: Set[str] = set()
+
+    def add(self, names: Tuple[bytes, ...], subproject: str) -> None:
+        node = self
+        node.all_subprojects.add(subproject)
+        for name in names:
+            node = node.children.setdefault(name, PathTrie())
+            node.all_subprojects.add(subproject)
+
+        node.subprojects.add(subproject)
+
+
+class PathRouter:
+    """
+    Tells which subprojects (each one a set of paths of the repo) each commit
+    changed, that is, which ones have any of their paths different than in
+    the first parent of the commit.
+
+    The trees of both commits are compared at once for all the subprojects,
+    following a trie of their paths one level at a time, and stopping at the
+    subtrees that have the same id on both, or that only hold subprojects
+    already known to be changed, so the unchanged subtrees are never read.
+    The entries found for each tree id and name are cached, as consecutive
+    commits share most of their trees.
+    """
+
+    def __init__(self, commits: CommitCache, path_map: Dict[str, List[str]]) -> None:
+        self.commits = commits
+        self.trie = PathTrie()
+        for subproject, paths in path_map.items():
+            for path in paths:
+                self.trie.add(split_path(path), subproject)
+
+        self._entries: Dict[Tuple[bytes, bytes], Optional[Tuple[int, bytes]]] = {}
+        self._routes: Dict[str, Set[str]] = {}
+
+    def _get_entry(
+        self, entry: Optional[Tuple[int, bytes]], name: bytes
+    ) -> Optional[Tuple[int, bytes]]:
+        """Returns the mode and id of the named entry in the given tree entry."""
+        if entry is None or not stat.S_ISDIR(entry[0]):
+            return None
+
+        key = (entry[1], name)
+        if key not in self._entries:
+            count("trees_read")
+            tree = self.commits.repo.object_store[entry[1]]
+            self._entries[key] = tuple(tree[name]) if name in tree else None
+
+        return self._entries[key]
+
+    def _diff(
+        self,
+        node: PathTrie,
+        entry: Optional[Tuple[int, bytes]],
+        other_entry: Optional[Tuple[int, bytes]],
+        changed: Set[str],
+    ) -> None:
+        if entry == other_entry:
+            return
+
+        changed.update(node.subprojects)
+        for name, child in node.children.items():
+            if not child.all_subprojects <= changed:
+                self._diff(
+                    child,
+                    self._get_entry(entry, name),
+                    self._get_entry(other_entry, name),
+                    changed,
+                )
+
+    def changed(
+        self, tree_id: Optional[bytes], other_tree_id: Optional[bytes]
+    ) -> Set[str]:
+        """Returns the subprojects that differ between the two trees."""
+        changed: Set[str] = set()
+        self._diff(
+            self.trie,
+            (stat.S_IFDIR, tree_id) if tree_id is not None else None,
+            (stat.S_IFDIR, other_tree_id) if other_tree_id is not None else None,
+            changed,
+        )
+        return changed
+
+    def route(self, commit: Commit) -> Set[str]:
+        """Returns the subprojects the commit changed."""
+        sha = commit.sha().hexdigest()
+        if sha not in self._routes:
+            parent_tree = None
+            if commit.parents:
+                parent_tree = self.commits.get(commit.parents[0]).tree
+
+            self._routes[sha] = self.changed(commit.tree, parent_tree)
+
+        return self._routes[sha]
+
+
+class PathFilter(PathRouter):
+    """:class:`PathRouter` for a single subproject."""
+
+    def __init__(self, commits: CommitCache, paths: Iterable[str]) -> None:
+        super().__init__(commits, {"": list(paths)})
+
+    def touches(self, commit: Commit) -> bool:
+        """Tells if the commit changed any of the paths."""
+        return bool(self.route(commit))
+
+
+@profiled("versioning")
 def get_version(
     commit: Commit,
     tags: Dict[str, str],
@@ -397,12 +2128,17 @@ def get_version(
     feat_version: int = 0,
     fix_version: int = 0,
     children: Optional[List[Commit]] = None,
+    notes: Optional[NotesStore] = None,
+    exclude: Optional[ExcludeRules] = None,
 ) -> Tuple[int, int, int]:
-    commit_type: str = get_commit_type(commit, children)
+    commit_type: str = get_commit_type(commit, children, notes=notes, exclude=exclude)
     commit_sha: str = commit.sha().hexdigest()
 
     if commit_sha in tags:
         maj_version, feat_version, fix_version = _tag2tuple(tags[commit_sha])
+    elif commit_type == EXCLUDED:
+        if exclude is not None and exclude.bump:
+            fix_version += 1
     elif commit_type == "api_break":
         maj_version += 1
         feat_version = 0
@@ -431,12 +2167,21 @@ def is_feature(commit: Commit) -> bool:
     )
 
 
+@profiled("classification")
 def get_commit_type(
     commit: Commit,
     children: Optional[List[Commit]] = None,
     tags: Optional[Dict[str, str]] = None,
     prev_version: Tuple[int, int, int] = (0, 0, 0),
+    notes: Optional[NotesStore] = None,
+    exclude: Optional[ExcludeRules] = None,
 ) -> str:
+    """
+    Returns the type of change (``api_break``, ``feature`` or ``bug``) of the
+    commit and the ones it merged, the type of the commits with a note is
+    taken from it instead of their messages. The commits matching the
+    exclude rules are ignored, and if all of them do, it's ``excluded``.
+    """
     commit_sha: str = commit.sha().hexdigest()
 
     if tags and commit_sha in tags:
@@ -451,9 +2196,39 @@ def get_commit_type(
     if children:
         history_until_now = children + history_until_now
 
-    if any(is_api_break(cur_commit) for cur_commit in history_until_now):
+    if exclude is not None:
+        history_until_now = [
+            cur_commit
+            for cur_commit in history_until_now
+            if not exclude.excludes(cur_commit)
+        ]
+        if not history_until_now:
+            return EXCLUDED
+
+    commit_types = set(
+        get_own_commit_type(cur_commit, notes) for cur_commit in history_until_now
+    )
+    if "api_break" in commit_types:
+        return "api_break"
+    elif "feature" in commit_types:
+        return "feature"
+    else:
+        return "bug"
+
+
+def get_own_commit_type(commit: Commit, notes: Optional[NotesStore] = None) -> str:
+    """
+    Returns the type of change of the commit alone, from its note if any or
+    its message otherwise.
+    """
+    commit_type = notes.get_type(commit.id.decode("utf-8")) if notes else None
+    if commit_type is not None:
+        count("notes_hits")
+        return commit_type
+
+    if is_api_break(commit):
         return "api_break"
-    elif any(is_feature(cur_commit) for cur_commit in history_until_now):
+    elif is_feature(commit):
         return "feature"
     else:
         return "bug"
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""
+Helpers to write the generated files, caches and refs safely when several
+autosemver processes run at the same time on the same repository.
+
+The files are written to a temporary file that is then renamed over the
+original, so readers don't need any locking, they will see either the old or
+the new contents. Writers that need to check and update a file (ex. a cache)
+can hold a :func:`file_lock` in between.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+try:
+    import fcntl
+
+    WITH_FCNTL = True
+except ImportError:
+    # not available on windows, there the locks do nothing
+    WITH_FCNTL = False
+
+LOCK_SUFFIX = ".lock"
+DEFAULT_FILE_MODE = 0o644
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on ``<path>.lock`` while inside the block, waiting
+    for any other process holding it to release it.
+
+    Args:
+        path(str): path of the file to lock.
+    """
+    lock_path = path + LOCK_SUFFIX
+    os.makedirs(os.path.dirname(lock_path) or os.curdir, exist_ok=True)
+    with open(lock_path, "a") as lock_fd:
+        if WITH_FCNTL:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            if WITH_FCNTL:
+                fcntl.flock(lock_fd, fcntl.LOCK_UN)
+
+
+def atomic_write(path: str, contents: Union[str, bytes]) -> None:
+    """
+    Writes the given contents to a temporary file next to the given path and
+    renames it to it, so it's never seen partially written.
+
+    Args:
+        path(str): path of the file to write.
+        contents(str or bytes): contents to write, utf-8 encoded if str.
+    """
+    if isinstance(contents, str):
+        contents = contents.encode("utf-8")
+
+    directory = os.path.dirname(path) or os.curdir
+    os.makedirs(directory, exist_ok=True)
+    try:
+        mode = os.stat(path).st_mode & 0o777
+    except OSError:
+        mode = DEFAULT_FILE_MODE
+
+    tmp_fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".%s." % os.path.basename(path), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(tmp_fd, "wb") as tmp_file:
+            tmp_file.write(contents)
+
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""
+Store of the commit classifications in git notes, under
+``refs/notes/autosemver``, so they can be shared between clones just by
+fetching that ref.
+
+The note of each commit is a json dict with its type (``api_break``,
+``feature`` or ``bug``, from its own message), the ids of the bugs it fixes
+and, for the first parents, the version they got when the note was written.
+"""
+import json
+import os
+import stat
+import time
+from typing import Any, Dict, Optional
+
+from dulwich.index import commit_tree
+from dulwich.objects import Blob, Commit
+from dulwich.repo import Repo, get_user_identity
+
+NOTES_REF: bytes = b"refs/notes/autosemver"
+#: file inside the git control dir locked while writing the notes
+NOTES_LOCK_FILE: str = os.path.join("autosemver", "notes")
+COMMIT_TYPES = ("api_break", "feature", "bug")
+
+
+class NotesStore:
+    """
+    Notes of the commits of a repo. The notes tree is read as a whole the
+    first time a note is needed, each note only when it's requested.
+    """
+
+    def __init__(self, repo: Repo) -> None:
+        self.repo = repo
+        self._blobs: Optional[Dict[str, bytes]] = None
+        self._notes: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+
+    def _get_blobs(self) -> Dict[str, bytes]:
+        if self._blobs is None:
+            self._blobs = {}
+            if NOTES_REF in self.repo.refs:
+                self._read_tree(self.repo[self.repo.refs[NOTES_REF]].tree, "")
+
+        return self._blobs
+
+    def _read_tree(self, tree_sha: bytes, prefix: str) -> None:
+        assert self._blobs is not None
+        for entry in self.repo[tree_sha].items():
+            # big notes trees are split in subdirectories by the sha prefix
+            name = prefix + entry.path.decode("utf-8")
+            if stat.S_ISDIR(entry.mode):
+                self._read_tree(entry.sha, name)
+            else:
+                self._blobs[name] = entry.sha
+
+    def __contains__(self, sha: str) -> bool:
+        return sha in self._pending or sha in self._get_blobs()
+
+    def get(self, sha: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the note of the given commit, None if it has none or it was
+        not written by autosemver.
+        """
+        if sha in self._pending:
+            return self._pending[sha]
+
+        if sha not in self._notes:
+            blob_sha = self._get_blobs().get(sha)
+            if blob_sha is None:
+                return None
+
+            try:
+                note = json.loads(self.repo[blob_sha].data.decode("utf-8"))
+            except ValueError:
+                note = None
+            self._notes[sha] = note if isinstance(note, dict) else {}
+
+        return self._notes[sha] or None
+
+    def get_type(self, sha: str) -> Optional[str]:
+        """Returns the type of the given commit, if it has a note."""
+        note = self.get(sha)
+        if note is None or note.get("type") not in COMMIT_TYPES:
+            return None
+
+        return note["type"]
+
+    def set(self, sha: str, note: Dict[str, Any]) -> None:
+        """Sets the note of the given commit, until :meth:`save` is called."""
+        self._pending[sha] = note
+
+    def save(self, message: str = "Notes added by autosemver") -> int:
+        """
+        Writes the notes set since the last call in a new commit of the notes
+        ref.
+
+        Returns:
+            int: number of notes written.
+        """
+        if not self._pending:
+            return 0
+
+        blobs = dict(self._get_blobs())
+        for sha, note in self._pending.items():
+            blob = Blob.from_string(json.dumps(note, sort_keys=True).encode("utf-8"))
+            self.repo.object_store.add_object(blob)
+            blobs[sha] = blob.id
+            self._notes[sha] = note
+
+        identity = get_user_identity(self.repo.get_config_stack())
+        commit = Commit()
+        commit.tree = commit_tree(
+            self.repo.object_store,
+            [
+                (sha.encode("utf-8"), blob_sha, 0o100644)
+                for sha, blob_sha in blobs.items()
+            ],
+        )
+        commit.parents = (
+            [self.repo.refs[NOTES_REF]] if NOTES_REF in self.repo.refs else []
+        )
+        commit.author = commit.committer = identity
+        commit.author_time = commit.commit_time = int(time.time())
+        commit.author_timezone = commit.commit_timezone = 0
+        commit.encoding = b"UTF-8"
+        commit.message = message.encode("utf-8")
+        self.repo.object_store.add_object(commit)
+        self.repo.refs[NOTES_REF] = commit.id
+
+        written = len(self._pending)
+        self._blobs = blobs
+        self._pending = {}
+        return written
+
+
+def load_notes(repo: Repo) -> Optional[NotesStore]:
+    """Returns the notes of the repo, None if it has none."""
+    if NOTES_REF not in repo.refs:
+        return None
+
+    return NotesStore(repo)
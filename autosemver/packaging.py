@@ -26,19 +26,270 @@
 # In applying this license, CERN does not
 # waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
+import hashlib
+import importlib.util
+import json
 import os
+import re
 import sys
-from typing import Optional, Set
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Set, Tuple
 
 import pkg_resources
 
 from . import api
+from .locking import atomic_write, file_lock
+from .schemes import SEMVER
+
+VERSION_FILE: str = "VERSION"
+VERSION_MODULE: str = "_version.py"
+VERSION_MODULE_LINE: Pattern = re.compile(
+    r"^__version__\s*=\s*[\"']([^\"']+)[\"']", flags=re.MULTILINE
+)
+VERSION_MODULE_SHA_LINE: Pattern = re.compile(
+    r"^__git_sha__\s*=\s*[\"']([^\"']*)[\"']", flags=re.MULTILINE
+)
+VERSION_MODULE_TEMPLATE: str = """# -*- coding: utf-8 -*-
+# Generated by autosemver at build time, do not edit.
+__version__ = "%(version)s"
+__git_sha__ = "%(git_sha)s"
+__git_dirty__ = %(git_dirty)s
+"""
+#: where the results of a build step are stashed for the next ones
+BUILD_STAMP_FILE: str = os.path.join("build", "autosemver", "stamp.json")
+#: file inside the git control dir with what the changelog of a project dir
+#: was last generated from, to update it incrementally
+CHANGELOG_STATE_FILE: str = os.path.join("autosemver", "changelog-%s.json")
+#: versions already resolved on this process, per project name, project dir
+#: and repo dir
+_RESOLVED_VERSIONS: Dict[
+    Tuple[Optional[str], str, str, str, Optional[Tuple[str, ...]], Optional[str]],
+    str,
+] = {}
+
+
+def reset_version_cache() -> None:
+    """Forgets the versions resolved so far on this process."""
+    _RESOLVED_VERSIONS.clear()
+    _get_pkg_info_file.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _get_pkg_info_file(project_dir: str) -> Optional[str]:
+    """Returns the PKG-INFO file path if the project dir is a package."""
+    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
+    if os.path.exists(pkg_info_file):
+        return pkg_info_file
+
+    return None
+
+
+def _is_package(project_dir: str) -> bool:
+    return _get_pkg_info_file(os.path.abspath(project_dir)) is not None
+
+
+def _version_from_pkg_info(project_dir: str) -> Optional[str]:
+    pkg_info_file = _get_pkg_info_file(project_dir)
+    if pkg_info_file is None:
+        return None
+
+    with open(pkg_info_file) as info_fd:
+        for line in info_fd:
+            # the headers block ends on the first empty line
+            if not line.strip():
+                break
+            if line.startswith("Version: "):
+                return line.split(" ", 1)[-1].strip()
+
+    return None
+
+
+def _get_head(repo_dir: str) -> Optional[str]:
+    try:
+        return api._to_str(api.open_repo(repo_dir).head())
+    except Exception:
+        return None
+
+
+def _read_version_module(
+    version_module: str, repo_dir: Optional[str] = None
+) -> Optional[str]:
+    """
+    Reads the version from a generated version module without importing it.
+    If a repo dir is passed, the module is ignored when it was generated for
+    a different commit than the current HEAD of that repo.
+    """
+    if not os.path.exists(version_module):
+        return None
+
+    with open(version_module) as version_fd:
+        contents = version_fd.read()
+
+    version_match = VERSION_MODULE_LINE.search(contents)
+    if not version_match:
+        return None
+
+    if repo_dir is not None:
+        sha_match = VERSION_MODULE_SHA_LINE.search(contents)
+        head = _get_head(repo_dir)
+        if sha_match and head is not None and sha_match.group(1) != head:
+            return None
+
+    return version_match.group(1)
+
+
+def _version_from_files(
+    project_dir: str, package: Optional[str], repo_dir: str
+) -> Optional[str]:
+    version_modules = [os.path.join(project_dir, VERSION_MODULE)]
+    if package is not None:
+        version_modules.insert(0, os.path.join(project_dir, package, VERSION_MODULE))
+
+    for version_module in version_modules:
+        version = _read_version_module(version_module, repo_dir=repo_dir)
+        if version is not None:
+            return version
+
+    version_file = os.path.join(project_dir, VERSION_FILE)
+    if os.path.exists(version_file):
+        with open(version_file) as version_fd:
+            return version_fd.readline().strip() or None
+
+    return None
+
+
+def _version_from_installed_module(package: Optional[str]) -> Optional[str]:
+    """
+    Looks for the version module generated at build time inside the installed
+    package, without importing it.
+    """
+    if package is None:
+        return None
+
+    try:
+        spec = importlib.util.find_spec(package)
+    except (ImportError, ValueError):
+        return None
+
+    for location in (spec and spec.submodule_search_locations) or []:
+        version = _read_version_module(os.path.join(location, VERSION_MODULE))
+        if version is not None:
+            return version
+
+    return None
+
+
+def _get_stamp_key(project_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns what the results of the build steps depend on in the git repo:
+    the HEAD, the inputs of the versioning (tags, notes, exclude rules...)
+    and whether there are uncommitted changes, None if not in a git repo.
+    """
+    try:
+        repo = api.open_repo(project_dir)
+        head, dirty = api.get_head_status(repo_path=project_dir)
+        digest = api.get_version_inputs_digest(
+            repo, api.get_tags(repo), api.read_exclude_rules(repo)
+        )
+    except Exception:
+        return None
+
+    return {"head": head, "digest": digest, "dirty": dirty}
+
+
+@contextmanager
+def build_stamp_lock(project_dir: str = os.curdir) -> Iterator[bool]:
+    """
+    Holds the lock of the build stamp of the project dir while inside the
+    block, so parallel build steps generate the files only once.
+
+    Args:
+        project_dir(str): Path to the git repo of the project.
+
+    Yields:
+        bool: whether the build stamp is used, it's not in packages nor
+            outside of git repos, and then nothing is locked nor created.
+    """
+    if _is_package(project_dir) or _get_head(project_dir) is None:
+        yield False
+        return
+
+    with file_lock(os.path.join(project_dir, BUILD_STAMP_FILE)):
+        yield True
+
+
+def load_build_stamp(
+    options: Dict[str, Any], project_dir: str = os.curdir
+) -> Optional[str]:
+    """
+    Retrieves the version stashed in the build dir by a previous build step,
+    if it was for the current HEAD, tags and uncommitted changes, with the
+    same options, and all the files it generated are still there.
+
+    Args:
+        options(dict): options the build step would use.
+        project_dir(str): Path to the git repo of the project.
+
+    Returns:
+        str: the stashed version, or None if it can't be reused.
+    """
+    try:
+        with open(os.path.join(project_dir, BUILD_STAMP_FILE)) as stamp_fd:
+            stamp = json.load(stamp_fd)
+    except (OSError, ValueError):
+        return None
+
+    key = _get_stamp_key(project_dir)
+    if (
+        key is None
+        or not isinstance(stamp, dict)
+        or any(stamp.get(name) != value for name, value in key.items())
+        or stamp.get("options") != options
+        or not all(
+            os.path.exists(os.path.join(project_dir, output))
+            for output in stamp.get("outputs", [])
+        )
+    ):
+        return None
+
+    return stamp.get("version")
+
+
+def save_build_stamp(
+    version: str,
+    options: Dict[str, Any],
+    outputs: List[str],
+    project_dir: str = os.curdir,
+) -> None:
+    """
+    Stashes the version and generated files of a build step in the build dir
+    for the current HEAD, tags and uncommitted changes, if in a git repo.
+
+    Args:
+        version(str): version of the package.
+        options(dict): options used by the build step.
+        outputs(list(str)): paths of the generated files, relative to the
+            project dir.
+        project_dir(str): Path to the git repo of the project.
+    """
+    key = _get_stamp_key(project_dir)
+    if key is None:
+        return
+
+    atomic_write(
+        os.path.join(project_dir, BUILD_STAMP_FILE),
+        json.dumps(dict(key, options=options, version=version, outputs=outputs)),
+    )
 
 
 def get_current_version(
     project_name: Optional[str] = None,
     project_dir: str = os.curdir,
     repo_dir: Optional[str] = None,
+    version_scheme: str = SEMVER,
+    paths: Optional[List[str]] = None,
+    package: Optional[str] = None,
 ) -> str:
     """
     Retrieves the version of the package, checking in this order of priority:
@@ -46,17 +297,40 @@ def get_current_version(
     * From an environment variable named ${project_name}_VERSION (all in caps)
       if project_name was specified.
     * From the PKG-INFO file if inside a packaged distro.
-    * From the git history.
+    * From a ``${package}/_version.py`` or ``_version.py`` module
+      generated at build time (if it was generated for the current HEAD), or
+      a ``VERSION`` file.
+    * From the ``_version.py`` module generated at build time inside the
+      installed package, if the package or project_name were specified and
+      the repo dir is not a git repo.
+    * From the version index cached in the git directory for the current
+      HEAD and tags, or the git history (caching it there).
+    * From the installed package metadata if project_name was specified.
+
+    Except for the environment variable, the result is memoized for the rest
+    of the process, see :func:`reset_version_cache`.
 
     Args:
         project_name(str): Name of the project to get the version for, if none
             passed, will not use any environment variable override.
+        version_scheme(str): versioning scheme to use when getting the
+            version from the git history, see :mod:`autosemver.schemes`.
+        paths(list(str)): if passed, the version from the git history only
+            counts the commits that changed something under those paths of
+            the repo (ex. the directory of the package in a monorepo), and
+            the version index is not used.
+        package(str): top level package the version module is generated in
+            (see :func:`autosemver.get_version_module_paths`), the
+            project_name with the dashes replaced by underscores if not
+            passed.
 
     Returns:
         str: Version for the package.
 
     Raises:
         RuntimeError: If the version could not be retrieved.
+        ShallowHistoryError: If the git history is a shallow clone without
+            tags nor anchors to start counting from.
     """
     if project_name is not None:
         version_env_var = "%s_VERSION" % project_name.upper()
@@ -64,18 +338,53 @@ def get_current_version(
         if version_env_var in os.environ and os.environ[version_env_var]:
             return os.environ[version_env_var]
 
-    version = None
     repo_dir = repo_dir or project_dir
-    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
-    if os.path.exists(pkg_info_file):
-        with open(pkg_info_file) as info_fd:
-            for line in info_fd.readlines():
-                if line.startswith("Version: "):
-                    version = line.split(" ", 1)[-1]
+    if package is None and project_name is not None:
+        package = project_name.replace("-", "_")
+
+    resolved_key = (
+        project_name,
+        os.path.abspath(project_dir),
+        os.path.abspath(repo_dir),
+        version_scheme,
+        tuple(paths) if paths is not None else None,
+        package,
+    )
+    if resolved_key not in _RESOLVED_VERSIONS:
+        _RESOLVED_VERSIONS[resolved_key] = _resolve_version(*resolved_key)
+
+    return _RESOLVED_VERSIONS[resolved_key]
+
+
+def _resolve_version(
+    project_name: Optional[str],
+    project_dir: str,
+    repo_dir: str,
+    version_scheme: str,
+    paths: Optional[Tuple[str, ...]] = None,
+    package: Optional[str] = None,
+) -> str:
+    version = _version_from_pkg_info(project_dir)
+
+    if version is None:
+        version = _version_from_files(project_dir, package, repo_dir)
+
+    # the source checkout can be in the path too, its version module is only
+    # valid for the commit it was generated for
+    if version is None and _get_head(repo_dir) is None:
+        version = _version_from_installed_module(package)
 
     if version is None:
         try:
-            version = api.get_current_version(repo_path=repo_dir)
+            version = api.get_current_version(
+                repo_path=repo_dir,
+                persist=True,
+                scheme=version_scheme,
+                paths=list(paths) if paths is not None else None,
+            )
+        except api.ShallowHistoryError:
+            # any installed version would be a wrong one, ex. on a CI clone
+            raise
         except Exception:
             pass
 
@@ -118,9 +427,8 @@ def get_authors(project_dir: str = os.curdir) -> Set[str]:
         RuntimeError: If the authors could not be retrieved
     """
     authors = set()
-    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
     authors_file = os.path.join(project_dir, "AUTHORS")
-    if os.path.exists(pkg_info_file) and os.path.exists(authors_file):
+    if _is_package(project_dir) and os.path.exists(authors_file):
         with open(authors_file) as authors_fd:
             authors = set(authors_fd.read().splitlines())
     else:
@@ -148,9 +456,8 @@ def get_changelog(
     :rises RuntimeError: If the changelog could not be retrieved
     """
     changelog = ""
-    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
     changelog_file = os.path.join(project_dir, "CHANGELOG")
-    if os.path.exists(pkg_info_file) and os.path.exists(changelog_file):
+    if _is_package(project_dir) and os.path.exists(changelog_file):
         with open(changelog_file) as changelog_fd:
             changelog = changelog_fd.read()
 
@@ -180,9 +487,8 @@ def get_releasenotes(project_dir: str = os.curdir, bugtracker_url: str = "") ->
         RuntimeError: If the release notes could not be retrieved
     """
     releasenotes = ""
-    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
     releasenotes_file = os.path.join(project_dir, "RELEASE_NOTES")
-    if os.path.exists(pkg_info_file) and os.path.exists(releasenotes_file):
+    if _is_package(project_dir) and os.path.exists(releasenotes_file):
         with open(releasenotes_file) as releasenotes_fd:
             releasenotes = releasenotes_fd.read()
 
@@ -205,23 +511,63 @@ def create_authors(project_dir: str = os.curdir) -> None:
     Raises:
         RuntimeError: If the authors could not be retrieved
     """
-    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
     authors_file = os.path.join(project_dir, "AUTHORS")
-    if os.path.exists(pkg_info_file):
+    if _is_package(project_dir):
         return
 
     authors = get_authors(project_dir=project_dir)
-    with open(authors_file, "wb") as authors_fd:
-        authors_fd.write(b"\n".join(a.encode("utf-8") for a in authors) + b"\n")
+    atomic_write(authors_file, "\n".join(sorted(authors)) + "\n")
+
+
+def create_version_module(
+    version_module: str,
+    project_dir: str = os.curdir,
+    project_name: Optional[str] = None,
+    version_scheme: str = SEMVER,
+) -> None:
+    """
+    Creates a version module with the version, the git sha of HEAD and
+    whether the working tree had uncommitted changes, if not in a package.
+    Packages can import it at runtime instead of going to the git history.
+
+    Args:
+        version_module(str): path to the module to create, ex.
+            ``mypackage/_version.py``.
+        project_dir(str): Path to the git repo of the project.
+        project_name(str): Name of the project to get the version for.
+        version_scheme(str): versioning scheme to use, see
+            :mod:`autosemver.schemes`.
+
+    Returns:
+        None
+
+    Raises:
+        RuntimeError: If the version could not be retrieved
+    """
+    if _is_package(project_dir):
+        return
+
+    version = get_current_version(
+        project_name=project_name,
+        project_dir=project_dir,
+        version_scheme=version_scheme,
+    )
+    git_sha, git_dirty = api.get_head_status(repo_path=project_dir)
+    atomic_write(
+        version_module,
+        VERSION_MODULE_TEMPLATE
+        % {"version": version, "git_sha": git_sha, "git_dirty": git_dirty},
+    )
 
 
 def create_changelog(
     project_dir: str = os.curdir,
     bugtracker_url: str = "",
     rpm_format: bool = False,
+    incremental: bool = False,
 ) -> None:
     """
-    Creates the changelog file, if not in a package.
+    Creates the CHANGELOG file in the project dir, if not in a package.
 
     :param project_dir: Path to the git repo of the project.
     :type project_dir: str
@@ -229,25 +575,128 @@ def create_changelog(
     :type bugtracker_url: str
     :param rpm_format: if set to True, will make the changelog rpm-compatible.
     :type rpm_format: bool
+    :param incremental: if set to True and the file was generated before,
+        will only add the entries for the new commits to it. If the history
+        was rewritten since, or the file changed, it's generated again.
+    :type incremental: bool
     :rises RuntimeError: If the changelog could not be retrieved
     """
-    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
-    if os.path.exists(pkg_info_file):
+    if _is_package(project_dir):
         return
 
-    with open("CHANGELOG", "wb") as changelog_fd:
-        changelog_fd.write(
-            get_changelog(
+    changelog_file = os.path.join(project_dir, "CHANGELOG")
+    options = {"bugtracker_url": bugtracker_url, "rpm_format": rpm_format}
+    with file_lock(changelog_file):
+        changelog = None
+        if incremental:
+            changelog = _update_changelog(changelog_file, project_dir, options)
+
+        if changelog is None:
+            changelog = get_changelog(
                 project_dir=project_dir,
                 bugtracker_url=bugtracker_url,
                 rpm_format=rpm_format,
-            ).encode("utf-8")
+            )
+
+        atomic_write(changelog_file, changelog)
+        _save_changelog_state(changelog, project_dir, options)
+
+
+def _get_changelog_state_path(project_dir: str) -> Optional[str]:
+    try:
+        controldir = api.open_repo(project_dir).controldir()
+    except Exception:
+        return None
+
+    project_digest = hashlib.sha1(
+        os.path.abspath(project_dir).encode("utf-8")
+    ).hexdigest()
+    return os.path.join(controldir, CHANGELOG_STATE_FILE % project_digest[:12])
+
+
+def _update_changelog(
+    changelog_file: str, project_dir: str, options: Dict[str, Any]
+) -> Optional[str]:
+    """
+    Returns the contents of the changelog file with the entries of the first
+    parents added since it was generated, or None if it can't be updated.
+    """
+    state_path = _get_changelog_state_path(project_dir)
+    if state_path is None:
+        return None
+
+    try:
+        with open(state_path) as state_fd:
+            state = json.load(state_fd)
+        with open(changelog_file, "rb") as changelog_fd:
+            changelog = changelog_fd.read().decode("utf-8")
+    except (OSError, ValueError):
+        return None
+
+    if (
+        not isinstance(state, dict)
+        or state.get("options") != options
+        or state.get("digest") != hashlib.sha1(changelog.encode("utf-8")).hexdigest()
+        or state.get("exclude") != _get_exclude_digest(project_dir)
+    ):
+        return None
+
+    try:
+        new_changelog = api.get_changelog(
+            repo_path=project_dir,
+            since_commit=state["head"],
+            since_version=state["version"],
+            since_tags=state["tags"],
+            **options,
         )
+    except (api.StaleHistoryError, KeyError):
+        return None
+
+    if not new_changelog:
+        return changelog
+    if not changelog:
+        return new_changelog
+
+    return new_changelog + "\n" + changelog
+
+
+def _get_exclude_digest(project_dir: str) -> str:
+    """Returns the digest of the exclude rules the changelog is generated with."""
+    return api.read_exclude_rules(api.open_repo(project_dir)).digest
+
+
+def _save_changelog_state(
+    changelog: str, project_dir: str, options: Dict[str, Any]
+) -> None:
+    """
+    Saves the commit, version and tags the changelog was generated for, so it
+    can be updated incrementally later. The version is the one calculated for
+    the commit, its entry can be missing or older (ex. excluded commits).
+    """
+    state_path = _get_changelog_state_path(project_dir)
+    head = _get_head(project_dir)
+    if state_path is None or head is None:
+        return
+
+    atomic_write(
+        state_path,
+        json.dumps(
+            {
+                "head": head,
+                # same exclude rules as the changelog, from the working tree
+                "version": api.get_current_version(repo_path=project_dir, persist=True),
+                "tags": api.get_tags(api.open_repo(project_dir)),
+                "exclude": _get_exclude_digest(project_dir),
+                "options": options,
+                "digest": hashlib.sha1(changelog.encode("utf-8")).hexdigest(),
+            }
+        ),
+    )
 
 
 def create_releasenotes(project_dir: str = os.curdir, bugtracker_url: str = "") -> None:
     """
-    Creates the release notes file, if not in a package.
+    Creates the RELEASE_NOTES file in the project dir, if not in a package.
 
     Args:
         project_dir(str): Path to the git repo of the project.
@@ -259,15 +708,14 @@ def create_releasenotes(project_dir: str = os.curdir, bugtracker_url: str = "")
     Raises:
         RuntimeError: If the release notes could not be retrieved
     """
-    pkg_info_file = os.path.join(project_dir, "PKG-INFO")
-    if os.path.exists(pkg_info_file):
+    if _is_package(project_dir):
         return
 
-    with open("RELEASE_NOTES", "wb") as releasenotes_fd:
-        releasenotes_fd.write(
-            get_releasenotes(
-                project_dir=project_dir,
-                bugtracker_url=bugtracker_url,
-            ).encode("utf-8")
-            + b"\n"
+    atomic_write(
+        os.path.join(project_dir, "RELEASE_NOTES"),
+        get_releasenotes(
+            project_dir=project_dir,
+            bugtracker_url=bugtracker_url,
         )
+        + "\n",
+    )
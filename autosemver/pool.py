@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""
+Pool of opened repositories, so the api calls don't have to open them (and
+read their pack indexes) again on each call, ex. when embedding autosemver
+in a long running service.
+
+A repo handle is only used by one thread at a time: each api call takes a
+handle for its repo from the pool (opening a new one if there's no idle one
+for that path), uses it for all the steps of the call, and gives it back to
+the pool at the end. Callers can also take a handle themselves with
+:meth:`RepoPool.handle` and pass it to several api calls instead of the
+path.
+"""
+import atexit
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple, Union
+
+from dulwich.repo import BaseRepo, Repo
+
+from .bundle import is_bundle, open_bundle
+from .profiling import count
+
+#: max number of idle handles kept by the default pool
+REPO_POOL_SIZE: int = 8
+
+
+class RepoHandle:
+    """A repo opened by a :class:`RepoPool`."""
+
+    def __init__(self, path: str, repo: BaseRepo, key: Tuple[int, ...]) -> None:
+        self.path = path
+        self.repo = repo
+        #: identity of the files of the repo when it was opened
+        self.key = key
+
+    def __repr__(self) -> str:
+        return "RepoHandle(%r)" % self.path
+
+    def close(self) -> None:
+        self.repo.close()
+
+
+#: path of a repo or a handle for it, accepted by all the api functions
+RepoPath = Union[str, RepoHandle]
+
+
+def open_new_repo(path: str) -> BaseRepo:
+    """Opens the repo at the given path, or the given git bundle file."""
+    if is_bundle(path):
+        return open_bundle(path)
+
+    return Repo(path)
+
+
+def _get_key(path: str) -> Tuple[int, ...]:
+    """
+    Returns what identifies the files of the repo, so a repo cloned again in
+    the same path, or a bundle file that changed, is not taken for the old
+    one.
+    """
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        # opening it will fail with the proper error
+        return ()
+
+    if os.path.isdir(path):
+        return (stat_result.st_dev, stat_result.st_ino)
+
+    return (
+        stat_result.st_dev,
+        stat_result.st_ino,
+        stat_result.st_mtime_ns,
+        stat_result.st_size,
+    )
+
+
+class RepoPool:
+    """
+    Thread safe pool of repo handles keyed by path, keeping up to max_idle
+    idle handles, dropping the least recently used ones past that.
+    """
+
+    def __init__(self, max_idle: int = REPO_POOL_SIZE) -> None:
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: "OrderedDict[int, RepoHandle]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._idle)
+
+    def acquire(self, path: str) -> RepoHandle:
+        """
+        Returns an idle handle for the repo at the given path, or a new one.
+        It must be given back with :meth:`release` once done with it.
+        """
+        path = os.path.abspath(path)
+        key = _get_key(path)
+        stale = []
+        handle = None
+        with self._lock:
+            for handle_id, idle_handle in reversed(self._idle.items()):
+                if idle_handle.path != path:
+                    continue
+
+                if idle_handle.key != key:
+                    stale.append(handle_id)
+                elif handle is None:
+                    handle = idle_handle
+                    stale.append(handle_id)
+
+            for handle_id in stale:
+                stale_handle = self._idle.pop(handle_id)
+                if stale_handle is not handle:
+                    stale_handle.close()
+
+        if handle is not None:
+            count("repo_pool_hits")
+            return handle
+
+        count("repo_pool_misses")
+        return RepoHandle(path=path, repo=open_new_repo(path), key=key)
+
+    def release(self, handle: RepoHandle) -> None:
+        """Gives back a handle taken with :meth:`acquire`."""
+        dropped = []
+        with self._lock:
+            self._idle[id(handle)] = handle
+            while len(self._idle) > self.max_idle:
+                dropped.append(self._idle.popitem(last=False)[1])
+
+        for old_handle in dropped:
+            old_handle.close()
+
+    @contextmanager
+    def handle(self, path: str) -> Iterator[RepoHandle]:
+        """Holds a handle for the repo at the given path while in the block."""
+        handle = self.acquire(path)
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def clear(self) -> None:
+        """Closes all the idle handles."""
+        with self._lock:
+            idle, self._idle = self._idle, OrderedDict()
+
+        for handle in idle.values():
+            handle.close()
+
+
+#: pool used by the api functions
+REPO_POOL = RepoPool()
+atexit.register(REPO_POOL.clear)
+
+_BOUND = threading.local()
+
+
+def _get_bound() -> Dict[str, RepoHandle]:
+    if not hasattr(_BOUND, "handles"):
+        _BOUND.handles = {}
+
+    return _BOUND.handles
+
+
+def get_bound_repo(path: str) -> Optional[BaseRepo]:
+    """
+    Returns the repo bound to the given path in the current thread, if any,
+    see :func:`bound_repo`.
+    """
+    handles = _get_bound()
+    if not handles:
+        return None
+
+    handle = handles.get(os.path.abspath(path))
+    return handle.repo if handle is not None else None
+
+
+@contextmanager
+def bound_repo(repo_path: RepoPath) -> Iterator[RepoHandle]:
+    """
+    Binds a handle for the repo to its path in the current thread while in
+    the block, so every time the repo is opened by path in there (see
+    :func:`autosemver.git.open_repo`), that same handle is used.
+
+    If a handle is passed, that one is bound, if a path is passed, the one
+    already bound for it in this thread if any, or one from the default
+    pool, given back to it at the end.
+    """
+    handles = _get_bound()
+    if isinstance(repo_path, RepoHandle):
+        path, handle = repo_path.path, repo_path
+        acquired = False
+    else:
+        path = os.path.abspath(repo_path)
+        acquired = path not in handles
+        handle = REPO_POOL.acquire(path) if acquired else handles[path]
+
+    previous = handles.get(path)
+    handles[path] = handle
+    try:
+        yield handle
+    finally:
+        if previous is None:
+            del handles[path]
+        else:
+            handles[path] = previous
+
+        if acquired:
+            REPO_POOL.release(handle)
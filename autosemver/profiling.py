@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""
+Lightweight instrumentation of the history analysis.
+
+It's disabled by default, in which case the spans and counters are just a
+check of a module global. Once enabled with :func:`enable`, every named span
+accumulates its wall time and number of calls, and every counter its total,
+until :func:`disable` is called.
+
+Spans can nest (ex. the classification runs inside the versioning), so the
+wall time of a span includes the one of the spans inside it. Each span also
+accumulates its self time, without the spans inside it, those add up to the
+total time.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+from typing import Any, Callable, DefaultDict, Dict, List, Optional
+
+_PROFILE: Optional["Profile"] = None
+#: time spent in the inner spans of each of the open spans of the thread
+_OPEN_SPANS = threading.local()
+
+
+class Profile:
+    """Timings and counters gathered while the profiling is enabled."""
+
+    def __init__(self) -> None:
+        self.timings: DefaultDict[str, float] = defaultdict(float)
+        self.self_timings: DefaultDict[str, float] = defaultdict(float)
+        self.calls: DefaultDict[str, int] = defaultdict(int)
+        self.counters: DefaultDict[str, int] = defaultdict(int)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "spans": {
+                name: {
+                    "seconds": self.timings[name],
+                    "self_seconds": self.self_timings[name],
+                    "calls": self.calls[name],
+                }
+                for name in self.timings
+            },
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4, sort_keys=True)
+
+    def to_table(self) -> str:
+        lines = ["%-30s %12s %12s %10s" % ("span", "seconds", "self", "calls")]
+        for name, seconds in sorted(
+            self.timings.items(), key=lambda item: item[1], reverse=True
+        ):
+            lines.append(
+                "%-30s %12.4f %12.4f %10d"
+                % (name, seconds, self.self_timings[name], self.calls[name])
+            )
+
+        lines.append("")
+        lines.append("%-30s %12s" % ("counter", "total"))
+        for name, total in sorted(self.counters.items()):
+            lines.append("%-30s %12d" % (name, total))
+
+        return "\n".join(lines)
+
+
+def _get_open_spans() -> List[float]:
+    if not hasattr(_OPEN_SPANS, "inner_times"):
+        _OPEN_SPANS.inner_times = []
+
+    return _OPEN_SPANS.inner_times
+
+
+class _Span:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self) -> "_Span":
+        _get_open_spans().append(0.0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        elapsed = time.perf_counter() - self.start
+        open_spans = _get_open_spans()
+        inner_time = open_spans.pop()
+        if open_spans:
+            open_spans[-1] += elapsed
+
+        # the profile might have been disabled in between
+        if _PROFILE is not None:
+            _PROFILE.timings[self.name] += elapsed
+            _PROFILE.self_timings[self.name] += elapsed - inner_time
+            _PROFILE.calls[self.name] += 1
+
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable() -> Profile:
+    """Starts gathering timings and counters on a new profile."""
+    global _PROFILE
+    _PROFILE = Profile()
+    return _PROFILE
+
+
+def disable() -> Optional[Profile]:
+    """Stops gathering timings and counters, returns the gathered ones."""
+    global _PROFILE
+    profile, _PROFILE = _PROFILE, None
+    return profile
+
+
+def get_profile() -> Optional[Profile]:
+    return _PROFILE
+
+
+def span(name: str) -> Any:
+    """Context manager that times the block under the given name."""
+    if _PROFILE is None:
+        return _NULL_SPAN
+
+    return _Span(name)
+
+
+def count(name: str, amount: int = 1) -> None:
+    """Adds the given amount to the counter with the given name."""
+    if _PROFILE is not None:
+        _PROFILE.counters[name] += amount
+
+
+def profiled(name: str) -> Callable:
+    """Decorator to time every call to the function under the given name."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _PROFILE is None:
+                return func(*args, **kwargs)
+
+            with _Span(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
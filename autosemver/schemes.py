@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""
+Versioning schemes, to render the version calculated from the history
+depending on how far the commit is from the last tagged one.
+
+* ``semver``: just ``X.Y.Z``, the default.
+* ``pep440``: ``X.Y.Z.devN`` for untagged commits.
+* ``rc``: ``X.Y.Z-rc.N`` for untagged commits on a release branch (any
+  branch matching :data:`RELEASE_BRANCH_REGEX`), ``X.Y.Z`` otherwise.
+* ``local``: ``X.Y.Z+g<sha>`` with the first 8 chars of the commit sha for
+  untagged commits.
+
+Where N is the number of first parent commits since the last tagged one (or
+since the start of the history if there are no tags).
+"""
+import re
+from typing import Optional
+
+SEMVER = "semver"
+PEP440 = "pep440"
+RELEASE_CANDIDATE = "rc"
+LOCAL = "local"
+SCHEMES = (SEMVER, PEP440, RELEASE_CANDIDATE, LOCAL)
+RELEASE_BRANCH_REGEX = re.compile(r"^(refs/heads/)?release[/-]")
+
+
+def format_version(
+    version: str,
+    scheme: str = SEMVER,
+    distance: int = 0,
+    sha: str = "",
+    branch: Optional[str] = None,
+) -> str:
+    """
+    Renders the version following the given scheme.
+
+    Args:
+        version(str): ``X.Y.Z`` version calculated for the commit.
+        scheme(str): one of :data:`SCHEMES`.
+        distance(int): number of first parent commits since the last tagged
+            one, 0 if the commit is tagged.
+        sha(str): sha of the commit.
+        branch(str): branch the commit is on, if any.
+
+    Returns:
+        str: the rendered version.
+
+    Raises:
+        ValueError: if the scheme is not known.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(
+            "Unknown versioning scheme %s, should be one of %s"
+            % (scheme, ", ".join(SCHEMES))
+        )
+
+    if scheme == SEMVER or distance == 0:
+        return version
+
+    if scheme == PEP440:
+        return "%s.dev%d" % (version, distance)
+
+    if scheme == RELEASE_CANDIDATE:
+        if branch and RELEASE_BRANCH_REGEX.match(branch):
+            return "%s-rc.%d" % (version, distance)
+
+        return version
+
+    return "%s+g%s" % (version, sha[:8])
@@ -35,7 +35,7 @@ if not os.path.exists(PKG_INFO):
     from autosemver import PROJECT_NAME
     from autosemver.packaging import get_authors, get_changelog, get_current_version
 
-    __version__ = get_current_version(project_name=PROJECT_NAME)
+    __version__ = get_current_version(project_name=PROJECT_NAME, package="autosemver")
 else:
     IN_A_PACKAGE = True
     with open(PKG_INFO) as info_fd:
@@ -65,6 +65,7 @@ if __name__ == "__main__":
         author_email="david@dcaro.es",
         description="Tools to handle automatic semantic versioning in python",
         install_requires=["dulwich>=0.19.6"],
+        extras_require={"toml": ["tomli; python_version < '3.11'"]},
         long_description=LONG_DESCRIPTION,
         long_description_content_type="text/x-rst",
         license="GPLv3",
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+import pytest
+from dulwich.index import build_index_from_tree, commit_tree
+from dulwich.objects import Blob, Commit
+from dulwich.repo import Repo
+
+DEFAULT_AUTHOR = "Wöndérfûl nàmé <wondering@ema.il>"
+
+
+class RepoBuilder:
+    """Small helper to create git histories without a working tree."""
+
+    def __init__(self, path):
+        self.path = path
+        self.repo = Repo.init(path, mkdir=True)
+        self.files_per_commit = {}
+        self.commit_time = 1500000000
+
+    def commit(
+        self,
+        message,
+        parents=None,
+        files=None,
+        author=DEFAULT_AUTHOR,
+        ref=b"refs/heads/master",
+    ):
+        """
+        Creates a commit on top of the given parents (the current head of ref
+        if not passed), with the files of the first parent updated with the
+        given ones, and moves the ref to it.
+        """
+        if parents is None:
+            parents = [self.repo.refs[ref].decode()] if ref in self.repo.refs else []
+
+        tree_files = dict(self.files_per_commit.get(parents[0], {}) if parents else {})
+        tree_files.update(files or {"file": message})
+        blobs = []
+        for path, content in sorted(tree_files.items()):
+            blob = Blob.from_string(content.encode("utf-8"))
+            self.repo.object_store.add_object(blob)
+            blobs.append((path.encode("utf-8"), blob.id, 0o100644))
+
+        self.commit_time += 60
+        commit = Commit()
+        commit.tree = commit_tree(self.repo.object_store, blobs)
+        commit.parents = [parent.encode() for parent in parents]
+        commit.author = commit.committer = author.encode("utf-8")
+        commit.author_time = commit.commit_time = self.commit_time
+        commit.author_timezone = commit.commit_timezone = 0
+        commit.encoding = b"UTF-8"
+        commit.message = message.encode("utf-8")
+        self.repo.object_store.add_object(commit)
+
+        sha = commit.id.decode()
+        self.files_per_commit[sha] = tree_files
+        if ref is not None:
+            self.repo.refs[ref] = commit.id
+
+        return sha
+
+    def checkout(self):
+        """Writes the index and the working tree for the current HEAD."""
+        build_index_from_tree(
+            self.repo.path,
+            self.repo.index_path(),
+            self.repo.object_store,
+            self.repo[self.repo.head()].tree,
+        )
+
+    def tag(self, name, sha):
+        self.repo.refs[b"refs/tags/" + name.encode()] = sha.encode()
+
+    def make_shallow(self, *shas):
+        with open(self.repo.controldir() + "/shallow", "w") as shallow_fd:
+            shallow_fd.write("".join(sha + "\n" for sha in shas))
+
+
+@pytest.fixture
+def git_repo(tmp_path):
+    return RepoBuilder(str(tmp_path / "repo"))
@@ -0,0 +1,428 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+import os
+
+import dulwich.repo
+import pytest
+from dulwich import porcelain
+
+from autosemver import api, git, profiling
+from autosemver.notes import NOTES_REF, NotesStore
+
+
+def _make_history(git_repo):
+    shas = [git_repo.commit("Initial commit")]
+    shas.append(git_repo.commit("Some feature\n\nSem-Ver: feature"))
+    side = git_repo.commit("Side fix", parents=[shas[-1]], ref=None)
+    shas.append(git_repo.commit("Main fix"))
+    shas.append(git_repo.commit("Merge side", parents=[shas[-1], side]))
+    shas.append(git_repo.commit("Another fix"))
+    return shas
+
+
+def test_get_current_version(git_repo):
+    _make_history(git_repo)
+
+    assert api.get_current_version(git_repo.path) == "0.1.3"
+
+
+def test_get_current_version_dirty(git_repo):
+    _make_history(git_repo)
+    git_repo.checkout()
+
+    assert api.get_current_version(git_repo.path, dirty=True) == "0.1.3"
+
+    # only the mode changed
+    os.chmod(os.path.join(git_repo.path, "file"), 0o755)
+    assert api.get_current_version(git_repo.path, dirty=True).startswith("0.1.3+dirty.")
+    os.chmod(os.path.join(git_repo.path, "file"), 0o644)
+    assert api.get_current_version(git_repo.path, dirty=True) == "0.1.3"
+
+    with open(os.path.join(git_repo.path, "file"), "w") as file_fd:
+        file_fd.write("Uncommitted change")
+
+    version = api.get_current_version(git_repo.path, dirty=True)
+    assert version.startswith("0.1.3+dirty.")
+    assert api.get_current_version(git_repo.path, dirty=True) == version
+    assert api.get_current_version(git_repo.path) == "0.1.3"
+
+    with open(os.path.join(git_repo.path, "file"), "w") as file_fd:
+        file_fd.write("Another uncommitted change")
+
+    assert api.get_current_version(git_repo.path, dirty=True) != version
+
+    os.remove(os.path.join(git_repo.path, "file"))
+    assert api.get_current_version(git_repo.path, dirty=True) != version
+
+
+@pytest.mark.parametrize(
+    "scheme, expected",
+    [
+        ("semver", "0.1.3"),
+        ("pep440", "0.1.3.dev3"),
+        ("rc", "0.1.3"),
+        ("local", "0.1.3+g%(head)s"),
+    ],
+)
+def test_get_current_version_scheme(git_repo, scheme, expected):
+    shas = _make_history(git_repo)
+    git_repo.tag("0.1.0", shas[1])
+
+    assert api.get_current_version(git_repo.path, scheme=scheme) == expected % {
+        "head": shas[-1][:8]
+    }
+
+
+def test_get_current_version_scheme_release_branch(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.tag("0.1.0", shas[1])
+    git_repo.repo.refs[b"refs/heads/release/0.1"] = shas[-1].encode()
+    git_repo.repo.refs.set_symbolic_ref(b"HEAD", b"refs/heads/release/0.1")
+
+    assert api.get_current_version(git_repo.path, scheme="rc") == "0.1.3-rc.3"
+    assert (
+        api.get_current_version(git_repo.path, persist=True, scheme="rc")
+        == "0.1.3-rc.3"
+    )
+
+
+def test_get_current_version_scheme_tagged(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.tag("0.1.3", shas[-1])
+
+    assert api.get_current_version(git_repo.path, scheme="pep440") == "0.1.3"
+
+
+def test_get_current_version_unknown_scheme(git_repo):
+    _make_history(git_repo)
+
+    with pytest.raises(ValueError):
+        api.get_current_version(git_repo.path, scheme="calver")
+
+
+def test_rev_on_bare_repo(git_repo, tmp_path):
+    shas = _make_history(git_repo)
+    bare_path = str(tmp_path / "bare")
+    bare_repo = git_repo.repo.clone(bare_path, mkdir=True, bare=True)
+    bare_repo.refs[b"refs/heads/maintenance"] = shas[2].encode()
+
+    assert api.get_current_version(bare_path) == "0.1.3"
+    assert api.get_current_version(bare_path, rev="maintenance") == "0.1.1"
+    assert api.get_current_version(bare_path, rev=shas[3][:7]) == "0.1.2"
+    assert api.get_changelog(bare_path, rev="maintenance").startswith("* 0.1.1")
+    assert api.get_authors(bare_path, rev="maintenance") == [
+        "Wöndérfûl nàmé <wondering@ema.il>"
+    ]
+
+
+def test_get_versions(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.commit(
+        "Maintenance fix",
+        parents=[shas[2]],
+        ref=b"refs/heads/maintenance",
+    )
+    git_repo.commit(
+        "Old feature\n\nSem-Ver: feature", parents=[shas[0]], ref=b"refs/heads/old"
+    )
+
+    versions = api.get_versions(git_repo.path, with_changelog=True)
+
+    assert list(versions) == ["maintenance", "master", "old"]
+    for rev, (version, _) in versions.items():
+        assert version == api.get_current_version(git_repo.path, rev=rev)
+
+    maintenance_changelog = versions["maintenance"][1]
+    assert maintenance_changelog.startswith("* 0.1.2")
+    assert "Maintenance fix" in maintenance_changelog
+    assert "Main fix" not in maintenance_changelog
+    assert "Another fix" in versions["master"][1]
+    assert "Some feature" not in versions["master"][1]
+    assert api.get_versions(git_repo.path, revs=["master"]) == {
+        "master": ("0.1.3", None)
+    }
+
+
+def test_shallow_clone_without_anchor_fails(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.make_shallow(shas[2])
+
+    with pytest.raises(git.ShallowHistoryError):
+        api.get_current_version(git_repo.path)
+
+
+def test_shallow_clone_with_tag(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.tag("v1.2.3", shas[3])
+    git_repo.make_shallow(shas[2])
+
+    assert api.get_current_version(git_repo.path) == "1.2.4"
+
+
+def test_shallow_clone_with_anchor(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.make_shallow(shas[3])
+    os.makedirs(os.path.join(git_repo.path, ".git", "autosemver"))
+    with open(os.path.join(git_repo.path, ".git", git.ANCHORS_FILE), "w") as fd:
+        fd.write("%s 0.1.2\n" % shas[3])
+
+    assert api.get_current_version(git_repo.path) == "0.1.3"
+    assert "Main fix" not in api.get_changelog(git_repo.path)
+
+
+def test_get_version_index(git_repo):
+    shas = _make_history(git_repo)
+    side = git_repo.repo[shas[3].encode()].parents[1].decode()
+
+    index = api.get_version_index(git_repo.path)
+
+    assert index == {
+        shas[0]: "0.0.1",
+        shas[1]: "0.1.0",
+        shas[2]: "0.1.1",
+        side: "0.1.2",
+        shas[3]: "0.1.2",
+        shas[4]: "0.1.3",
+    }
+
+
+def test_get_version_of_persists_the_index(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.tag("v1.0", shas[2])
+
+    assert api.get_version_of(git_repo.path, "v1.0") == "1.0.0"
+    assert api.get_version_of(git_repo.path, shas[1][:8]) == "0.1.0"
+    assert os.path.exists(os.path.join(git_repo.path, ".git", git.VERSION_INDEX_FILE))
+
+
+def test_version_index_is_not_reused_after_tagging(git_repo):
+    shas = _make_history(git_repo)
+    assert api.get_version_of(git_repo.path, shas[3]) == "0.1.2"
+
+    git_repo.tag("1.0.0", shas[3])
+
+    assert api.get_version_of(git_repo.path, shas[3]) == "1.0.0"
+    assert api.get_version_of(git_repo.path, "HEAD") == "1.0.1"
+    assert api.get_current_version(git_repo.path, persist=True) == "1.0.1"
+
+
+def test_get_version_commits(git_repo):
+    shas = _make_history(git_repo)
+    side = git_repo.repo[shas[3].encode()].parents[1].decode()
+
+    assert api.get_version_commits(git_repo.path, "0.1.2") == [
+        (shas[3], "0.1.2", [side])
+    ]
+    assert [
+        commit_sha for commit_sha, _, _ in api.get_version_commits(git_repo.path, "0.1")
+    ] == shas[1:]
+
+
+def test_get_releasenotes_section(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.tag("v1.0", shas[2])
+    git_repo.tag("v2.0.0", git_repo.commit("Break\n\nsem-ver: api-break"))
+    git_repo.commit("Later fix")
+    sections = api.get_releasenotes(git_repo.path).split("\n\n\nNew changes")
+
+    section = api.get_releasenotes_section(git_repo.path, "1")
+    assert section.startswith("New changes for version 1.0.2\n")
+    assert section.endswith(sections[1])
+
+    profile = profiling.enable()
+    try:
+        api.get_releasenotes(git_repo.path)
+        full_calls = profile.calls["classification"]
+        profile.calls.clear()
+        section = api.get_releasenotes_section(git_repo.path, "1.0.1..1.0.2")
+        # the first one saves the version index, the next ones reuse it
+        profile.calls.clear()
+        section = api.get_releasenotes_section(git_repo.path, "1.0.1..1.0.2")
+        # only the commits in the range are classified
+        assert profile.calls["classification"] < full_calls / 2
+    finally:
+        profiling.disable()
+
+    assert "Another fix" in section
+    assert "Main fix" not in section
+    assert "Later fix" not in section
+    with pytest.raises(RuntimeError):
+        api.get_releasenotes_section(git_repo.path, "7")
+
+
+def test_get_releasenotes_section_unrelated_root(git_repo):
+    git_repo.commit("Initial commit")
+    git_repo.commit("Some feature\n\nSem-Ver: feature")
+    git_repo.tag("v1.0.0", git_repo.commit("Main fix"))
+    root = git_repo.commit("Unrelated root", parents=[], ref=None)
+    other = git_repo.commit("Unrelated fix", parents=[root], ref=None)
+    git_repo.commit("Merge unrelated", parents=[git_repo.repo.head().decode(), other])
+    git_repo.tag("v1.1.0", git_repo.commit("Later feature\n\nsem-ver: feature"))
+    git_repo.commit("Last fix")
+    sections = api.get_releasenotes(git_repo.path).split("\n\n\nNew changes")
+
+    # the unrelated root is replayed as a first parent before the first tag
+    section = api.get_releasenotes_section(git_repo.path, "0")
+    assert "Unrelated root" in section
+    assert section.endswith(sections[-1])
+    for version in ("1", "1.0", "1.1"):
+        section = api.get_releasenotes_section(git_repo.path, version)
+        assert "Unrelated root" not in section
+
+
+def _make_monorepo(git_repo):
+    git_repo.commit("Add a", files={"pkgs/a/setup.py": "a"})
+    git_repo.commit("Add b\n\nsem-ver: feature", files={"pkgs/b/setup.py": "b"})
+    git_repo.commit("Fix a", files={"pkgs/a/setup.py": "a2"})
+    base = git_repo.commit("Fix the readme", files={"README": "readme"})
+    side = git_repo.commit(
+        "Break b\n\nsem-ver: api-break",
+        parents=[base],
+        files={"pkgs/b/setup.py": "b2"},
+        ref=None,
+    )
+    git_repo.commit("Merge b", parents=[base, side], files={"pkgs/b/setup.py": "b2"})
+    git_repo.tag("5.0.0", git_repo.repo.head().decode())
+
+
+def test_get_current_version_paths(git_repo):
+    _make_monorepo(git_repo)
+
+    assert api.get_current_version(git_repo.path) == "5.0.0"
+    assert api.get_current_version(git_repo.path, paths=["pkgs/a"]) == "0.0.2"
+    assert api.get_current_version(git_repo.path, paths=["pkgs/b/"]) == "1.0.0"
+    assert api.get_current_version(git_repo.path, paths=["README", "pkgs/a"]) == (
+        "0.0.3"
+    )
+    assert api.get_current_version(git_repo.path, paths=["pkgs/c"]) == "0.0.0"
+    assert (
+        api.get_current_version(git_repo.path, paths=["pkgs/b"], scheme="pep440")
+        == "1.0.0.dev2"
+    )
+    with pytest.raises(ValueError):
+        api.get_current_version(git_repo.path, paths=["../other"])
+
+
+def test_get_subproject_versions(git_repo, tmp_path):
+    _make_monorepo(git_repo)
+    path_map_file = tmp_path / "paths.toml"
+    path_map_file.write_text(
+        'a = "pkgs/a"\nb = ["pkgs/b"]\npkgs = "pkgs"\ndocs = ["README", "pkgs/a"]\n'
+        'none = "pkgs/c"\n'
+    )
+    path_map = api.read_path_map(str(path_map_file))
+    assert list(path_map) == ["a", "b", "pkgs", "docs", "none"]
+
+    versions = api.get_subproject_versions(git_repo.path, path_map, with_changelog=True)
+    assert list(versions) == list(path_map)
+    for subproject, paths in path_map.items():
+        assert versions[subproject] == (
+            api.get_current_version(git_repo.path, paths=paths),
+            api.get_changelog(git_repo.path, paths=paths),
+        )
+
+    assert versions["pkgs"][0] == "1.0.0"
+    assert versions["none"] == ("0.0.0", "")
+    assert api.get_subproject_versions(git_repo.path, {"a": ["pkgs/a"]}) == {
+        "a": ("0.0.2", None)
+    }
+
+    path_map_file.write_text("a = 1\n")
+    with pytest.raises(ValueError):
+        api.read_path_map(str(path_map_file))
+
+
+def test_exclude_rules(git_repo):
+    bot = "Bump bot <bot@ema.il>"
+    exclude_file = "author ^Bump bot\nsubject [skip version]\n"
+    git_repo.commit("Initial commit", files={".autosemver-exclude": exclude_file})
+    base = git_repo.commit("Bump dependency", author=bot)
+    git_repo.commit("[skip version] Update the docs")
+    side = git_repo.commit("New feature\n\nsem-ver: feature", parents=[base], ref=None)
+    git_repo.commit(
+        "Merge new feature", parents=[git_repo.repo.head().decode(), side], author=bot
+    )
+    git_repo.commit("Bump other dependency", author=bot)
+    git_repo.checkout()
+
+    assert api.get_current_version(git_repo.path) == "0.1.0"
+    changelog = api.get_changelog(git_repo.path)
+    assert "Bump dependency" not in changelog
+    assert "Bump other dependency" not in changelog
+    assert "[skip version]" not in changelog
+    assert "Merge new feature" in changelog
+    assert "New feature" in changelog
+    assert "dependency" not in api.get_releasenotes(git_repo.path)
+    assert api.get_current_version(git_repo.path, persist=True) == "0.1.0"
+
+    with open(os.path.join(git_repo.path, ".autosemver-exclude"), "a") as exclude_fd:
+        exclude_fd.write("versioning bump\n")
+
+    assert api.get_current_version(git_repo.path) == "0.1.1"
+    assert api.get_current_version(git_repo.path, persist=True) == "0.1.1"
+    # the rules of a revision are the committed ones
+    assert api.get_current_version(git_repo.path, rev="master") == "0.1.0"
+
+
+def test_get_author_stats(git_repo):
+    shas = _make_history(git_repo)
+    git_repo.commit("Old email fix", author="Wonderful <old@ema.il>")
+    git_repo.commit(
+        "Add mailmap",
+        files={".mailmap": "Wöndérfûl nàmé <wondering@ema.il> <old@ema.il>\n"},
+        author="Other <other@ema.il>",
+    )
+    git_repo.checkout()
+
+    stats = api.get_author_stats(git_repo.path)
+    assert stats == {
+        "Wöndérfûl nàmé <wondering@ema.il>": (7, 1500000060, 1500000420),
+        "Other <other@ema.il>": (1, 1500000480, 1500000480),
+    }
+    assert api.get_authors(git_repo.path) == sorted(stats)
+    assert api.get_author_stats(git_repo.path, from_commit=shas[3]) == {
+        "Wöndérfûl nàmé <wondering@ema.il>": (4, 1500000180, 1500000420),
+        "Other <other@ema.il>": (1, 1500000480, 1500000480),
+    }
+    assert "Wonderful <old@ema.il>" in api.get_authors(git_repo.path, mailmap=False)
+
+
+def test_sync_notes(git_repo, tmp_path, monkeypatch):
+    _make_history(git_repo)
+    expected_changelog = api.get_changelog(git_repo.path)
+
+    assert api.sync_notes(git_repo.path) == 6
+    assert api.sync_notes(git_repo.path) == 0
+    notes = NotesStore(git_repo.repo)
+    head = git_repo.repo.head().decode()
+    assert notes.get(head) == {"bugs": [], "type": "bug", "version": "0.1.3"}
+
+    # share them through a bare repo with a fresh clone
+    bare_path = str(tmp_path / "bare")
+    dulwich.repo.Repo.init_bare(bare_path, mkdir=True)
+    porcelain.push(git_repo.repo, bare_path, [b"refs/heads/master", NOTES_REF])
+    clone = git_repo.repo.clone(str(tmp_path / "clone"), mkdir=True)
+    fetched = porcelain.fetch(clone, bare_path, quiet=True)
+    clone.refs[NOTES_REF] = fetched.refs[NOTES_REF]
+
+    # the messages are not parsed anymore
+    monkeypatch.setattr(git, "is_feature", lambda commit: False)
+    assert api.get_changelog(clone.path) == expected_changelog
+    assert api.get_current_version(clone.path) == "0.1.3"
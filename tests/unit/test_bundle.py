@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+import os
+import subprocess
+
+import pytest
+
+from autosemver import api, bundle, git
+
+
+def _make_bundle(git_repo, path, *revs):
+    subprocess.run(
+        ["git", "--git-dir", git_repo.repo.controldir(), "bundle", "create", path]
+        + list(revs),
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return path
+
+
+def _make_history(git_repo):
+    shas = [git_repo.commit("Initial commit")]
+    shas.append(git_repo.commit("Some feature\n\nSem-Ver: feature"))
+    side = git_repo.commit("Side fix", parents=[shas[-1]], ref=None)
+    shas.append(git_repo.commit("Main fix"))
+    shas.append(git_repo.commit("Merge side", parents=[shas[-1], side]))
+    shas.append(git_repo.commit("Last fix"))
+    return shas
+
+
+def test_bundle(git_repo, tmp_path):
+    _make_history(git_repo)
+    bundles_dir = tmp_path / "bundles"
+    bundles_dir.mkdir()
+    bundle_path = _make_bundle(git_repo, str(bundles_dir / "repo.bundle"), "--all")
+
+    assert bundle.is_bundle(bundle_path)
+    assert not bundle.is_bundle(git_repo.path)
+    repo = git.open_repo(bundle_path)
+    assert isinstance(repo, bundle.BundleRepo)
+    assert repo.refs.read_ref(b"HEAD") == b"ref: refs/heads/master"
+    repo.close()
+
+    for func in (
+        api.get_current_version,
+        api.get_changelog,
+        api.get_releasenotes,
+        api.get_authors,
+        api.get_version_index,
+        # all the local branches
+        api.get_versions,
+    ):
+        assert func(bundle_path) == func(git_repo.path)
+
+    head = git_repo.repo.head().decode()
+    assert api.get_version_of(bundle_path, head) == "0.1.3"
+    # nothing is written next to the bundle
+    assert os.listdir(str(bundles_dir)) == ["repo.bundle"]
+
+    with pytest.raises(bundle.ReadOnlyBundleError):
+        api.tag_versions(bundle_path)
+
+
+def test_bundle_with_prerequisites(git_repo, tmp_path):
+    shas = _make_history(git_repo)
+    side = git_repo.repo[shas[3].encode()].parents[1].decode()
+    git_repo.tag("0.1.2", shas[3])
+    bundle_path = _make_bundle(
+        git_repo,
+        str(tmp_path / "range.bundle"),
+        "master",
+        "0.1.2",
+        "--not",
+        shas[2],
+        side,
+    )
+
+    repo = git.open_repo(bundle_path)
+    assert repo.get_shallow() == {shas[3].encode()}
+    repo.close()
+    assert api.get_current_version(bundle_path) == "0.1.3"
+    assert "Some feature" not in api.get_changelog(bundle_path)
+
+    bundle_path = _make_bundle(
+        git_repo, str(tmp_path / "untagged.bundle"), "master", "--not", shas[3]
+    )
+    with pytest.raises(git.ShallowHistoryError):
+        api.get_current_version(bundle_path)
@@ -17,7 +17,101 @@
 # along with autosemver; if not, write to the
 # Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 # MA 02111-1307, USA.
+import os
+
+import mock
+
+import autosemver
+from autosemver import packaging
 
 
 def test_dummy():
     pass
+
+
+def test_build_steps_reuse_the_stamp(git_repo, monkeypatch):
+    git_repo.commit("Some commit")
+    monkeypatch.chdir(git_repo.path)
+    packaging.reset_version_cache()
+
+    metadata = autosemver.distutils_autosemver_case(mock.Mock())
+    assert metadata.version == "0.0.1"
+    assert os.path.exists("AUTHORS") and os.path.exists("CHANGELOG")
+
+    packaging.reset_version_cache()
+    with mock.patch("autosemver.create_authors") as create_authors:
+        metadata = autosemver.distutils_autosemver_case(mock.Mock())
+    assert metadata.version == "0.0.1"
+    assert not create_authors.called
+
+    git_repo.commit("Some other commit")
+    packaging.reset_version_cache()
+    metadata = autosemver.distutils_autosemver_case(mock.Mock())
+    assert metadata.version == "0.0.2"
+
+    git_repo.checkout()
+    git_repo.tag("1.0.0", git_repo.repo.head().decode())
+    packaging.reset_version_cache()
+    metadata = autosemver.distutils_autosemver_case(mock.Mock())
+    assert metadata.version == "1.0.0"
+
+    with open("file", "a") as file_fd:
+        file_fd.write("uncommitted change")
+    packaging.reset_version_cache()
+    with mock.patch("autosemver.create_authors") as create_authors:
+        autosemver.distutils_autosemver_case(mock.Mock())
+    assert create_authors.called
+
+
+def test_build_stamp_in_project_dir(git_repo, tmp_path, monkeypatch):
+    git_repo.commit("Some commit")
+    (tmp_path / "elsewhere").mkdir()
+    monkeypatch.chdir(str(tmp_path / "elsewhere"))
+    packaging.reset_version_cache()
+
+    metadata = autosemver.distutils_autosemver_case(
+        mock.Mock(), project_dir=git_repo.path
+    )
+    assert metadata.version == "0.0.1"
+    assert os.path.exists(os.path.join(git_repo.path, packaging.BUILD_STAMP_FILE))
+    assert os.listdir(os.curdir) == []
+
+
+def test_no_build_stamp_in_packages(tmp_path, monkeypatch):
+    (tmp_path / "PKG-INFO").write_text("Metadata-Version: 2.1\nVersion: 1.2.3\n")
+    monkeypatch.chdir(str(tmp_path))
+    packaging.reset_version_cache()
+
+    metadata = autosemver.distutils_autosemver_case(mock.Mock())
+    assert metadata.version == "1.2.3"
+    assert os.listdir(str(tmp_path)) == ["PKG-INFO"]
+
+
+def test_get_current_version_after_tagging(git_repo):
+    git_repo.commit("Some commit")
+    head = git_repo.commit("Some other commit")
+    packaging.reset_version_cache()
+    assert packaging.get_current_version(project_dir=git_repo.path) == "0.0.2"
+
+    git_repo.tag("2.0.0", head)
+
+    packaging.reset_version_cache()
+    assert packaging.get_current_version(project_dir=git_repo.path) == "2.0.0"
+
+
+def test_stale_version_module_in_the_path_is_ignored(git_repo, monkeypatch):
+    git_repo.commit("Some commit")
+    os.makedirs(os.path.join(git_repo.path, "mypkg"))
+    open(os.path.join(git_repo.path, "mypkg", "__init__.py"), "w").close()
+    version_module = os.path.join(git_repo.path, "mypkg", "_version.py")
+    packaging.reset_version_cache()
+    packaging.create_version_module(version_module, project_dir=git_repo.path)
+    monkeypatch.syspath_prepend(git_repo.path)
+
+    git_repo.tag("3.0.0", git_repo.commit("Some other commit"))
+
+    packaging.reset_version_cache()
+    version = packaging.get_current_version(
+        project_name="mypkg", project_dir=git_repo.path
+    )
+    assert version == "3.0.0"
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+"""
+Differential tests of the optimized history engines against the reference
+one, a frozen copy of the original algorithm, on random histories.
+"""
+import os
+import shutil
+import tempfile
+from collections import OrderedDict, defaultdict
+
+import dulwich.repo
+import dulwich.walk
+import mock
+from conftest import RepoBuilder
+from hypothesis import HealthCheck, example, given, settings, strategies as st
+
+from autosemver import api, git
+
+MESSAGES = [
+    "Some fix",
+    "Fix that closes #12",
+    "Some feature\n\nSem-Ver: feature",
+    "Deprecation\n\nSem-Ver: deprecation",
+    "New things\n\n* NEW some feature",
+    "Breaking change\n\nSem-Ver: api-breaking",
+    "Incompatible\n\n* INCOMPATIBLE old api removed",
+]
+
+
+def _walk(repo, head):
+    return repo.get_walker(
+        include=[head.encode()] if head else None, order=dulwich.walk.ORDER_TOPO
+    )
+
+
+def _reference_first_parents(repo, head):
+    first_parents = []
+    on_merge = False
+    for entry in _walk(repo, head):
+        sha = entry.commit.id.decode()
+        parents = [parent.decode() for parent in entry.commit.parents]
+        if not parents:
+            if sha not in first_parents:
+                first_parents.append(sha)
+        elif not on_merge:
+            on_merge = len(parents) > 1
+            if sha not in first_parents:
+                first_parents.append(sha)
+            if parents[0] not in first_parents:
+                first_parents.append(parents[0])
+        elif sha in first_parents and parents[0] not in first_parents:
+            first_parents.append(parents[0])
+
+    return first_parents
+
+
+def _reference_merged_commits(repo, commit, first_parents, children_per_parent):
+    merge_children = set()
+    to_explore = set([commit.id.decode()])
+    while to_explore:
+        next_sha = to_explore.pop()
+        next_commit = repo[_to_bytes(next_sha)]
+        if (
+            next_sha not in first_parents
+            and not any(
+                child in first_parents for child in children_per_parent[next_sha]
+            )
+            or _to_bytes(next_sha) in commit.parents
+        ):
+            merge_children.add(next_sha)
+
+        for parent in next_commit.parents:
+            if (
+                parent.decode() not in first_parents
+                and parent not in merge_children
+                and parent != next_sha
+            ):
+                to_explore.add(parent)
+
+    return merge_children
+
+
+def _to_bytes(sha):
+    return sha if isinstance(sha, bytes) else sha.encode()
+
+
+def _reference_history(repo_path, commits=None, head=None):
+    """
+    Frozen copy of the original algorithm, with plain dulwich topological
+    walks, so it doesn't share any code with the engines under test. Only the
+    merged commits are sorted, as the engines list them.
+    """
+    repo = dulwich.repo.Repo(repo_path)
+    try:
+        first_parents = _reference_first_parents(repo, head)
+        children_per_parent = defaultdict(set)
+        for entry in _walk(repo, head):
+            for parent in entry.commit.parents:
+                children_per_parent[parent.decode()].add(entry.commit.id.decode())
+
+        history = []
+        for first_parent in first_parents:
+            commit = repo[first_parent.encode()]
+            children = set()
+            if len(commit.parents) > 1:
+                children = _reference_merged_commits(
+                    repo, commit, first_parents, children_per_parent
+                )
+
+            history.append(
+                (
+                    first_parent,
+                    sorted(
+                        (repo[_to_bytes(child)] for child in children),
+                        key=lambda child: (child.commit_time, child.id),
+                        reverse=True,
+                    ),
+                )
+            )
+    finally:
+        repo.close()
+
+    return reversed(history)
+
+
+def _get_outputs(repo_path):
+    return (
+        api.get_current_version(repo_path),
+        api.get_changelog(repo_path),
+        api.get_releasenotes(repo_path),
+    )
+
+
+def _get_outputs_from_versions(repo_path):
+    version, changelog = api.get_versions(
+        repo_path, revs=["master"], with_changelog=True
+    )["master"]
+    return version, changelog
+
+
+def _get_outputs_from_notes(repo_path):
+    api.sync_notes(repo_path)
+    return _get_outputs(repo_path)
+
+
+#: alternative engines, each a function to get the outputs with it, the ones
+#: that change the repo go last
+ENGINES = OrderedDict(
+    [
+        ("streaming", _get_outputs),
+        ("git backend", _get_outputs),
+        ("shared histories", _get_outputs_from_versions),
+        ("notes", _get_outputs_from_notes),
+    ]
+)
+
+
+@st.composite
+def histories(draw):
+    """
+    Random histories, as a list of (message, parents indexes, tag) per
+    commit, with linear runs, merges, octopus and criss-cross merges, tags and
+    the occasional unrelated root.
+    """
+    commits = [(draw(st.sampled_from(MESSAGES)), [], None)]
+    for index in range(1, draw(st.integers(min_value=1, max_value=25))):
+        kind = draw(
+            st.sampled_from(["linear", "linear", "branch", "merge", "octopus", "root"])
+        )
+        previous = index - 1
+        if kind == "linear":
+            parents = [previous]
+        elif kind == "branch":
+            parents = [draw(st.integers(min_value=0, max_value=previous))]
+        elif kind == "root":
+            parents = []
+        else:
+            # merging older commits back and forth makes criss-cross merges
+            parents = [previous] + draw(
+                st.lists(
+                    st.integers(min_value=0, max_value=previous),
+                    min_size=1,
+                    max_size=1 if kind == "merge" else 3,
+                    unique=True,
+                ).filter(lambda others: previous not in others)
+            )
+
+        tag = None
+        if draw(st.integers(min_value=0, max_value=9)) == 0:
+            tag = "%d.%d.%d" % tuple(
+                draw(st.integers(min_value=0, max_value=3)) for _ in range(3)
+            )
+
+        commits.append((draw(st.sampled_from(MESSAGES)), parents, tag))
+
+    return commits
+
+
+def _build(path, history):
+    builder = RepoBuilder(path)
+    shas = []
+    for index, (message, parents, tag) in enumerate(history):
+        shas.append(
+            builder.commit(
+                "%s\n\nCommit %d" % (message, index),
+                parents=[shas[parent] for parent in parents],
+            )
+        )
+        if tag is not None:
+            builder.tag(tag, shas[-1])
+
+    # the head is always the last one
+    builder.repo.refs[b"refs/heads/master"] = shas[-1].encode()
+    return builder
+
+
+@settings(
+    max_examples=30,
+    deadline=None,
+    suppress_health_check=[HealthCheck.too_slow],
+)
+@given(history=histories())
+def test_engines_match_the_reference(history):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        repo_path = _build(os.path.join(tmp_dir, "repo"), history).path
+        with mock.patch.object(
+            api, "iter_children_per_first_parent", _reference_history
+        ):
+            expected = _get_outputs(repo_path)
+
+        for name, get_outputs in ENGINES.items():
+            backend = git.GIT_BACKEND if name == "git backend" else git.DULWICH_BACKEND
+            with mock.patch.dict(os.environ, {git.BACKEND_ENV_VAR: backend}):
+                outputs = get_outputs(repo_path)
+
+            assert outputs == expected[: len(outputs)], name
+    finally:
+        git._close_backends()
+        shutil.rmtree(tmp_dir)
+
+
+def _get_entries(releasenotes):
+    """Returns the entries of some release notes, as (version, entry) pairs."""
+    entries = []
+    for line in releasenotes.splitlines():
+        if line.startswith("* "):
+            entries.append((line.split(" ")[1], [line]))
+        elif line.startswith("    ") and entries:
+            entries[-1][1].append(line)
+
+    return sorted((version, "\n".join(lines)) for version, lines in entries)
+
+
+@settings(
+    max_examples=30,
+    deadline=None,
+    suppress_health_check=[HealthCheck.too_slow],
+)
+@given(history=histories())
+# a tag lower than the version calculated before it
+@example(history=[("Some fix", [], None), ("Some fix", [0], "0.0.0")])
+def test_releasenotes_sections_match_the_full_ones(history):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        repo_path = _build(os.path.join(tmp_dir, "repo"), history).path
+        entries = _get_entries(api.get_releasenotes(repo_path))
+        for version, _ in entries:
+            major, minor, _ = version.split(".")
+            for version_range in (major, "%s.%s" % (major, minor), version):
+                parts = version_range.split(".")
+                expected = [
+                    entry
+                    for entry in entries
+                    if entry[0].split(".")[: len(parts)] == parts
+                ]
+                section = api.get_releasenotes_section(repo_path, version_range)
+                assert _get_entries(section) == expected, version_range
+    finally:
+        git._close_backends()
+        shutil.rmtree(tmp_dir)
@@ -17,11 +17,14 @@
 # along with autosemver; if not, write to the
 # Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
 # MA 02111-1307, USA.
+import os
+import sys
+
 import mock
 import pytest
 import six
 
-from autosemver import git
+from autosemver import git, main, profiling
 
 
 def _get_possible_params(test_matrix):
@@ -240,3 +243,223 @@ def test_is_api_break(commit_msg, expected):
     commit.message = commit_msg
 
     assert git.is_api_break(commit) == expected
+
+
+def test_commit_cache_is_bounded(git_repo):
+    shas = [git_repo.commit("Commit %d" % num) for num in range(5)]
+    commits = git.CommitCache(git_repo.repo, max_size=3)
+
+    commits.prefetch(shas)
+    cached = [sha for sha in shas if sha in commits]
+    evicted = [sha for sha in shas if sha not in commits]
+
+    assert len(cached) == 3
+    assert commits.get(evicted[0]).message == git_repo.repo[evicted[0].encode()].message
+    assert evicted[0] in commits
+    assert sum(sha in commits for sha in shas) == 3
+
+
+@parametrize(
+    {
+        "full version": {
+            "spec": "4.12.3",
+            "expected": ((4, 12, 3), (4, 12, 3)),
+        },
+        "partial version covers all the patch versions": {
+            "spec": "v4.12",
+            "expected": ((4, 12, 0), (4, 12, sys.maxsize)),
+        },
+        "range": {
+            "spec": "4.12.1..5",
+            "expected": ((4, 12, 1), (5, sys.maxsize, sys.maxsize)),
+        },
+    }
+)
+def test_get_version_range(expected, spec):
+    assert git.get_version_range(spec) == expected
+
+
+def test_get_version_range_invalid():
+    with pytest.raises(ValueError):
+        git.get_version_range("4.x")
+
+
+@parametrize(
+    {
+        "proper name by email": {
+            "author": "jdoe <John@Example.com>",
+            "expected": "John Doe <John@Example.com>",
+        },
+        "proper email by email": {
+            "author": "John Doe <jdoe@old.com>",
+            "expected": "John Doe <john@example.com>",
+        },
+        "proper name and email by name and email": {
+            "author": "Bot <ci@example.com>",
+            "expected": "CI Robot <robot@example.com>",
+        },
+        "other name with the same email": {
+            "author": "Somebody <ci@example.com>",
+            "expected": "Somebody <ci@example.com>",
+        },
+        "not in the mailmap": {
+            "author": "Jane <jane@example.com>",
+            "expected": "Jane <jane@example.com>",
+        },
+    }
+)
+def test_canonical_author(author, expected):
+    mailmap = git.parse_mailmap(
+        "# comment\n"
+        "John Doe <john@example.com>\n"
+        "<john@example.com> <jdoe@old.com>  # old email\n"
+        "CI Robot <robot@example.com> bot <CI@example.com>\n"
+    )
+
+    assert git.canonical_author(author, mailmap) == expected
+
+
+def test_backends_agree(git_repo):
+    first = git_repo.commit("First commit")
+    side = git_repo.commit("Side commit", parents=[first], ref=None)
+    git_repo.commit("Main commit")
+    head = git_repo.commit("Merge side", parents=[git_repo.repo.head().decode(), side])
+    git_repo.tag("1.0.0", first)
+    dulwich_backend = git.get_backend(git_repo.repo, git.DULWICH_BACKEND)
+    git_backend = git.get_backend(git_repo.repo, git.GIT_BACKEND)
+
+    assert isinstance(git_backend, git.GitCliBackend)
+    assert git_backend.get_refs() == dulwich_backend.get_refs()
+    assert sorted(
+        (entry.sha, entry.parents) for entry in git_backend.iter_parents()
+    ) == sorted((entry.sha, entry.parents) for entry in dulwich_backend.iter_parents())
+    assert list(git_backend.iter_first_parents(head)) == list(
+        dulwich_backend.iter_first_parents(head)
+    )
+    assert git_backend.read_commit(side) == dulwich_backend.read_commit(side)
+    assert (
+        git_backend.read_headers(head)[b"parent"]
+        == git_repo.repo[head.encode()].parents
+    )
+    assert git_backend.read_message(side) == b"Side commit"
+
+    with pytest.raises(KeyError):
+        git_backend.read_raw("0" * 40)
+
+
+def test_get_backend(git_repo, monkeypatch):
+    git_repo.commit("First commit")
+
+    monkeypatch.setenv(git.BACKEND_ENV_VAR, git.GIT_BACKEND)
+    assert isinstance(git.get_backend(git_repo.repo), git.GitCliBackend)
+
+    with pytest.raises(ValueError):
+        git.get_backend(git_repo.repo, "hg")
+
+    git._close_backends()
+    monkeypatch.setattr(git.shutil, "which", lambda _: None)
+    assert isinstance(git.get_backend(git_repo.repo), git.DulwichBackend)
+
+
+def test_backend_cli_option_is_not_kept(git_repo, monkeypatch):
+    git_repo.commit("First commit")
+    monkeypatch.delenv(git.BACKEND_ENV_VAR, raising=False)
+
+    main([git_repo.path, "--backend", git.GIT_BACKEND, "version"])
+
+    assert git.BACKEND_ENV_VAR not in os.environ
+
+
+def test_backends_implement_the_whole_interface(git_repo):
+    git_repo.commit("First commit")
+
+    with pytest.raises(TypeError):
+        git.Backend(git_repo.repo)
+
+
+def test_iter_children_per_first_parent(git_repo):
+    first = git_repo.commit("First commit")
+    side = git_repo.commit("Side commit", parents=[first], ref=None)
+    side = git_repo.commit("Other side commit", parents=[side], ref=None)
+    git_repo.commit("Main commit")
+    git_repo.commit("Merge side", parents=[git_repo.repo.head().decode(), side])
+    unrelated = git_repo.commit("Unrelated root", parents=[], ref=None)
+    git_repo.commit("Merge unrelated", parents=[side, unrelated], ref=b"refs/heads/u")
+
+    for head in (None, git.resolve_rev(git_repo.repo, "u")):
+        expected = [
+            (sha, [child.id for child in children])
+            for sha, children in reversed(
+                git.get_children_per_first_parent(git_repo.path, head=head).items()
+            )
+        ]
+        assert [
+            (sha, [child.id for child in children])
+            for sha, children in git.iter_children_per_first_parent(
+                git_repo.path, head=head
+            )
+        ] == expected
+
+    profile = profiling.enable()
+    try:
+        merged = dict(git.iter_children_per_first_parent(git_repo.path))
+    finally:
+        profiling.disable()
+
+    assert [child.message for child in merged[git_repo.repo.head().decode()]] == [
+        b"Other side commit",
+        b"Side commit",
+    ]
+    # only the first parents are walked, the merged ones are just read
+    assert profile.counters["commits_walked"] == 3
+
+
+def test_path_filter(git_repo):
+    first = git_repo.commit("First", files={"a/b/c": "1", "a/d": "1", "e": "1"})
+    deep = git_repo.commit("Deep change", files={"a/b/c": "2"})
+    shallow = git_repo.commit("Shallow change", files={"a/d": "2"})
+    top = git_repo.commit("Top change", files={"e": "2"})
+    commits = git.CommitCache(git_repo.repo)
+
+    path_filter = git.PathFilter(commits, ["a/b", "./e"])
+    assert [
+        path_filter.touches(commits.get(sha)) for sha in (first, deep, shallow, top)
+    ] == [True, True, False, True]
+    assert git.PathFilter(commits, ["a/b/c/"]).touches(commits.get(deep))
+    assert not git.PathFilter(commits, ["a/b/c"]).touches(commits.get(shallow))
+    assert git.PathFilter(commits, [""]).touches(commits.get(top))
+
+    # the trees of the unchanged subtrees are not read
+    profile = profiling.enable()
+    try:
+        assert not git.PathFilter(commits, ["a/b/c"]).touches(commits.get(top))
+    finally:
+        profiling.disable()
+
+    assert profile.counters["trees_read"] == 2
+
+
+def test_parse_exclude_rules(git_repo):
+    rules = git.parse_exclude_rules(
+        "# bots\ncommitter ^Merge queue <\nsubject [skip version]\nversioning bump\n"
+    )
+    assert rules.bump
+    human = git_repo.commit("Fix")
+    skipped = git_repo.commit("[skip version] Fix docs")
+    robot = git_repo.commit("Fix", author="Merge queue <queue@ema.il>")
+    commits = git.CommitCache(git_repo.repo)
+    assert [rules.excludes(commits.get(sha)) for sha in (human, skipped, robot)] == [
+        False,
+        True,
+        True,
+    ]
+    # matched on the raw contents, before parsing them
+    rules = git.parse_exclude_rules("author ^Merge queue <\n")
+    assert [
+        rules.excludes_raw(sha.encode(), commits.backend.read_raw(sha))
+        for sha in (human, skipped, robot)
+    ] == [False, False, True]
+    assert not git.parse_exclude_rules("\n# nothing\n")
+
+    with pytest.raises(ValueError):
+        git.parse_exclude_rules("branch master\n")
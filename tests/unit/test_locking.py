@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+import os
+import stat
+import threading
+import time
+
+from autosemver import locking
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / "some" / "file")
+
+    locking.atomic_write(path, "Sömething")
+    assert open(path, encoding="utf-8").read() == "Sömething"
+    assert stat.S_IMODE(os.stat(path).st_mode) == locking.DEFAULT_FILE_MODE
+
+    os.chmod(path, 0o600)
+    locking.atomic_write(path, b"Something else")
+    assert open(path).read() == "Something else"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert os.listdir(str(tmp_path / "some")) == ["file"]
+
+
+def test_file_lock_is_exclusive(tmp_path):
+    path = str(tmp_path / "counter")
+    locking.atomic_write(path, "0")
+
+    def increment():
+        with locking.file_lock(path):
+            value = int(open(path).read())
+            time.sleep(0.01)
+            locking.atomic_write(path, str(value + 1))
+
+    threads = [threading.Thread(target=increment) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert open(path).read() == "5"
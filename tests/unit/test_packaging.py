@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+import os
+
+import pytest
+
+from autosemver import api, git, packaging, profiling
+
+
+@pytest.fixture(autouse=True)
+def reset_version_cache():
+    packaging.reset_version_cache()
+    yield
+    packaging.reset_version_cache()
+
+
+def test_version_from_pkg_info(tmp_path):
+    (tmp_path / "PKG-INFO").write_text(
+        "Metadata-Version: 2.1\nName: dummy\nVersion: 1.2.3\n\nVersion: 4.5.6\n"
+    )
+
+    assert packaging.get_current_version(project_dir=str(tmp_path)) == "1.2.3"
+
+
+def test_version_from_version_module(tmp_path):
+    (tmp_path / "dummy_pkg").mkdir()
+    (tmp_path / "dummy_pkg" / "_version.py").write_text('__version__ = "1.2.3"\n')
+    (tmp_path / "VERSION").write_text("4.5.6\n")
+
+    assert (
+        packaging.get_current_version(
+            project_name="dummy-pkg", project_dir=str(tmp_path)
+        )
+        == "1.2.3"
+    )
+    assert packaging.get_current_version(project_dir=str(tmp_path)) == "4.5.6"
+
+
+def test_version_is_memoized(git_repo):
+    git_repo.commit("Some commit")
+    assert packaging.get_current_version(project_dir=git_repo.path) == "0.0.1"
+
+    git_repo.commit("Some other commit")
+    assert packaging.get_current_version(project_dir=git_repo.path) == "0.0.1"
+
+    packaging.reset_version_cache()
+    assert packaging.get_current_version(project_dir=git_repo.path) == "0.0.2"
+
+
+def test_env_var_is_not_memoized(git_repo, monkeypatch):
+    git_repo.commit("Some commit")
+    assert (
+        packaging.get_current_version(project_name="dummy", project_dir=git_repo.path)
+        == "0.0.1"
+    )
+
+    monkeypatch.setenv("DUMMY_VERSION", "1.2.3")
+    assert (
+        packaging.get_current_version(project_name="dummy", project_dir=git_repo.path)
+        == "1.2.3"
+    )
+
+
+def test_create_version_module(git_repo):
+    sha = git_repo.commit("Some commit")
+    git_repo.checkout()
+    version_module = os.path.join(git_repo.path, "_version.py")
+
+    packaging.create_version_module(version_module, project_dir=git_repo.path)
+
+    with open(version_module) as version_fd:
+        contents = version_fd.read()
+    assert '__version__ = "0.0.1"' in contents
+    assert '__git_sha__ = "%s"' % sha in contents
+    # the module is not committed, but untracked files don't count
+    assert "__git_dirty__ = False" in contents
+
+
+def test_stale_version_module_is_ignored(git_repo):
+    git_repo.commit("Some commit")
+    version_module = os.path.join(git_repo.path, "_version.py")
+    packaging.create_version_module(version_module, project_dir=git_repo.path)
+    packaging.reset_version_cache()
+
+    git_repo.commit("Some other commit")
+
+    assert packaging.get_current_version(project_dir=git_repo.path) == "0.0.2"
+
+
+def test_create_changelog_in_project_dir(git_repo, tmp_path, monkeypatch):
+    git_repo.commit("Some commit")
+    monkeypatch.chdir(str(tmp_path))
+
+    packaging.create_changelog(project_dir=git_repo.path)
+    packaging.create_releasenotes(project_dir=git_repo.path)
+
+    assert not os.path.exists(str(tmp_path / "CHANGELOG"))
+    with open(os.path.join(git_repo.path, "CHANGELOG")) as changelog_fd:
+        assert changelog_fd.read().startswith("* 0.0.1")
+    assert os.path.exists(os.path.join(git_repo.path, "RELEASE_NOTES"))
+
+
+def test_create_changelog_incremental(git_repo):
+    first = git_repo.commit("Some commit")
+    side = git_repo.commit("Side commit", parents=[first], ref=None)
+    git_repo.commit("Some feature\n\nSem-Ver: feature")
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+
+    last = git_repo.commit("Some fix (closes #1)")
+    side = git_repo.commit("Side fix", parents=[side], ref=None)
+    git_repo.commit("Merge side", parents=[last, side])
+    profiling.enable()
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+    profile = profiling.disable()
+
+    assert "get_children_per_first_parent_since" in profile.timings
+    assert "get_first_parents" not in profile.timings
+    with open(os.path.join(git_repo.path, "CHANGELOG")) as changelog_fd:
+        assert changelog_fd.read() == api.get_changelog(git_repo.path)
+
+
+def test_create_changelog_incremental_rewritten_history(git_repo):
+    first = git_repo.commit("Some commit")
+    git_repo.commit("Some other commit")
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+
+    git_repo.commit("Rewritten commit", parents=[first])
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+
+    with open(os.path.join(git_repo.path, "CHANGELOG")) as changelog_fd:
+        changelog = changelog_fd.read()
+    assert changelog == api.get_changelog(git_repo.path)
+    assert "Some other commit" not in changelog
+
+
+def test_create_changelog_incremental_new_exclude_rules(git_repo):
+    git_repo.commit("Some commit")
+    git_repo.commit("Some other commit")
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+
+    with open(os.path.join(git_repo.path, git.EXCLUDE_FILE), "w") as exclude_fd:
+        exclude_fd.write("subject Some other\n")
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+
+    with open(os.path.join(git_repo.path, "CHANGELOG")) as changelog_fd:
+        changelog = changelog_fd.read()
+    assert changelog == api.get_changelog(git_repo.path)
+    assert "Some other commit" not in changelog
+
+
+def test_create_changelog_incremental_excluded_head(git_repo):
+    with open(os.path.join(git_repo.path, git.EXCLUDE_FILE), "w") as exclude_fd:
+        exclude_fd.write("subject Excluded\nversioning bump\n")
+    git_repo.commit("Some commit")
+    # bumps the version without an entry of its own
+    git_repo.commit("Excluded commit")
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+
+    git_repo.commit("New commit")
+    packaging.create_changelog(project_dir=git_repo.path, incremental=True)
+
+    with open(os.path.join(git_repo.path, "CHANGELOG")) as changelog_fd:
+        changelog = changelog_fd.read()
+    assert changelog == api.get_changelog(git_repo.path)
+    assert changelog.startswith('* 0.0.3 "')
+    assert "Excluded commit" not in changelog
+
+
+def test_shallow_clone_without_anchor_fails(git_repo):
+    git_repo.commit("Initial commit")
+    shallow = git_repo.commit("Some commit")
+    git_repo.commit("Some other commit")
+    git_repo.make_shallow(shallow)
+
+    # not the version of the installed distribution
+    with pytest.raises(git.ShallowHistoryError):
+        packaging.get_current_version(project_name="mock", project_dir=git_repo.path)
+
+
+def test_version_from_version_module_of_another_package(tmp_path):
+    (tmp_path / "dummy").mkdir()
+    (tmp_path / "dummy" / "_version.py").write_text('__version__ = "1.2.3"\n')
+    (tmp_path / "VERSION").write_text("4.5.6\n")
+
+    assert (
+        packaging.get_current_version(
+            project_name="python-dummy", project_dir=str(tmp_path), package="dummy"
+        )
+        == "1.2.3"
+    )
+
+
+def test_version_from_installed_module(tmp_path, monkeypatch):
+    package_dir = tmp_path / "site-packages" / "dummy_installed"
+    package_dir.mkdir(parents=True)
+    (package_dir / "__init__.py").write_text("")
+    (package_dir / "_version.py").write_text(
+        packaging.VERSION_MODULE_TEMPLATE
+        % {"version": "1.2.3", "git_sha": "1234", "git_dirty": False}
+    )
+    monkeypatch.syspath_prepend(str(tmp_path / "site-packages"))
+
+    assert (
+        packaging.get_current_version(
+            project_name="dummy-installed", project_dir=str(tmp_path)
+        )
+        == "1.2.3"
+    )
+    assert (
+        packaging.get_current_version(
+            project_name="python-dummy",
+            project_dir=str(tmp_path),
+            package="dummy_installed",
+        )
+        == "1.2.3"
+    )
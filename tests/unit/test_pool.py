@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+import shutil
+import threading
+
+from conftest import RepoBuilder
+
+from autosemver import api, pool, profiling
+
+
+def _make_history(git_repo):
+    git_repo.commit("Initial commit")
+    git_repo.commit("Some feature\n\nSem-Ver: feature")
+    git_repo.commit("Some fix")
+
+
+def test_api_calls_reuse_the_handles(git_repo):
+    _make_history(git_repo)
+    pool.REPO_POOL.clear()
+
+    profile = profiling.enable()
+    try:
+        expected = api.get_changelog(git_repo.path)
+        assert profile.counters["repo_pool_misses"] == 1
+        assert api.get_changelog(git_repo.path) == expected
+        assert profile.counters["repo_pool_misses"] == 1
+        assert profile.counters["repo_pool_hits"] == 1
+    finally:
+        profiling.disable()
+
+    with pool.REPO_POOL.handle(git_repo.path) as handle:
+        assert api.get_changelog(handle) == expected
+        assert api.get_current_version(repo_path=handle) == "0.1.1"
+
+    # a new repo in the same path is not taken for the old one
+    shutil.rmtree(git_repo.path)
+    git_repo = RepoBuilder(git_repo.path)
+    git_repo.commit("Other initial commit")
+    assert api.get_current_version(git_repo.path) == "0.0.1"
+
+
+def test_pool_is_bounded(tmp_path):
+    repo_pool = pool.RepoPool(max_idle=2)
+    handles = []
+    for name in ("a", "b", "c"):
+        RepoBuilder(str(tmp_path / name)).commit("Initial commit")
+        handles.append(repo_pool.acquire(str(tmp_path / name)))
+
+    for handle in handles:
+        repo_pool.release(handle)
+
+    assert len(repo_pool) == 2
+    assert repo_pool.acquire(str(tmp_path / "a")) is not handles[0]
+    assert repo_pool.acquire(str(tmp_path / "c")) is handles[2]
+    repo_pool.clear()
+    assert len(repo_pool) == 0
+
+
+def test_pool_is_thread_safe(git_repo):
+    _make_history(git_repo)
+    expected = api.get_changelog(git_repo.path)
+    results = []
+
+    def get_changelogs():
+        for _ in range(5):
+            results.append(api.get_changelog(git_repo.path))
+
+    threads = [threading.Thread(target=get_changelogs) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert results == [expected] * 40
+    assert len(pool.REPO_POOL) <= pool.REPO_POOL_SIZE
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of autosemver.
+# Copyright (C) 2016 David Caro.
+#
+# autosemver is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# autosemver is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with autosemver; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+import json
+import time
+
+import pytest
+
+from autosemver import api, main, profiling
+
+
+def test_disabled_profiling_gathers_nothing(git_repo):
+    git_repo.commit("Some commit")
+
+    api.get_current_version(git_repo.path)
+
+    assert profiling.get_profile() is None
+    assert profiling.disable() is None
+
+
+def test_profiling_gathers_spans_and_counters(git_repo):
+    git_repo.commit("Some commit")
+    git_repo.commit("Some other commit")
+
+    profiling.enable()
+    try:
+        api.get_changelog(git_repo.path)
+    finally:
+        profile = profiling.disable()
+
+    result = profile.to_dict()
+    assert set(result["spans"]) >= {
+        "first_parents",
+        "classification",
+        "versioning",
+        "rendering",
+    }
+    assert result["counters"]["commits_walked"] == 2
+
+
+def test_profile_cli_flag(git_repo, capsys):
+    git_repo.commit("Some commit")
+
+    main([git_repo.path, "--profile", "--profile-format", "json", "version"])
+
+    out, err = capsys.readouterr()
+    assert out == "0.0.1\n"
+    assert "total" in json.loads(err)["spans"]
+
+
+def test_profile_cli_flag_on_errors(git_repo):
+    git_repo.commit("Some commit")
+
+    with pytest.raises(Exception):
+        main([git_repo.path, "--profile", "version-of", "unknown-rev"])
+
+    assert profiling.get_profile() is None
+
+
+def test_nested_spans_self_time():
+    profile = profiling.enable()
+    try:
+        with profiling.span("outer"):
+            with profiling.span("inner"):
+                time.sleep(0.01)
+    finally:
+        profiling.disable()
+
+    assert profile.self_timings["inner"] == profile.timings["inner"]
+    assert profile.self_timings["outer"] < profile.timings["inner"]
+    assert profile.to_dict()["spans"]["outer"]["self_seconds"] < 0.01